@@ -6,10 +6,12 @@ import os.path
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 from scipy.cluster.hierarchy import dendrogram, linkage
+from scipy.spatial.distance import squareform
 from sklearn_extra.cluster import KMedoids
+from model_selection import sweep
+from preprocessing import preprocess
 
 # Carregar os dados
 # Verifica se existe o arquivo local
@@ -18,14 +20,10 @@ if not os.path.isfile(url):
   # Caso contrário vai buscar no github publico
   url = 'https://raw.githubusercontent.com/edermartins/ia-lab/refs/heads/main/clustering/data/Country-data.csv'
 
-# Cria o dataset
-df = pd.read_csv(url)
-# Cópia do dataset sem a variável texto 'country'
-X_vars = df.drop(["country"],axis=1).copy()
-
-# Normalização dos dados para a clusterização
-scaler = StandardScaler()
-df_scaled = scaler.fit_transform(X_vars)
+# Cria o dataset, a cópia sem a variável texto 'country', a normalização dos dados para a clusterização e a matriz de
+# distâncias entre os países normalizados. Os dois últimos ficam em data/cache pelo hash do CSV e todos os métodos
+# abaixo usam os mesmos (preprocessing.py)
+df, X_vars, df_scaled, distances = preprocess(url, drop=["country"])
 
 # Mostra as primeiras linhas do dataset original
 print(df.head())
@@ -48,33 +46,20 @@ df.info()
 X_vars.hist(bins=15, figsize=(15, 10))
 plt.show()
 
-# Aplicando o Método do cotovelo (Elbow Method) > K-Média
-elbow_graph=[]
-for i in range(1,11):
-    kmeans_result=KMeans(n_clusters=i, init='k-means++', random_state= 42)
-    kmeans_result.fit(X_vars)
-    elbow_graph.append(kmeans_result.inertia_)
-plt.plot(range(1, 11), elbow_graph)
-plt.title('Método do cotovelo (Elbow Method) > K-Means')
-plt.xlabel('Número de Clusters')
-plt.ylabel('Soma dos quadrados intra-clusters')
-plt.xticks(range(1, 11))
-plt.grid()
-plt.show()
-
-# Aplicando o Método do cotovelo (Elbow Method) > K-Medoide
-elbow_graph=[]
-for i in range(1,11):
-    kMedoids_result=KMedoids(n_clusters=i, init='k-medoids++', random_state= 42)
-    kMedoids_result.fit_predict(X_vars)
-    elbow_graph.append(kMedoids_result.inertia_)
-plt.plot(range(1, 11), elbow_graph)
-plt.title('Método do cotovelo (Elbow Method) > K-Medoides')
-plt.xlabel('Número de Clusters')
-plt.ylabel('Soma dos quadrados intra-clusters')
-plt.xticks(range(1, 11))
-plt.grid()
-plt.show()
+# Método do cotovelo (Elbow Method) e índices de validação de K-Means e K-Medoides para k de 1 a 10, com uma única
+# matriz de distâncias (model_selection.py)
+selection = sweep(df_scaled, ks=range(1, 11), random_state=42, distances=distances)
+print(selection.to_string(index=False))
+for method, title, ylabel in (('kmeans', 'K-Means', 'Soma dos quadrados intra-clusters'),
+                              ('kmedoids', 'K-Medoides', 'Soma das distâncias aos medoides')):
+    elbow_graph = selection[selection['method'] == method]
+    plt.plot(elbow_graph['k'], elbow_graph['inertia'])
+    plt.title('Método do cotovelo (Elbow Method) > ' + title)
+    plt.xlabel('Número de Clusters')
+    plt.ylabel(ylabel)
+    plt.xticks(range(1, 11))
+    plt.grid()
+    plt.show()
 
 # K-Médias
 kmeans_result = KMeans(n_clusters=3, random_state=42)
@@ -92,8 +77,9 @@ cluster_means = X_vars_kmeans.groupby('Cluster_KMeans').mean()
 print("Distribuição das dimensões em cada grupo (K-Médias):")
 print(cluster_means)
 
-# Clusterização Hierárquica através da função scipy.cluster.hierarchy.linkage do SciPy
-linked = linkage(df_scaled, method='ward')
+# Clusterização Hierárquica através da função scipy.cluster.hierarchy.linkage do SciPy, com a matriz de distâncias
+# condensada (o ward com distâncias euclidianas dá o mesmo resultado que com os dados)
+linked = linkage(squareform(distances, checks=False), method='ward')
 
 # Analisando a distribuição das dimensões em cada grupo (K-Médias)
 cluster_means = X_vars_kmeans.groupby('Cluster_KMeans').mean()
@@ -124,8 +110,10 @@ plt.ylabel('Distância Euclidiana', fontsize=30)
 plt.show()
 
 # Medóide
-kmedoids_result = KMedoids(n_clusters=3, random_state=42)
-y_vars_m = kmedoids_result.fit_predict(df_scaled)
+kmedoids_result = KMedoids(n_clusters=3, metric='precomputed', random_state=42)
+y_vars_m = kmedoids_result.fit_predict(distances)
+# Com a matriz de distâncias o KMedoids não guarda cluster_centers_, os medoides são as linhas de medoid_indices_
+medoids = df_scaled[kmedoids_result.medoid_indices_]
 X_vars['Cluster_Medoid'] = kmedoids_result.labels_
 
 # Analisando a distribuição dos clusters (K-Medoides)
@@ -156,7 +144,7 @@ X = df_scaled
 plt.scatter(X[y_vars_m == 0, 0], X[y_vars_m == 0, 4], s = 100, c = 'green', label = 'Cluster 1')
 plt.scatter(X[y_vars_m == 1, 0], X[y_vars_m == 1, 4], s = 100, c = 'red', label = 'Cluster 2')
 plt.scatter(X[y_vars_m == 2, 0], X[y_vars_m == 2, 4], s = 100, c = 'blue', label = 'Cluster 3')
-plt.scatter(kmedoids_result.cluster_centers_[:, 0], kmedoids_result.cluster_centers_[:, 2], s = 300, c = 'black', label = 'Medoide') # modificado
+plt.scatter(medoids[:, 0], medoids[:, 2], s = 300, c = 'black', label = 'Medoide') # modificado
 plt.rcParams.update({'font.size': 12})
 plt.title('K-Medoide - Clusters (base normalizada)')
 plt.xlabel('Motalidade infantil')
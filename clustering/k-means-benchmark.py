@@ -0,0 +1,120 @@
+# Benchmark da atribuição do K-Means (kmeans.py): distâncias com broadcast contra a norma expandida em blocos
+# Uso: python k-means-benchmark.py -r "[167,10000,100000,1000000,5000000]" -k 3
+# Lloyd contra Hamerly: python k-means-benchmark.py -r "[100000]" -ks "[3,8,16,32,64,128,256]"
+
+import argparse
+import os
+import time
+import tracemalloc
+from ast import literal_eval
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from kmeans import assign_labels, hamerly, kmeans, kmeans_plusplus, lloyd
+
+
+def country_data():
+    # Dataset original normalizado, como em k-means.py
+    df = pd.read_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'Country-data.csv'))
+    return StandardScaler().fit_transform(df.drop(["country"], axis=1))
+
+
+def synthetic_data(base, rows, seed=0):
+    # Países sorteados com ruído: mesma distribuição das features, com qualquer número de linhas
+    rng = np.random.default_rng(seed)
+    return base[rng.integers(0, len(base), size=rows)] + rng.normal(0, 0.1, size=(rows, base.shape[1]))
+
+
+def broadcast_labels(X, centroids):
+    # Atribuição original: temporário n_samples x k x n_features e raiz quadrada
+    distances = np.sqrt(((X[:, np.newaxis, :] - centroids) ** 2).sum(axis=2))
+    return np.argmin(distances, axis=1)
+
+
+def compare_algorithms(X, k, seed=0):
+    # Lloyd e Hamerly a partir dos mesmos centroides k-means++: iterações, distâncias calculadas e tempo
+    x_squared_norms = np.einsum('ij,ij->i', X, X)
+    initial = kmeans_plusplus(X, k, np.random.default_rng(seed), x_squared_norms=x_squared_norms)
+    row = {'rows': len(X), 'k': k}
+    results = {}
+    for name, algorithm in (('lloyd', lloyd), ('hamerly', hamerly)):
+        stats = {}
+        start = time.perf_counter()
+        results[name] = algorithm(X, initial.copy(), x_squared_norms=x_squared_norms, stats=stats)
+        row[name + '_seconds'] = time.perf_counter() - start
+        row[name + '_evaluations'] = stats['distance_evaluations']
+    row['iterations'] = results['lloyd'][3]
+    row['evaluations_saved'] = 1 - row['hamerly_evaluations'] / row['lloyd_evaluations']
+    row['speedup'] = row['lloyd_seconds'] / row['hamerly_seconds']
+    row['same_labels'] = bool(np.array_equal(results['lloyd'][1], results['hamerly'][1]))
+    return row
+
+
+def measure(function, *args, repeats=3, **kwargs):
+    # Mediana do tempo e pico de memória alocada pelo NumPy (o tracemalloc vê as alocações dos arrays)
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, float(np.median(seconds)), peak / 1024 / 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark da atribuição do K-Means')
+    parser.add_argument('-r', '--rows', type=str, default='[167,10000,100000,1000000,5000000]',
+                        help='Lista de números de linhas, 167 é o Country-data original. Padrão: "[167,10000,100000,1000000,5000000]"')
+    parser.add_argument('-k', '--clusters', type=int, default=3, help='Número de clusters. Padrão: 3')
+    parser.add_argument('-c', '--chunk_size', type=int, default=4096, help='Linhas de cada bloco. Padrão: 4096')
+    parser.add_argument('-mb', '--max_broadcast_rows', type=int, default=1000000,
+                        help='Maior número de linhas medido com broadcast, acima dele o temporário não cabe na memória. Padrão: 1000000')
+    parser.add_argument('-f', '--fit', action='store_true', help='Mede também o kmeans completo (segundos e iterações até convergir)')
+    parser.add_argument('-ni', '--n_init', type=int, default=1, help='Só com --fit, reinicializações k-means++. Padrão: 1')
+    parser.add_argument('-j', '--n_jobs', type=int, default=0, help='Só com --fit, processos das reinicializações. Padrão: 0 (número de CPUs)')
+    parser.add_argument('-ks', '--k_sweep', type=str, default='',
+                        help='Lista de k para comparar Lloyd e Hamerly (entre aspas e sem espaços), em vez da atribuição. Ex.: "[3,8,16,32,64,128,256]"')
+    parser.add_argument('-rp', '--repeats', type=int, default=3, help='Execuções de cada medida, a mediana é mostrada. Padrão: 3')
+    parser.add_argument('-o', '--output', type=str, default='', help='Arquivo CSV com os resultados. Padrão: não salva')
+    args = parser.parse_args()
+
+    base = country_data()
+    results = []
+    for rows in literal_eval(args.rows):
+        X = base if rows == len(base) else synthetic_data(base, rows)
+        if args.k_sweep:
+            for k in literal_eval(args.k_sweep):
+                if k < rows:
+                    results.append(compare_algorithms(X, k))
+                    print(pd.DataFrame(results[-1:]).to_string(index=False, header=len(results) == 1), flush=True)
+            continue
+        centroids = X[np.random.default_rng(0).choice(len(X), args.clusters, replace=False)]
+        x_squared_norms = np.einsum('ij,ij->i', X, X)
+
+        (labels, _), seconds, memory = measure(assign_labels, X, centroids,
+                                               x_squared_norms=x_squared_norms, chunk_size=args.chunk_size,
+                                               repeats=args.repeats)
+        row = {'rows': rows, 'k': args.clusters, 'chunked_seconds': seconds, 'chunked_peak_mb': memory,
+               'broadcast_seconds': None, 'broadcast_peak_mb': None, 'speedup': None, 'same_labels': None}
+        if rows <= args.max_broadcast_rows:
+            expected, seconds, memory = measure(broadcast_labels, X, centroids, repeats=args.repeats)
+            row.update(broadcast_seconds=seconds, broadcast_peak_mb=memory,
+                       speedup=seconds / row['chunked_seconds'], same_labels=float(np.mean(labels == expected)))
+        if args.fit:
+            start = time.perf_counter()
+            _, _, inertia, n_iter = kmeans(X, args.clusters, chunk_size=args.chunk_size, n_init=args.n_init,
+                                           n_jobs=args.n_jobs or None, return_inertia=True, return_n_iter=True)
+            row.update(fit_seconds=time.perf_counter() - start, fit_iterations=n_iter, fit_inertia=inertia)
+        results.append(row)
+        print(pd.DataFrame([row]).to_string(index=False, header=len(results) == 1), flush=True)
+
+    table = pd.DataFrame(results)
+    print()
+    print(table.to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
@@ -0,0 +1,49 @@
+# K-Means em uma passada por um CSV ou Parquet maior que a memória (StreamingKMeans de kmeans.py)
+# Uso: python k-means-streaming.py -d data/Country-data.csv -k 3 -c 50 -o labels.csv -id country
+
+import argparse
+from ast import literal_eval
+
+import pandas as pd
+
+from kmeans import StreamingKMeans, read_chunks, read_column_chunks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='K-Means mini-batch em blocos de um CSV ou Parquet')
+    parser.add_argument('-d', '--dataset_path', type=str, default='data/Country-data.csv',
+                        help="CSV ou Parquet (.parquet). Padrão: 'data/Country-data.csv'")
+    parser.add_argument('-k', '--clusters', type=int, default=3, help='Número de clusters. Padrão: 3')
+    parser.add_argument('-c', '--chunksize', type=int, default=100000, help='Linhas de cada bloco. Padrão: 100000')
+    parser.add_argument('-cl', '--columns', type=str, default='None',
+                        help='Lista das colunas usadas (entre aspas e sem espaços). Padrão: todas as colunas numéricas')
+    parser.add_argument('-ns', '--no_scale', action='store_true', help='Não padroniza as features')
+    parser.add_argument('-rs', '--random_state', type=int, default=0, help='Semente da inicialização. Padrão: 0')
+    parser.add_argument('-o', '--output', type=str, default='',
+                        help='CSV com o cluster de cada linha, escrito em uma segunda passada. Padrão: não salva')
+    parser.add_argument('-id', '--id_column', type=str, default='',
+                        help="Só com --output, coluna copiada junto com o cluster (ex.: 'country'). Padrão: nenhuma")
+    args = parser.parse_args()
+    columns = literal_eval(args.columns)
+
+    model = StreamingKMeans(args.clusters, scale=not args.no_scale, random_state=args.random_state)
+    model.fit(read_chunks(args.dataset_path, chunksize=args.chunksize, columns=columns))
+
+    if columns is None and not args.dataset_path.endswith(('.parquet', '.pq')):
+        columns = list(pd.read_csv(args.dataset_path, nrows=1000).select_dtypes('number').columns)
+    print('Amostras:', model.n_samples_seen)
+    print('Centroides (unidades originais):')
+    print(pd.DataFrame(model.centroids, columns=columns).assign(amostras=model.counts).to_string())
+
+    if args.output:
+        # Segunda passada: o cluster de cada linha com os centroides finais
+        # A coluna é lida com o mesmo leitor das features (CSV ou Parquet), nos mesmos blocos
+        ids = read_column_chunks(args.dataset_path, args.id_column, chunksize=args.chunksize) \
+            if args.id_column else None
+        first = True
+        for X in read_chunks(args.dataset_path, chunksize=args.chunksize, columns=columns):
+            chunk = pd.DataFrame({'cluster': model.predict(X)})
+            if ids is not None:
+                chunk.insert(0, args.id_column, next(ids))
+            chunk.to_csv(args.output, mode='w' if first else 'a', header=first, index=False)
+            first = False
+        print('Clusters salvos em', args.output)
@@ -0,0 +1,616 @@
+"""
+K-Means feito na mão para a aula de Clustering, usado por k-means.py e pelos benchmarks
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Matriz X compartilhada com os processos das reinicializações (veja init_worker)
+shared_X = None
+shared_block = None
+
+
+def assign_labels(X, centroids, x_squared_norms=None, chunk_size=4096):
+    """
+    Atribui cada amostra ao centroide mais próximo, em blocos de linhas
+
+    A distância quadrada é expandida em ||x||² - 2x·c + ||c||², então o termo x·c de um bloco é uma única
+    multiplicação de matrizes (BLAS) e a memória temporária é só chunk_size x k, para qualquer número de amostras.
+    Não é preciso a raiz quadrada: o menor quadrado é também a menor distância
+
+    Args:
+        X: Matriz de dados com as amostras nas linhas e features nas colunas
+        centroids: Matriz com os centroides nas linhas
+        x_squared_norms: ||x||² de cada amostra, calculado uma vez fora das iterações. Padrão: calculado aqui
+        chunk_size: Número de linhas de cada bloco
+
+    Returns:
+        labels: Vetor com o cluster mais próximo de cada amostra
+        distances: Vetor com a distância quadrada de cada amostra ao seu centroide
+    """
+    if x_squared_norms is None:
+        x_squared_norms = np.einsum('ij,ij->i', X, X)
+    centroid_squared_norms = np.einsum('ij,ij->i', centroids, centroids)
+
+    n_samples = X.shape[0]
+    labels = np.empty(n_samples, dtype=np.intp)
+    distances = np.empty(n_samples, dtype=X.dtype)
+    for start in range(0, n_samples, chunk_size):
+        stop = min(start + chunk_size, n_samples)
+        # ||c||² - 2x·c, o termo ||x||² não muda o argmin e só é somado à distância escolhida
+        block = X[start:stop] @ centroids.T
+        block *= -2
+        block += centroid_squared_norms
+        labels[start:stop] = np.argmin(block, axis=1)
+        distances[start:stop] = block[np.arange(stop - start), labels[start:stop]] + x_squared_norms[start:stop]
+    # Os arredondamentos podem deixar distâncias quase nulas negativas
+    np.maximum(distances, 0, out=distances)
+    return labels, distances
+
+
+def update_centroids(X, labels, k, distances):
+    """
+    Calcula os novos centroides em uma passada pelos dados: somas ponderadas com np.bincount (uma por feature)
+    divididas pelo número de amostras de cada cluster
+
+    Um cluster vazio recebe a amostra mais distante do seu centroide (cada cluster vazio uma amostra diferente),
+    em vez do NaN da média de um conjunto vazio
+
+    Args:
+        X: Matriz de dados com as amostras nas linhas e features nas colunas
+        labels: Vetor com o cluster de cada amostra
+        k: Número de clusters
+        distances: Distância quadrada de cada amostra ao seu centroide (veja assign_labels)
+
+    Returns:
+        centroids: Matriz com os novos centroides
+        empty: Número de clusters que estavam vazios
+    """
+    counts = np.bincount(labels, minlength=k)
+    sums = np.column_stack([np.bincount(labels, weights=X[:, j], minlength=k) for j in range(X.shape[1])])
+    centroids = sums / np.maximum(counts, 1)[:, np.newaxis]
+
+    empty = np.flatnonzero(counts == 0)
+    if len(empty):
+        farthest = np.argsort(distances)[::-1][:len(empty)]
+        centroids[empty] = X[farthest]
+    return centroids, len(empty)
+
+
+def kmeans_plusplus(X, k, rng, x_squared_norms=None, n_local_trials=None, chunk_size=4096):
+    """
+    Inicialização k-means++: o primeiro centroide é uma amostra sorteada e cada próximo é sorteado com probabilidade
+    proporcional à distância quadrada até o centroide mais próximo. Como no scikit-learn, são sorteados
+    n_local_trials candidatos e fica o que mais reduz a soma das distâncias
+
+    Args:
+        X: Matriz de dados com as amostras nas linhas e features nas colunas
+        k: Número de clusters
+        rng: np.random.Generator
+        x_squared_norms: ||x||² de cada amostra. Padrão: calculado aqui
+        n_local_trials: Candidatos de cada centroide. Padrão: 2 + log(k)
+        chunk_size: Número de linhas de cada bloco das distâncias
+
+    Returns:
+        centroids: Matriz com os k centroides iniciais
+    """
+    n_samples = X.shape[0]
+    if x_squared_norms is None:
+        x_squared_norms = np.einsum('ij,ij->i', X, X)
+    if n_local_trials is None:
+        n_local_trials = 2 + int(np.log(k))
+
+    centroids = np.empty((k, X.shape[1]), dtype=X.dtype)
+    centroids[0] = X[rng.integers(n_samples)]
+    _, closest = assign_labels(X, centroids[:1], x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+    for c in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            candidates = np.searchsorted(np.cumsum(closest), rng.random(n_local_trials) * total)
+            candidates = np.minimum(candidates, n_samples - 1)
+        else:
+            # Todas as amostras já coincidem com algum centroide
+            candidates = rng.integers(n_samples, size=n_local_trials)
+
+        # Soma das distâncias ao centroide mais próximo com cada candidato, em blocos de linhas
+        candidate_norms = x_squared_norms[candidates]
+        potentials = np.zeros(len(candidates))
+        for start in range(0, n_samples, chunk_size):
+            stop = min(start + chunk_size, n_samples)
+            block = X[start:stop] @ X[candidates].T
+            block *= -2
+            block += candidate_norms
+            block += x_squared_norms[start:stop, np.newaxis]
+            np.maximum(block, 0, out=block)
+            potentials += np.minimum(block, closest[start:stop, np.newaxis]).sum(axis=0)
+
+        best = candidates[np.argmin(potentials)]
+        centroids[c] = X[best]
+        _, distances = assign_labels(X, centroids[c:c + 1], x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+        np.minimum(closest, distances, out=closest)
+    return centroids
+
+
+def initial_centroids(X, k, rng, init='k-means++', x_squared_norms=None, chunk_size=4096):
+    """
+    Args:
+        init: 'k-means++', 'random' (k amostras sorteadas) ou a matriz com os centroides iniciais
+    """
+    if isinstance(init, str) and init == 'k-means++':
+        return kmeans_plusplus(X, k, rng, x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+    if isinstance(init, str) and init == 'random':
+        return X[rng.choice(X.shape[0], k, replace=False)]
+    if isinstance(init, str):
+        raise ValueError("init deve ser 'k-means++', 'random' ou uma matriz de centroides, recebido '%s'" % init)
+    return np.array(init, dtype=X.dtype)
+
+
+def lloyd(X, centroids, max_iter=300, tol=1e-4, x_squared_norms=None, chunk_size=4096, stats=None):
+    """
+    Iterações do K-Means (algoritmo de Lloyd) a partir dos centroides iniciais
+
+    Para quando nenhuma amostra muda de cluster ou quando o deslocamento dos centroides (soma dos quadrados) fica
+    abaixo de tol vezes a variância média das features, como no scikit-learn
+
+    Args:
+        stats: Dicionário que recebe o número de distâncias calculadas em 'distance_evaluations'
+
+    Returns:
+        centroids: Matriz com os centroides finais
+        labels: Vetor com as labels dos clusters para cada amostra
+        inertia: Soma das distâncias quadradas das amostras aos seus centroides
+        n_iter: Número de iterações
+    """
+    if x_squared_norms is None:
+        x_squared_norms = np.einsum('ij,ij->i', X, X)
+    k = len(centroids)
+    tol = tol * np.mean(np.var(X, axis=0))
+    if stats is not None:
+        stats['distance_evaluations'] = 0
+
+    # Com max_iter = 0 as labels e a inércia são as dos centroides iniciais
+    labels = None
+    n_iter = 0
+    updated = True
+    for n_iter in range(1, max_iter + 1):
+        # Atribui cada amostra ao cluster mais próximo
+        previous_labels = labels
+        labels, distances = assign_labels(X, centroids, x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+        updated = False
+        if stats is not None:
+            stats['distance_evaluations'] += X.shape[0] * k
+        if previous_labels is not None and np.array_equal(labels, previous_labels):
+            # Mesmas labels, os centroides também não mudam
+            break
+
+        # Calcula os novos centroides
+        new_centroids, empty = update_centroids(X, labels, k, distances)
+        shift = ((new_centroids - centroids) ** 2).sum()
+        centroids = new_centroids
+        updated = True
+        if shift <= tol and not empty:
+            break
+
+    if updated:
+        # Parou pela tolerância ou por max_iter depois de mover os centroides: as labels e a inércia finais são as dos
+        # centroides finais
+        labels, distances = assign_labels(X, centroids, x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+        if stats is not None:
+            stats['distance_evaluations'] += X.shape[0] * k
+
+    return centroids, labels, float(distances.sum()), n_iter
+
+
+def assign_two_nearest(X, centroids, x_squared_norms, chunk_size=4096):
+    """
+    Como assign_labels, com também a distância quadrada ao segundo centroide mais próximo (infinita com k = 1)
+    """
+    centroid_squared_norms = np.einsum('ij,ij->i', centroids, centroids)
+    n_samples = X.shape[0]
+    labels = np.empty(n_samples, dtype=np.intp)
+    nearest = np.empty(n_samples)
+    second = np.full(n_samples, np.inf)
+    for start in range(0, n_samples, chunk_size):
+        stop = min(start + chunk_size, n_samples)
+        block = X[start:stop] @ centroids.T
+        block *= -2
+        block += centroid_squared_norms
+        rows = np.arange(stop - start)
+        labels[start:stop] = np.argmin(block, axis=1)
+        nearest[start:stop] = block[rows, labels[start:stop]]
+        if centroids.shape[0] > 1:
+            block[rows, labels[start:stop]] = np.inf
+            second[start:stop] = block.min(axis=1)
+    # Como em assign_labels, ||x||² só é somado às distâncias escolhidas
+    nearest += x_squared_norms
+    second += x_squared_norms
+    np.maximum(nearest, 0, out=nearest)
+    np.maximum(second, 0, out=second)
+    return labels, nearest, second
+
+
+def hamerly(X, centroids, max_iter=300, tol=1e-4, x_squared_norms=None, chunk_size=4096, stats=None):
+    """
+    Mesmas iterações e labels de lloyd, pulando as distâncias que não podem mudar a atribuição (algoritmo de Hamerly)
+
+    Cada amostra guarda um limite superior u da distância ao seu centroide e um limite inferior l da distância ao
+    segundo mais próximo, e cada centroide guarda s, a metade da distância ao centroide mais próximo. Se
+    u <= max(s, l), a amostra continua no mesmo cluster sem calcular nenhuma distância. Senão u é recalculado
+    (uma distância) e só se ainda for maior as k distâncias são calculadas. Quando os centroides se movem, u cresce
+    e l diminui o deslocamento. São dois vetores por amostra, sem a matriz n_samples x k de limites do algoritmo de
+    Elkan
+
+    Args:
+        stats: Dicionário que recebe o número de distâncias calculadas em 'distance_evaluations'
+
+    Returns:
+        centroids, labels, inertia, n_iter: Como lloyd
+    """
+    if x_squared_norms is None:
+        x_squared_norms = np.einsum('ij,ij->i', X, X)
+    n_samples = X.shape[0]
+    k = len(centroids)
+    tol = tol * np.mean(np.var(X, axis=0))
+    evaluations = 0
+    upper = lower = None
+
+    def assign(centroids, labels, upper, lower, exact=False):
+        nonlocal evaluations
+        if labels is None or exact:
+            labels, nearest, second = assign_two_nearest(X, centroids, x_squared_norms, chunk_size=chunk_size)
+            evaluations += n_samples * k
+            return labels, np.sqrt(nearest), np.sqrt(second)
+
+        labels, upper, lower = labels.copy(), upper.copy(), lower.copy()
+        centroid_distances = np.sqrt(np.maximum(
+            (centroids ** 2).sum(axis=1)[:, np.newaxis] - 2 * centroids @ centroids.T + (centroids ** 2).sum(axis=1),
+            0))
+        np.fill_diagonal(centroid_distances, np.inf)
+        bound = np.maximum(0.5 * centroid_distances.min(axis=1)[labels], lower)
+
+        # Limite superior exato, uma distância por amostra
+        candidates = np.flatnonzero(upper > bound)
+        difference = X[candidates] - centroids[labels[candidates]]
+        upper[candidates] = np.sqrt(np.einsum('ij,ij->i', difference, difference))
+        evaluations += len(candidates)
+
+        # As k distâncias, só quando o limite exato ainda não garante o cluster
+        candidates = candidates[upper[candidates] > bound[candidates]]
+        if len(candidates):
+            new_labels, nearest, second = assign_two_nearest(X[candidates], centroids,
+                                                             x_squared_norms[candidates], chunk_size=chunk_size)
+            labels[candidates] = new_labels
+            upper[candidates] = np.sqrt(nearest)
+            lower[candidates] = np.sqrt(second)
+            evaluations += len(candidates) * k
+        return labels, upper, lower
+
+    def move_bounds(old, new, labels, upper, lower):
+        # Um centroide que anda p aumenta a distância até ele em no máximo p
+        shifts = np.sqrt(((new - old) ** 2).sum(axis=1))
+        upper = upper + shifts[labels]
+        if k > 1:
+            largest = np.argmax(shifts)
+            second_largest = np.partition(shifts, -2)[-2]
+            lower = lower - np.where(labels == largest, second_largest, shifts[largest])
+        return upper, lower
+
+    # Com max_iter = 0 as labels e a inércia são as dos centroides iniciais
+    labels = None
+    exact = True
+    n_iter = 0
+    updated = True
+    for n_iter in range(1, max_iter + 1):
+        # Atribui cada amostra ao cluster mais próximo
+        previous_labels = labels
+        labels, upper, lower = assign(centroids, labels, upper, lower, exact=exact)
+        updated = False
+        if previous_labels is not None and np.array_equal(labels, previous_labels):
+            # Mesmas labels, os centroides também não mudam
+            break
+
+        # Calcula os novos centroides, um cluster vazio precisa das distâncias exatas (veja update_centroids)
+        counts = np.bincount(labels, minlength=k)
+        distances = upper ** 2
+        if (counts == 0).any():
+            _, distances = assign_labels(X, centroids, x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+            evaluations += n_samples * k
+        new_centroids, empty = update_centroids(X, labels, k, distances)
+        shift = ((new_centroids - centroids) ** 2).sum()
+        upper, lower = move_bounds(centroids, new_centroids, labels, upper, lower)
+        centroids = new_centroids
+        # Os centroides recolocados invalidam os limites, a próxima atribuição calcula todas as distâncias
+        exact = bool(empty)
+        updated = True
+        if shift <= tol and not empty:
+            break
+
+    if updated:
+        # As labels finais são as dos centroides finais, também quando parou por max_iter
+        labels, upper, lower = assign(centroids, labels, upper, lower, exact=exact)
+
+    # Inércia com as distâncias exatas, uma por amostra
+    difference = X - centroids[labels]
+    inertia = float(np.einsum('ij,ij->', difference, difference))
+    evaluations += n_samples
+    if stats is not None:
+        stats['distance_evaluations'] = evaluations
+    return centroids, labels, inertia, n_iter
+
+
+ALGORITHMS = {'lloyd': lloyd, 'hamerly': hamerly}
+
+
+def single_run(X, k, seed, init='k-means++', max_iter=300, tol=1e-4, chunk_size=4096, algorithm='lloyd'):
+    """
+    Uma reinicialização: centroides iniciais com o seu próprio gerador e as iterações do algoritmo
+    """
+    rng = np.random.default_rng(seed)
+    x_squared_norms = np.einsum('ij,ij->i', X, X)
+    centroids = initial_centroids(X, k, rng, init=init, x_squared_norms=x_squared_norms, chunk_size=chunk_size)
+    return ALGORITHMS[algorithm](X, centroids, max_iter=max_iter, tol=tol, x_squared_norms=x_squared_norms,
+                                 chunk_size=chunk_size)
+
+
+def init_worker(name, shape, dtype):
+    """
+    Abre a memória compartilhada com X no processo, sem copiar a matriz
+    """
+    global shared_X, shared_block
+    shared_block = shared_memory.SharedMemory(name=name)
+    shared_X = np.ndarray(shape, dtype=dtype, buffer=shared_block.buf)
+
+
+def shared_run(k, seed, init, max_iter, tol, chunk_size, algorithm):
+    return single_run(shared_X, k, seed, init=init, max_iter=max_iter, tol=tol, chunk_size=chunk_size,
+                      algorithm=algorithm)
+
+
+def kmeans(X, k, max_iter=300, tol=1e-4, chunk_size=4096, init='k-means++', n_init=1, n_jobs=None, random_state=0,
+           algorithm='lloyd', return_inertia=False, return_n_iter=False):
+    """
+    Implementação do algoritmo K-Means para a aula de Clustering
+
+    Executa n_init reinicializações independentes e retorna a de menor inércia (soma das distâncias quadradas).
+    Com mais de um processo, as reinicializações rodam em um pool de processos que lê X de uma memória compartilhada
+
+    Args:
+        X: Matriz de dados com as amostras nas linhas e features nas colunas
+        k: Número de clusters
+        max_iter: Número máximo de iterações
+        tol: Tolerância relativa do deslocamento dos centroides. 0 só para quando as labels não mudam
+        chunk_size: Número de linhas de cada bloco da atribuição (veja assign_labels)
+        init: 'k-means++', 'random' ou a matriz com os centroides iniciais (então uma única execução)
+        n_init: Número de reinicializações
+        n_jobs: Número de processos. Padrão: número de CPUs, limitado a n_init
+        random_state: Semente das reinicializações, cada uma tem o seu np.random.Generator
+        algorithm: 'lloyd' ou 'hamerly' (mesmas labels, pula as distâncias que não mudam a atribuição, mais rápido
+                   com k grande)
+        return_inertia: Retorna também a inércia
+        return_n_iter: Retorna também o número de iterações
+
+    Returns:
+        centroids: Matriz com os centroides finais
+        labels: Vetor com as labels dos clusters para cada amostra
+        inertia: Soma das distâncias quadradas, só com return_inertia
+        n_iter: Número de iterações, só com return_n_iter
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    if algorithm not in ALGORITHMS:
+        raise ValueError("algorithm deve ser %s, recebido '%s'" % (' ou '.join(ALGORITHMS), algorithm))
+    if not isinstance(init, str):
+        n_init = 1
+    # Sementes independentes derivadas de random_state, o estado global do NumPy não é alterado
+    seeds = np.random.SeedSequence(random_state).spawn(n_init)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, n_init))
+
+    if n_jobs == 1:
+        runs = [single_run(X, k, seed, init=init, max_iter=max_iter, tol=tol, chunk_size=chunk_size,
+                           algorithm=algorithm) for seed in seeds]
+    else:
+        block = shared_memory.SharedMemory(create=True, size=X.nbytes)
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=block.buf)[:] = X
+            # spawn: processos novos, sem herdar as threads do BLAS do processo principal
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=init_worker, initargs=(block.name, X.shape, X.dtype.str)) as executor:
+                runs = list(executor.map(shared_run, [k] * n_init, seeds, [init] * n_init, [max_iter] * n_init,
+                                         [tol] * n_init, [chunk_size] * n_init, [algorithm] * n_init))
+        finally:
+            block.close()
+            block.unlink()
+
+    centroids, labels, inertia, n_iter = min(runs, key=lambda run: run[2])
+    result = (centroids, labels)
+    if return_inertia:
+        result += (inertia,)
+    if return_n_iter:
+        result += (n_iter,)
+    return result
+
+
+class RunningScaler:
+    """
+    Padronização (x - média) / desvio padrão com a média e a variância acumuladas bloco a bloco (Welford, com a
+    fórmula de Chan para juntar um bloco inteiro), sem manter os dados. Mesmo resultado do StandardScaler
+    """
+
+    def __init__(self):
+        self.n_samples_seen = 0
+        self.mean = None
+        self.m2 = None
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype=float)
+        if not len(X):
+            return self
+        batch_mean = X.mean(axis=0)
+        batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+        if self.n_samples_seen == 0:
+            self.mean, self.m2 = batch_mean, batch_m2
+        else:
+            total = self.n_samples_seen + len(X)
+            delta = batch_mean - self.mean
+            self.mean = self.mean + delta * len(X) / total
+            self.m2 = self.m2 + batch_m2 + delta ** 2 * self.n_samples_seen * len(X) / total
+        self.n_samples_seen += len(X)
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.n_samples_seen
+
+    @property
+    def scale(self):
+        # Uma feature constante não é dividida por zero
+        scale = np.sqrt(self.var)
+        return np.where(scale > 0, scale, 1.0)
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean) / self.scale
+
+    def inverse_transform(self, X):
+        return np.asarray(X, dtype=float) * self.scale + self.mean
+
+
+class StreamingKMeans:
+    """
+    K-Means mini-batch para dados maiores que a memória: cada bloco atualiza a padronização (RunningScaler) e os
+    centroides, e pode ser descartado
+
+    Os centroides são a média das amostras atribuídas a cada cluster até agora, atualizada a cada bloco (taxa de
+    aprendizado 1 / contagem do cluster, como no mini-batch de Sculley). Eles ficam nas unidades originais e são
+    padronizados só na atribuição, então continuam válidos quando a média e a variância da padronização mudam
+    """
+
+    def __init__(self, k, scale=True, init='k-means++', random_state=0, chunk_size=4096):
+        """
+        Args:
+            k: Número de clusters
+            scale: Padroniza as features com a média e a variância acumuladas
+            init: 'k-means++' ou 'random', seguido de iterações de Lloyd no primeiro bloco (ao menos k amostras)
+            random_state: Semente do np.random.Generator da inicialização
+            chunk_size: Número de linhas de cada bloco da atribuição (veja assign_labels)
+        """
+        self.k = k
+        self.scaler = RunningScaler() if scale else None
+        self.init = init
+        self.rng = np.random.default_rng(random_state)
+        self.chunk_size = chunk_size
+        self.centroids = None
+        self.counts = np.zeros(k, dtype=np.int64)
+        self.n_samples_seen = 0
+        self.buffer = []
+
+    def transform(self, X):
+        return X if self.scaler is None else self.scaler.transform(X)
+
+    @property
+    def cluster_centers(self):
+        """
+        Centroides padronizados com a média e a variância atuais, na escala usada pela atribuição
+        """
+        return self.transform(self.centroids)
+
+    def partial_fit(self, X):
+        """
+        Atualiza a padronização e os centroides com um bloco de amostras
+        """
+        X = np.asarray(X, dtype=float)
+        if self.scaler is not None:
+            self.scaler.partial_fit(X)
+        self.n_samples_seen += len(X)
+
+        if self.centroids is None:
+            # A inicialização espera ter ao menos k amostras
+            self.buffer.append(X)
+            if sum(len(block) for block in self.buffer) < self.k:
+                return self
+            X = np.concatenate(self.buffer)
+            self.buffer = []
+            # O primeiro bloco está na memória: centroides iniciais e iterações de Lloyd só nele
+            scaled = self.transform(X)
+            centroids = initial_centroids(scaled, self.k, self.rng, init=self.init, chunk_size=self.chunk_size)
+            centroids = lloyd(scaled, centroids, chunk_size=self.chunk_size)[0]
+            self.centroids = centroids if self.scaler is None else self.scaler.inverse_transform(centroids)
+
+        labels, _ = assign_labels(self.transform(X), self.cluster_centers, chunk_size=self.chunk_size)
+        batch_counts = np.bincount(labels, minlength=self.k)
+        sums = np.column_stack([np.bincount(labels, weights=X[:, j], minlength=self.k) for j in range(X.shape[1])])
+        self.counts += batch_counts
+        # Média acumulada: c + (soma do bloco - n_bloco * c) / contagem total
+        updated = batch_counts > 0
+        self.centroids[updated] += (sums[updated] - batch_counts[updated, np.newaxis] * self.centroids[updated]) / \
+            self.counts[updated, np.newaxis]
+        return self
+
+    def fit(self, batches):
+        """
+        Uma passada pelos blocos (por exemplo de read_csv_chunks ou read_parquet_batches)
+        """
+        for X in batches:
+            self.partial_fit(X)
+        if self.centroids is None:
+            raise ValueError('São necessárias ao menos %d amostras, recebidas %d' % (self.k, self.n_samples_seen))
+        return self
+
+    def predict(self, X):
+        labels, _ = assign_labels(self.transform(X), self.cluster_centers, chunk_size=self.chunk_size)
+        return labels
+
+    def inertia(self, X):
+        """
+        Soma das distâncias quadradas (na escala padronizada) das amostras de X aos seus centroides
+        """
+        _, distances = assign_labels(self.transform(X), self.cluster_centers, chunk_size=self.chunk_size)
+        return float(distances.sum())
+
+
+def read_csv_chunks(path, chunksize=100000, columns=None):
+    """
+    Lê o CSV em blocos de linhas, com as colunas numéricas (ou as colunas pedidas) como matriz
+    """
+    import pandas as pd
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns):
+        yield (chunk if columns else chunk.select_dtypes('number')).to_numpy(dtype=float)
+
+
+def read_parquet_batches(path, batch_size=100000, columns=None):
+    """
+    Lê o Parquet em lotes de linhas (pip install pyarrow), com as colunas numéricas (ou as colunas pedidas) como matriz
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('A leitura de Parquet precisa do pyarrow: pip install pyarrow')
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        chunk = batch.to_pandas()
+        yield (chunk if columns else chunk.select_dtypes('number')).to_numpy(dtype=float)
+
+
+def read_chunks(path, chunksize=100000, columns=None):
+    """
+    Blocos de um CSV ou de um Parquet, pela extensão do arquivo
+    """
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        return read_parquet_batches(path, batch_size=chunksize, columns=columns)
+    return read_csv_chunks(path, chunksize=chunksize, columns=columns)
+
+
+def read_column_chunks(path, column, chunksize=100000):
+    """
+    Blocos de uma coluna (ex.: o identificador das linhas) nos mesmos blocos de read_chunks, como vetor
+    """
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=[column]):
+            yield batch.column(0).to_numpy(zero_copy_only=False)
+    else:
+        import pandas as pd
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=[column]):
+            yield chunk[column].to_numpy()
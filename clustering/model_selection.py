@@ -0,0 +1,276 @@
+"""
+Escolha do número de clusters: K-Means e K-Medoides para cada k com os índices de validação, tudo calculado a partir
+de uma única matriz de distâncias
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from kmeans import assign_labels, kmeans, lloyd
+
+# Matrizes de distâncias já calculadas, pelo hash dos dados
+distance_cache = {}
+
+
+def data_key(X):
+    X = np.ascontiguousarray(X, dtype=float)
+    return hashlib.sha1(str(X.shape).encode() + X.tobytes()).hexdigest()
+
+
+def compute_distances(X, out=None, chunk_size=4096):
+    """
+    Matriz n_samples x n_samples das distâncias euclidianas (||x||² - 2x·y + ||y||² com uma multiplicação de matrizes),
+    em blocos de chunk_size linhas
+
+    Args:
+        out: Matriz onde as distâncias são escritas, por exemplo um memmap do .npy do cache. Padrão: nova matriz
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    n_samples = len(X)
+    if out is None:
+        out = np.empty((n_samples, n_samples))
+    squared_norms = np.einsum('ij,ij->i', X, X)
+    for start in range(0, n_samples, chunk_size):
+        end = min(start + chunk_size, n_samples)
+        block = X[start:end] @ X.T
+        block *= -2
+        block += squared_norms[start:end, np.newaxis]
+        block += squared_norms
+        np.maximum(block, 0, out=block)
+        np.fill_diagonal(block[:, start:end], 0)
+        out[start:end] = np.sqrt(block, out=block)
+    return out
+
+
+def pairwise_distances(X):
+    """
+    compute_distances calculada uma vez para os mesmos dados
+    """
+    key = data_key(X)
+    if key not in distance_cache:
+        distance_cache[key] = compute_distances(X)
+    return distance_cache[key]
+
+
+def next_index(closest, rng):
+    # Sorteio do k-means++: probabilidade proporcional à distância quadrada até o centro mais próximo
+    total = closest.sum()
+    if total <= 0:
+        return int(rng.integers(len(closest)))
+    return int(min(np.searchsorted(np.cumsum(closest), rng.random() * total), len(closest) - 1))
+
+
+def one_hot(labels, k):
+    # Matriz n_samples x k com 1 na coluna do cluster de cada amostra: distances @ one_hot soma as distâncias de cada
+    # amostra a cada cluster
+    matrix = np.zeros((len(labels), k))
+    matrix[np.arange(len(labels)), labels] = 1
+    return matrix
+
+
+def kmedoids(distances, medoids, max_iter=300):
+    """
+    K-Medoides alternado sobre a matriz de distâncias: cada amostra vai para o medoide mais próximo e o medoide de cada
+    cluster passa a ser a amostra com a menor soma de distâncias às outras do cluster (as somas de todas as amostras a
+    todos os clusters saem de uma multiplicação de matrizes)
+
+    Args:
+        distances: Matriz n_samples x n_samples das distâncias
+        medoids: Índices dos medoides iniciais
+
+    Returns:
+        medoids: Índices dos medoides finais
+        labels: Vetor com o cluster de cada amostra
+        inertia: Soma das distâncias das amostras aos seus medoides
+        n_iter: Número de iterações
+    """
+    medoids = np.array(medoids)
+    k = len(medoids)
+    for n_iter in range(1, max_iter + 1):
+        labels = np.argmin(distances[:, medoids], axis=1)
+        members = one_hot(labels, k)
+        to_clusters = distances @ members
+        to_clusters[members == 0] = np.inf
+        # Cluster vazio mantém o medoide
+        new_medoids = np.where(members.any(axis=0), np.argmin(to_clusters, axis=0), medoids)
+        if np.array_equal(new_medoids, medoids):
+            break
+        medoids = new_medoids
+    labels = np.argmin(distances[:, medoids], axis=1)
+    return medoids, labels, float(distances[np.arange(len(labels)), medoids[labels]].sum()), n_iter
+
+
+def kmeans_path(X, distances, ks, random_state=42, n_init=10):
+    """
+    K-Means para cada k em ordem crescente (a matriz de distâncias não é usada, os centroides não são amostras). Cada k
+    fica com a menor inércia entre n_init execuções independentes com k-means++ (kmeans) e uma que começa dos
+    centroides do k anterior mais um centro sorteado como no k-means++
+    """
+    rng = np.random.default_rng(random_state)
+    x_squared_norms = np.einsum('ij,ij->i', X, X)
+    centroids = X[[rng.integers(len(X))]]
+    fits = []
+    for k in range(1, max(ks) + 1):
+        if k > 1:
+            _, closest = assign_labels(X, centroids, x_squared_norms=x_squared_norms)
+            centroids = np.vstack([centroids, X[next_index(closest, rng)]])
+        candidates = [lloyd(X, centroids, x_squared_norms=x_squared_norms)]
+        if n_init > 0:
+            # Um processo: os métodos de sweep já rodam em paralelo
+            candidates.append(kmeans(X, k, n_init=n_init, n_jobs=1, random_state=random_state + k,
+                                     return_inertia=True, return_n_iter=True))
+        # O k seguinte começa da melhor solução
+        centroids, labels, inertia, n_iter = min(candidates, key=lambda candidate: candidate[2])
+        if k in ks:
+            fits.append({'method': 'kmeans', 'k': k, 'labels': labels, 'inertia': inertia, 'n_iter': n_iter})
+    return fits
+
+
+def kmedoids_path(X, distances, ks, random_state=42):
+    """
+    K-Medoides para cada k em ordem crescente, cada k começa dos medoides do k anterior mais um sorteado como no
+    k-medoids++
+    """
+    rng = np.random.default_rng(random_state)
+    medoids = np.array([rng.integers(len(distances))])
+    fits = []
+    for k in range(1, max(ks) + 1):
+        if k > 1:
+            closest = distances[:, medoids].min(axis=1) ** 2
+            medoids = np.append(medoids, next_index(closest, rng))
+        medoids, labels, inertia, n_iter = kmedoids(distances, medoids)
+        if k in ks:
+            fits.append({'method': 'kmedoids', 'k': k, 'labels': labels, 'inertia': inertia, 'n_iter': n_iter})
+    return fits
+
+
+METHODS = {'kmeans': kmeans_path, 'kmedoids': kmedoids_path}
+
+
+def cluster_sums(distances, squared_distances, labelings):
+    """
+    Somas das distâncias e das distâncias quadradas de cada amostra a cada cluster, para várias rotulações em uma
+    única passada por cada matriz (as one-hot de todas as rotulações lado a lado)
+
+    Returns:
+        Lista com (labels renumerados 0..k-1, sums, squared_sums) de cada rotulação
+    """
+    labelings = [np.unique(labels, return_inverse=True)[1].ravel() for labels in labelings]
+    widths = [labels.max() + 1 for labels in labelings]
+    stacked = np.hstack([one_hot(labels, width) for labels, width in zip(labelings, widths)])
+    splits = np.cumsum(widths)[:-1]
+    return list(zip(labelings, np.split(distances @ stacked, splits, axis=1),
+                    np.split(squared_distances @ stacked, splits, axis=1)))
+
+
+def indices_from_sums(labels, sums, squared_sums, total):
+    """
+    Silhueta, Davies-Bouldin e Calinski-Harabasz (os mesmos valores do scikit-learn) a partir das somas de
+    cluster_sums, sem voltar aos dados: as distâncias aos centroides e entre centroides saem das somas das distâncias
+    quadradas
+
+    Args:
+        total: Soma de todas as distâncias quadradas
+
+    Returns:
+        Dicionário com silhouette, davies_bouldin e calinski_harabasz, NaN com menos de dois clusters
+    """
+    n_samples, k = sums.shape
+    if k < 2 or k >= n_samples:
+        return {'silhouette': np.nan, 'davies_bouldin': np.nan, 'calinski_harabasz': np.nan}
+    counts = np.bincount(labels, minlength=k).astype(float)
+    rows = np.arange(n_samples)
+
+    # Silhueta: média das distâncias ao próprio cluster (sem a amostra) e ao cluster vizinho mais próximo
+    own = sums[rows, labels] / np.maximum(counts[labels] - 1, 1)
+    others = sums / counts
+    others[rows, labels] = np.inf
+    nearest = others.min(axis=1)
+    silhouette = np.where(counts[labels] > 1, (nearest - own) / np.maximum(np.maximum(own, nearest), 1e-300), 0)
+
+    # Somas das distâncias quadradas entre os clusters: ||x - m_c||² e ||m_a - m_b||² saem delas
+    blocks = np.vstack([np.bincount(labels, weights=column, minlength=k) for column in squared_sums.T]).T
+    within = np.diag(blocks) / (2 * counts)
+    to_centroid = squared_sums[rows, labels] / counts[labels] - (within / counts)[labels]
+
+    # Calinski-Harabasz: dispersão entre clusters / dispersão dentro dos clusters
+    within_total = within.sum()
+    calinski_harabasz = 1.0 if within_total == 0 else \
+        (total / (2 * n_samples) - within_total) * (n_samples - k) / (within_total * (k - 1))
+
+    # Davies-Bouldin: distância média ao centroide e distância entre centroides
+    scatter = np.bincount(labels, weights=np.sqrt(np.maximum(to_centroid, 0)), minlength=k) / counts
+    centroid_distances = np.sqrt(np.maximum(blocks / np.outer(counts, counts) - (within / counts)[:, np.newaxis]
+                                            - (within / counts)[np.newaxis, :], 0))
+    if np.allclose(scatter, 0) or np.allclose(centroid_distances, 0):
+        davies_bouldin = 0.0
+    else:
+        centroid_distances[centroid_distances == 0] = np.inf
+        ratios = (scatter[:, np.newaxis] + scatter) / centroid_distances
+        np.fill_diagonal(ratios, -np.inf)
+        davies_bouldin = float(ratios.max(axis=1).mean())
+
+    return {'silhouette': float(silhouette.mean()), 'davies_bouldin': davies_bouldin,
+            'calinski_harabasz': float(calinski_harabasz)}
+
+
+def validity_indices(distances, labels, squared_distances=None):
+    """
+    Índices de validação de uma rotulação a partir da matriz de distâncias (ver indices_from_sums)
+    """
+    if squared_distances is None:
+        squared_distances = distances ** 2
+    return indices_from_sums(*cluster_sums(distances, squared_distances, [labels])[0], squared_distances.sum())
+
+
+def sweep(X, ks=range(1, 11), methods=('kmeans', 'kmedoids'), random_state=42, n_jobs=None, distances=None,
+          n_init=10):
+    """
+    Ajusta os métodos para cada k e calcula os índices de validação, com uma única matriz de distâncias
+    (pairwise_distances) compartilhada pelo K-Medoides e pelos índices
+
+    Cada método percorre os k em ordem crescente começando da solução do k anterior (o K-Means compara com n_init
+    execuções independentes de cada k), os métodos rodam em paralelo e depois os índices de todos os k também. São
+    threads: as multiplicações de matrizes do NumPy liberam o GIL e a matriz de distâncias não é copiada. As somas por
+    cluster de todos os k saem de uma única passada pela matriz
+
+    Args:
+        X: Matriz de dados com as amostras nas linhas e features nas colunas
+        ks: Números de clusters
+        methods: 'kmeans' e/ou 'kmedoids'
+        random_state: Semente dos centros sorteados
+        n_jobs: Número de threads. Padrão: número de CPUs
+        distances: Matriz de distâncias de X já calculada, por exemplo a de preprocessing.preprocess. Padrão:
+            pairwise_distances(X)
+        n_init: Execuções independentes do K-Means para cada k, além da que começa do k anterior. 0: só a do k
+            anterior
+
+    Returns:
+        DataFrame com uma linha por método e k: inertia (K-Means: soma das distâncias quadradas, K-Medoides: soma das
+        distâncias), n_iter, silhouette, davies_bouldin e calinski_harabasz
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    ks = sorted(set(ks))
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        raise ValueError('Métodos desconhecidos %s, use %s' % (unknown, ', '.join(METHODS)))
+    if distances is None:
+        distances = pairwise_distances(X)
+    elif distances.shape != (len(X), len(X)):
+        raise ValueError('A matriz de distâncias %s não é de %d amostras' % (distances.shape, len(X)))
+    squared_distances = distances ** 2
+
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as executor:
+        paths = [executor.submit(METHODS[method], X, distances, ks, random_state,
+                                 **({'n_init': n_init} if method == 'kmeans' else {})) for method in methods]
+        fits = [fit for path in paths for fit in path.result()]
+        # Uma passada pelas matrizes para todos os k, depois os índices de cada k em paralelo
+        sums = cluster_sums(distances, squared_distances, [fit['labels'] for fit in fits])
+        total = squared_distances.sum()
+        indices = list(executor.map(lambda args: indices_from_sums(*args, total), sums))
+
+    return pd.DataFrame([{'method': fit['method'], 'k': fit['k'], 'inertia': fit['inertia'], 'n_iter': fit['n_iter'],
+                          **index} for fit, index in zip(fits, indices)])
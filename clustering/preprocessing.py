@@ -0,0 +1,73 @@
+"""
+Pré-processamento com cache: a matriz normalizada e a matriz de distâncias de um CSV ficam em arquivos .npy
+identificados pelo hash do conteúdo do CSV. As execuções seguintes só abrem os arquivos, a matriz de distâncias com
+memmap (não é lida inteira para a memória)
+"""
+import hashlib
+import io
+import os
+from urllib.request import urlopen
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from sklearn.preprocessing import StandardScaler
+
+from model_selection import compute_distances
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache')
+
+
+def read_source(path):
+    # Conteúdo do arquivo local ou da URL
+    if os.path.isfile(path):
+        with open(path, 'rb') as file:
+            return file.read()
+    with urlopen(path) as response:
+        return response.read()
+
+
+def cache_paths(path, content, drop, cache_folder=CACHE_FOLDER):
+    # O nome do arquivo e o hash do conteúdo e das colunas removidas: um CSV alterado gera outros arquivos
+    name = os.path.splitext(os.path.basename(path))[0]
+    key = hashlib.sha1(content + repr(sorted(drop)).encode()).hexdigest()[:16]
+    prefix = os.path.join(cache_folder, '%s-%s' % (name, key))
+    return prefix + '-scaled.npy', prefix + '-distances.npy'
+
+
+def preprocess(path, drop=('country',), cache_folder=CACHE_FOLDER, chunk_size=4096):
+    """
+    Lê o CSV, normaliza as features (StandardScaler) e calcula a matriz de distâncias euclidianas da base normalizada,
+    ou abre os arquivos do cache se o mesmo CSV já foi processado
+
+    Args:
+        path: Arquivo local ou URL do CSV
+        drop: Colunas que não são features (ex.: o nome do país)
+        cache_folder: Pasta dos .npy. Padrão: data/cache
+        chunk_size: Linhas de cada bloco no cálculo das distâncias
+
+    Returns:
+        df: DataFrame do CSV
+        X_vars: df sem as colunas drop
+        scaled: X_vars normalizado
+        distances: Matriz n_samples x n_samples das distâncias entre as linhas de scaled, memmap somente leitura
+    """
+    content = read_source(path)
+    df = pd.read_csv(io.BytesIO(content))
+    X_vars = df.drop(list(drop), axis=1)
+    scaled_path, distances_path = cache_paths(path, content, drop, cache_folder)
+
+    if not os.path.isfile(scaled_path) or not os.path.isfile(distances_path):
+        os.makedirs(cache_folder, exist_ok=True)
+        scaled = StandardScaler().fit_transform(X_vars)
+        # Escreve em arquivos temporários e renomeia, um processo interrompido não deixa um cache pela metade
+        with open(scaled_path + '.tmp', 'wb') as file:
+            np.save(file, scaled)
+        distances = open_memmap(distances_path + '.tmp', mode='w+', dtype=float, shape=(len(scaled), len(scaled)))
+        compute_distances(scaled, out=distances, chunk_size=chunk_size)
+        distances.flush()
+        del distances
+        os.replace(scaled_path + '.tmp', scaled_path)
+        os.replace(distances_path + '.tmp', distances_path)
+
+    return df, X_vars, np.load(scaled_path), np.load(distances_path, mmap_mode='r')
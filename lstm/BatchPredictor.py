@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import tensorflow as tf
+
+from ModelBundle import ModelBundle
+
+
+class BatchPredictor:
+    """
+    Serves the predictions of a trained model. Requests that arrive within max_delay seconds are grouped in one call
+    of a tf.function traced when the predictor is created, so no request pays the graph tracing
+    """
+
+    def __init__(self, model, scale_min, scale, window, n_features, max_batch_size=256, max_delay=0.002):
+        """
+        :param model: Trained Keras model
+        :param scale_min: min_ of the fitted MinMaxScaler
+        :param scale: scale_ of the fitted MinMaxScaler
+        :param window: Number of timesteps of each sample
+        :param n_features: Number of features of each timestep
+        :param max_batch_size: Maximum number of windows in one call of the model
+        :param max_delay: Maximum time (seconds) the first request waits for others
+        """
+        self.scale_min = np.asarray(scale_min, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.window = window
+        self.n_features = n_features
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.latencies = deque(maxlen=10000)
+        self.batch_sizes = deque(maxlen=10000)
+        self.requests = queue.Queue()
+
+        # Traced once for any batch size
+        self.predict_function = tf.function(lambda x: model(x, training=False), input_signature=[
+            tf.TensorSpec(shape=(None, window, n_features), dtype=tf.float32)])
+        self.predict_function(tf.zeros((1, window, n_features), dtype=tf.float32))
+
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name='batch-predictor', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_bundle(cls, path, max_batch_size=256, max_delay=0.002):
+        """
+        Creates the predictor from a file saved by ModelBundle, without the dataset
+        """
+        bundle = ModelBundle.load(path)
+        return cls(bundle.build_model(), bundle.scale_min, bundle.scale, bundle.window, len(bundle.features),
+                   max_batch_size=max_batch_size, max_delay=max_delay)
+
+    def predict(self, windows, timeout=None):
+        """
+        Predicts the windows, blocking until the batch with them is computed
+        :param windows: Array (samples, window, features) with values not scaled
+        :param timeout: Seconds to wait for the result
+        :return: Array (samples, horizon)
+        """
+        return self.submit(windows).result(timeout=timeout)
+
+    def submit(self, windows):
+        """
+        Queues the windows without blocking, e.g. for asyncio.wrap_future
+        :return: concurrent.futures.Future with the array (samples, horizon)
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim != 3 or windows.shape[1:] != (self.window, self.n_features):
+            raise ValueError('Expected windows with shape (samples, %d, %d), got %s' % (
+                self.window, self.n_features, windows.shape))
+        future = Future()
+        self.requests.put((windows, future, time.perf_counter()))
+        return future
+
+    def pending(self):
+        """
+        :return: Number of requests waiting for a batch
+        """
+        return self.requests.qsize()
+
+    def serve(self):
+        while self.running:
+            try:
+                first = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Collecting the requests that arrive until the deadline or until the batch is full
+            batch = [first]
+            size = len(first[0])
+            deadline = time.perf_counter() + self.max_delay
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            try:
+                windows = np.concatenate([item[0] for item in batch]) * self.scale + self.scale_min
+                predictions = self.predict_function(windows).numpy()
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batch_sizes.append(size)
+            start = 0
+            now = time.perf_counter()
+            for windows, future, received_at in batch:
+                future.set_result(predictions[start:start + len(windows)])
+                start += len(windows)
+                self.latencies.append(now - received_at)
+
+    def stats(self):
+        """
+        :return: Number of requests, latency percentiles (milliseconds) and mean batch size of the last requests
+        """
+        if not self.latencies:
+            return {"requests": 0}
+        latencies = np.array(self.latencies) * 1000
+        return {"requests": len(latencies),
+                "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95)),
+                               "p99": float(np.percentile(latencies, 99)), "max": float(latencies.max())},
+                "mean_batch_size": float(np.mean(self.batch_sizes))}
+
+    def close(self):
+        self.running = False
+        self.thread.join()
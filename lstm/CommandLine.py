@@ -6,12 +6,22 @@ def lstm_command_line_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--dataset_path', metavar="", type=str, help="path to dataset. Default: 'data/big_tech_stock_prices.csv'", default='data/big_tech_stock_prices.csv')
     parser.add_argument('-fs', '--filter_stocks', metavar="", type=str, help='Column name and value to be filtered (between quotes and with no spaces). Default: "{\'filed_name\':\'stock_symbol\',\'field_text\':\'GOOGL\'}"', default="{'filed_name':'stock_symbol','field_text':'GOOGL'}")
-    parser.add_argument('-f', '--features', metavar="", type=str, help='Array with the field names to use as features (between quotes and with no spaces). Default: "[\'open\',\'high\',\'low\',\'volume\']"', default="['open','high','low','volume']")
+    parser.add_argument('-f', '--features', metavar="", type=str, help='Array with the field names to use as features (between quotes and with no spaces), engineered features can be used as fields: return, log_return, rolling_mean_<n>, rolling_std_<n>, rsi_<n>, macd, macd_signal, macd_hist, volume_zscore_<n>, fundamental_<column> and sector_<name> (data/fundamentals.csv and data/securities.csv). Default: "[\'open\',\'high\',\'low\',\'volume\']"', default="['open','high','low','volume']")
     parser.add_argument('-y', '--y_value', metavar="", type=str, help='y value is the name of field in the dataset that your model will predict. Default: "adj_close"', default="adj_close")
+    parser.add_argument('-dr', '--date_range', metavar="", type=str, help='First and last dates (inclusive) to be loaded (between quotes and with no spaces), None for an open side. Default: all dates. Example: "[\'2015-01-01\',None]"', default="None")
     parser.add_argument('-n', '--n_splits', metavar="", type=int, help='n_splits is the number that you will slices you dataset. Default: 4', default=4)
     parser.add_argument('-hl', '--hidden_layers', metavar="", type=int, help='hidden_layers is the number of internal layers of your model. Default: 4', default=4)
     parser.add_argument('-u', '--units', metavar="", type=int, help='units is the number of neurons of you hidden layers. Default: 10', default=10)
+    parser.add_argument('-w', '--window', metavar="", type=int, help='window is the number of past rows (timesteps) each LSTM sample looks back. Default: 1', default=1)
+    parser.add_argument('-ho', '--horizon', metavar="", type=int, help='horizon is the number of future values predicted for each sample. Default: 1', default=1)
     parser.add_argument('-e', '--epochs', metavar="", type=int, help='epochs is the number of repetitions to train you model. Default: 10', default=10)
+    parser.add_argument('-ms', '--multi_series', metavar="", type=str, help="Trains every stock in one run: 'shared' (one model with a stock embedding) or 'per_symbol' (one model by stock in parallel). A list in field_text of --filter_stocks restricts the stocks. Default: '' (only the filtered stock)", default='', choices=['', 'shared', 'per_symbol'])
+    parser.add_argument('-ds', '--use_dataset', action='store_true', help='Streams the windows to the training with tf.data (cache + prefetch) instead of NumPy arrays')
+    parser.add_argument('-sb', '--shuffle_buffer', metavar="", type=int, help='Only with --use_dataset, size of the buffer to shuffle the windows. 0 keeps the time order. Default: 0', default=0)
+    parser.add_argument('-s', '--save_name', metavar="", type=str, help='Name to register the trained model in the model registry (./save). Default: not saved', default='')
+    parser.add_argument('-l', '--load_name', metavar="", type=str, help='Name of a registered model to be evaluated instead of training a new one. Its features, y value, window, stock and scaler are used. Default: trains a new model', default='')
+    parser.add_argument('-xp', '--profile', metavar="", type=str, help="Execution profile of TensorFlow: 'throughput', 'latency' or 'shared-host' (threads, oneDNN and bfloat16 mixed precision when the CPU supports it). Default: '' (TensorFlow defaults)", default='', choices=['', 'throughput', 'latency', 'shared-host'])
+    parser.add_argument('-xn', '--profile_processes', metavar="", type=int, help="Only 'shared-host', number of trainings running on the host at the same time, the CPUs are split between them. Default: 1", default=1)
     parser.add_argument('-v', '--verbose', metavar="", type=int, help='How much data you need to output. O is only necessary more numbers more output data. Default: 0', default=0, choices = [0, 1, 2, 3, 4, 5])
     args = parser.parse_args()
     lstm_wrapper_values = {
@@ -19,14 +29,34 @@ def lstm_command_line_args():
         "dataset_path" : args.dataset_path,
         # Filtering the dataset with multiple companies stocks
         "filter_stocks" : literal_eval(args.filter_stocks),
+        # First and last dates to be loaded
+        "date_range" : literal_eval(args.date_range),
         # Number os splits to generate the train and test use by TimeSeriesSplit
         "n_splits" : args.n_splits,
         # Number of hidden layers
         "hidden_layers" : args.hidden_layers,
         # Number of neurons for each layer
         "units" : args.units,
+        # Number of timesteps in each LSTM sample
+        "window" : args.window,
+        # Number of values predicted for each sample
+        "horizon" : args.horizon,
         # Number of epochs
         "epochs" : args.epochs,
+        # Multi-series mode ('', 'shared' or 'per_symbol')
+        "multi_series" : args.multi_series,
+        # Training with a tf.data pipeline
+        "use_dataset" : args.use_dataset,
+        # Shuffle buffer for the tf.data pipeline, 0 keeps the order
+        "shuffle_buffer" : args.shuffle_buffer,
+        # Name to register the trained model
+        "save_name" : args.save_name,
+        # Name of a registered model to be loaded
+        "load_name" : args.load_name,
+        # Execution profile, '' for the TensorFlow defaults
+        "profile" : args.profile,
+        # Trainings sharing the host with the 'shared-host' profile
+        "profile_processes" : args.profile_processes,
         # Verbose 0 = none, 1 more detail, 2 a lot of details and go on til 4
         "verbose" : args.verbose,
         # Selecting the Features (x)
@@ -36,5 +66,180 @@ def lstm_command_line_args():
     }
     return SimpleNamespace(**lstm_wrapper_values)
 
+def sweep_command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--dataset_path', metavar="", type=str, help="path to dataset. Default: 'data/big_tech_stock_prices.csv'", default='data/big_tech_stock_prices.csv')
+    parser.add_argument('-fs', '--filter_stocks', metavar="", type=str, help='Column name and value to be filtered (between quotes and with no spaces). Default: "{\'filed_name\':\'stock_symbol\',\'field_text\':\'GOOGL\'}"', default="{'filed_name':'stock_symbol','field_text':'GOOGL'}")
+    parser.add_argument('-f', '--features', metavar="", type=str, help='Array with the field names to use as features (between quotes and with no spaces), engineered features can be used as fields: return, log_return, rolling_mean_<n>, rolling_std_<n>, rsi_<n>, macd, macd_signal, macd_hist, volume_zscore_<n>, fundamental_<column> and sector_<name> (data/fundamentals.csv and data/securities.csv). Default: "[\'open\',\'high\',\'low\',\'volume\']"', default="['open','high','low','volume']")
+    parser.add_argument('-y', '--y_value', metavar="", type=str, help='y value is the name of field in the dataset that your model will predict. Default: "adj_close"', default="adj_close")
+    parser.add_argument('-dr', '--date_range', metavar="", type=str, help='First and last dates (inclusive) to be loaded (between quotes and with no spaces), None for an open side. Default: all dates', default="None")
+    parser.add_argument('-n', '--n_splits', metavar="", type=int, help='The validation set is the last fold of n_splits. Default: 4', default=4)
+    parser.add_argument('-sp', '--space', metavar="", type=str, help='Search space, dictionary with the list of values of each parameter (between quotes and with no spaces). Parameters: hidden_layers, units, dropout, activation, optimizer, epochs, batch_size, window, horizon. Default: "{\'hidden_layers\':[1,2,4],\'units\':[10,50],\'dropout\':[0.01,0.1]}"', default="{'hidden_layers':[1,2,4],'units':[10,50],'dropout':[0.01,0.1]}")
+    parser.add_argument('-t', '--trials', metavar="", type=int, help='Number of random combinations of the search space. Default: 0 (every combination)', default=0)
+    parser.add_argument('-e', '--epochs', metavar="", type=int, help='Maximum number of epochs of each trial. Default: 20', default=20)
+    parser.add_argument('-p', '--patience', metavar="", type=int, help='Epochs without improvement before EarlyStopping stops a trial. Default: 3', default=3)
+    parser.add_argument('-wk', '--workers', metavar="", type=int, help='Number of processes. Default: 0 (CPU count / threads)', default=0)
+    parser.add_argument('-th', '--threads', metavar="", type=int, help='TensorFlow threads of each process. Default: 1', default=1)
+    parser.add_argument('-o', '--leaderboard', metavar="", type=str, help="File of the leaderboard (.csv or .json). Default: 'leaderboard.csv'", default='leaderboard.csv')
+    args = parser.parse_args()
+    sweep_values = {
+        # Dataset
+        "dataset_path" : args.dataset_path,
+        # Filtering the dataset with multiple companies stocks
+        "filter_stocks" : literal_eval(args.filter_stocks),
+        # Selecting the Features (x)
+        "features" : literal_eval(args.features),
+        # Select predict values (y)
+        "y_value" : args.y_value,
+        # First and last dates to be loaded
+        "date_range" : literal_eval(args.date_range),
+        # Number os splits, the last one is the validation set
+        "n_splits" : args.n_splits,
+        # Values of each parameter
+        "space" : literal_eval(args.space),
+        # Number of random trials, None for the whole grid
+        "trials" : args.trials or None,
+        # Maximum number of epochs
+        "epochs" : args.epochs,
+        # Patience of EarlyStopping
+        "patience" : args.patience,
+        # Number of processes
+        "workers" : args.workers or None,
+        # TensorFlow threads of each process
+        "threads" : args.threads,
+        # Leaderboard file
+        "leaderboard" : args.leaderboard
+    }
+    return SimpleNamespace(**sweep_values)
 
+def load_test_command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-url', '--url', metavar="", type=str, help="Address of the service. Default: 'http://127.0.0.1:5000' (lstm-service.py), lstm-service-asgi.py uses 'http://127.0.0.1:8000'", default='http://127.0.0.1:5000')
+    parser.add_argument('-c', '--clients', metavar="", type=int, help='Number of clients calling POST /model/predict at the same time. Default: 16', default=16)
+    parser.add_argument('-hc', '--heavy_clients', metavar="", type=int, help='Number of clients calling POST /model/evaluate at the same time (CPU-heavy requests). Default: 1', default=1)
+    parser.add_argument('-t', '--duration', metavar="", type=float, help='Seconds of the test. Default: 20', default=20)
+    parser.add_argument('-sk', '--skip_setup', action='store_true', help='Uses the model already trained by the service instead of creating and training one')
+    parser.add_argument('-fs', '--filter_stocks', metavar="", type=str, help='Column name and value to be filtered (between quotes and with no spaces). Default: "{\'filed_name\':\'stock_symbol\',\'field_text\':\'GOOGL\'}"', default="{'filed_name':'stock_symbol','field_text':'GOOGL'}")
+    parser.add_argument('-f', '--features', metavar="", type=str, help='Array with the field names to use as features (between quotes and with no spaces). Default: "[\'open\',\'high\',\'low\',\'volume\']"', default="['open','high','low','volume']")
+    parser.add_argument('-y', '--y_value', metavar="", type=str, help='y value is the name of field in the dataset that your model will predict. Default: "adj_close"', default="adj_close")
+    parser.add_argument('-w', '--window', metavar="", type=int, help='window is the number of past rows (timesteps) each LSTM sample looks back. Default: 1', default=1)
+    parser.add_argument('-e', '--epochs', metavar="", type=int, help='Epochs of the model trained before the test. Default: 1', default=1)
+    parser.add_argument('-o', '--output', metavar="", type=str, help="JSON file with the results, to compare the services. Default: not saved", default='')
+    args = parser.parse_args()
+    load_test_values = {
+        # Address of the service
+        "url" : args.url.rstrip('/'),
+        # Clients of POST /model/predict
+        "clients" : args.clients,
+        # Clients of POST /model/evaluate
+        "heavy_clients" : args.heavy_clients,
+        # Seconds of the test
+        "duration" : args.duration,
+        # Creating and training the model before the test
+        "setup" : not args.skip_setup,
+        # Filtering the dataset with multiple companies stocks
+        "filter_stocks" : literal_eval(args.filter_stocks),
+        # Selecting the Features (x)
+        "features" : literal_eval(args.features),
+        # Select predict values (y)
+        "y_value" : args.y_value,
+        # Number of timesteps in each LSTM sample
+        "window" : args.window,
+        # Number of epochs
+        "epochs" : args.epochs,
+        # Results file
+        "output" : args.output
+    }
+    return SimpleNamespace(**load_test_values)
 
+def profile_benchmark_command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--dataset_path', metavar="", type=str, help="path to dataset. Default: 'data/big_tech_stock_prices.csv'", default='data/big_tech_stock_prices.csv')
+    parser.add_argument('-fs', '--filter_stocks', metavar="", type=str, help='Column name and value to be filtered (between quotes and with no spaces). Default: "{\'filed_name\':\'stock_symbol\',\'field_text\':\'GOOGL\'}"', default="{'filed_name':'stock_symbol','field_text':'GOOGL'}")
+    parser.add_argument('-f', '--features', metavar="", type=str, help='Array with the field names to use as features (between quotes and with no spaces). Default: "[\'open\',\'high\',\'low\',\'volume\']"', default="['open','high','low','volume']")
+    parser.add_argument('-y', '--y_value', metavar="", type=str, help='y value is the name of field in the dataset that your model will predict. Default: "adj_close"', default="adj_close")
+    parser.add_argument('-hl', '--hidden_layers', metavar="", type=int, help='hidden_layers is the number of internal layers of your model. Default: 1', default=1)
+    parser.add_argument('-u', '--units', metavar="", type=int, help='units is the number of neurons of you hidden layers. Default: 64', default=64)
+    parser.add_argument('-w', '--window', metavar="", type=int, help='window is the number of past rows (timesteps) each LSTM sample looks back. Default: 20', default=20)
+    parser.add_argument('-e', '--epochs', metavar="", type=int, help='Epochs of each run, the first one (graph tracing) is not measured. Default: 4', default=4)
+    parser.add_argument('-b', '--batch_size', metavar="", type=int, help='Batch size. Default: 64', default=64)
+    parser.add_argument('-pr', '--profiles', metavar="", type=str, help='Profiles to be measured (between quotes and with no spaces), \'default\' is TensorFlow without profile. Default: "[\'default\',\'throughput\',\'latency\',\'shared-host\']"', default="['default','throughput','latency','shared-host']")
+    parser.add_argument('-np', '--processes', metavar="", type=int, help='Trainings running at the same time for each profile, as on a shared host. Default: 1', default=1)
+    parser.add_argument('-o', '--output', metavar="", type=str, help="File of the results (.csv or .json). Default: not saved", default='')
+    args = parser.parse_args()
+    profile_benchmark_values = {
+        # Dataset
+        "dataset_path" : args.dataset_path,
+        # Filtering the dataset with multiple companies stocks
+        "filter_stocks" : literal_eval(args.filter_stocks),
+        # Selecting the Features (x)
+        "features" : literal_eval(args.features),
+        # Select predict values (y)
+        "y_value" : args.y_value,
+        # Number of hidden layers
+        "hidden_layers" : args.hidden_layers,
+        # Number of neurons for each layer
+        "units" : args.units,
+        # Number of timesteps in each LSTM sample
+        "window" : args.window,
+        # Number of epochs
+        "epochs" : args.epochs,
+        # Batch size
+        "batch_size" : args.batch_size,
+        # Profiles to be measured
+        "profiles" : literal_eval(args.profiles),
+        # Trainings at the same time
+        "processes" : args.processes,
+        # Results file
+        "output" : args.output
+    }
+    return SimpleNamespace(**profile_benchmark_values)
+
+def benchmark_command_line_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--rows', metavar="", type=str, help='List of dataset sizes (between quotes and with no spaces). Default: "[10000,100000,1000000,10000000]"', default="[10000,100000,1000000,10000000]")
+    parser.add_argument('-sy', '--symbols', metavar="", type=str, help='List of numbers of symbols of each dataset (between quotes and with no spaces), None gives one symbol by 2500 rows. Default: "[None]"', default="[None]")
+    parser.add_argument('-u', '--units', metavar="", type=str, help='List of numbers of neurons of the hidden layers (between quotes and with no spaces). Default: "[10]"', default="[10]")
+    parser.add_argument('-hl', '--hidden_layers', metavar="", type=str, help='List of numbers of hidden layers (between quotes and with no spaces). Default: "[1]"', default="[1]")
+    parser.add_argument('-w', '--window', metavar="", type=int, help='window is the number of past rows (timesteps) each LSTM sample looks back. Default: 10', default=10)
+    parser.add_argument('-e', '--epochs', metavar="", type=int, help='Epochs of the fit stage. Default: 1', default=1)
+    parser.add_argument('-b', '--batch_size', metavar="", type=int, help='Batch size. Default: 32', default=32)
+    parser.add_argument('-rp', '--repeats', metavar="", type=int, help='Runs of each stage, the median time is reported. Default: 3', default=3)
+    parser.add_argument('-nc', '--no_cache', action='store_true', help='Parses the CSV in load_csv instead of reading the Parquet cache')
+    parser.add_argument('-df', '--data_folder', metavar="", type=str, help="Folder of the synthetic datasets. Default: 'data/benchmark'", default='data/benchmark')
+    parser.add_argument('-bl', '--baseline', metavar="", type=str, help="Baseline file compared with the results. Default: 'save/benchmark-baseline.json'", default='save/benchmark-baseline.json')
+    parser.add_argument('-sv', '--save_baseline', action='store_true', help='Saves the results as the new baseline')
+    parser.add_argument('-tl', '--tolerance', metavar="", type=float, help='A stage slower than tolerance times its baseline is a regression (exit code 1). Default: 1.25', default=1.25)
+    parser.add_argument('-o', '--output', metavar="", type=str, help="File of the results (.csv or .json). Default: not saved", default='')
+    args = parser.parse_args()
+    benchmark_values = {
+        # Sizes of the synthetic datasets
+        "rows" : literal_eval(args.rows),
+        # Numbers of symbols of the synthetic datasets
+        "symbols" : literal_eval(args.symbols),
+        # Numbers of neurons
+        "units" : literal_eval(args.units),
+        # Numbers of hidden layers
+        "hidden_layers" : literal_eval(args.hidden_layers),
+        # Number of timesteps in each LSTM sample
+        "window" : args.window,
+        # Number of epochs
+        "epochs" : args.epochs,
+        # Batch size
+        "batch_size" : args.batch_size,
+        # Runs of each stage
+        "repeats" : args.repeats,
+        # Reading the Parquet cache in load_csv
+        "use_cache" : not args.no_cache,
+        # Folder of the synthetic datasets
+        "data_folder" : args.data_folder,
+        # Baseline file
+        "baseline" : args.baseline,
+        # Saving the results as baseline
+        "save_baseline" : args.save_baseline,
+        # Ratio accepted over the baseline
+        "tolerance" : args.tolerance,
+        # Results file
+        "output" : args.output
+    }
+    return SimpleNamespace(**benchmark_values)
@@ -0,0 +1,165 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+except ImportError:  # pyarrow is optional, without it the CSV is parsed on every load
+    pa = None
+
+# Threads of the same process (e.g. training jobs) build the cache only once. Reentrant: a derived cache (see
+# FeatureCache) builds the dataset cache while holding it
+build_lock = threading.RLock()
+# Names of the Parquet files, the files of the CSV sort before the appended ones and these in the order of the appends
+BASE_TEMPLATE = 'base-{i}.parquet'
+APPEND_TEMPLATE = 'data-%020d-%d.parquet'
+
+
+class DatasetCache:
+    """
+    Columnar cache of a CSV file. The CSV is converted once to a Parquet dataset partitioned by one column
+    (the stock symbol), so a load only reads the partitions, rows and columns that were asked for.
+    The cache folder is named after the modification time and size of the CSV, a changed CSV creates a new cache.
+    """
+    source_path: str
+    cache_dir: str
+    partition_column: str
+
+    def __init__(self, source_path, cache_dir=None, partition_column='stock_symbol'):
+        """
+        :param source_path: Path of the CSV file
+        :param cache_dir: Folder of the caches. Default: 'cache' beside the CSV
+        :param partition_column: Column used to split the Parquet files
+        """
+        self.source_path = source_path
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(source_path) or '.', 'cache')
+        self.partition_column = partition_column
+
+    @staticmethod
+    def available():
+        return pa is not None
+
+    def key(self):
+        stat = os.stat(self.source_path)
+        return '%x-%x' % (stat.st_mtime_ns, stat.st_size)
+
+    def path(self):
+        name = os.path.splitext(os.path.basename(self.source_path))[0]
+        return os.path.join(self.cache_dir, '%s-%s' % (name, self.key()))
+
+    def build(self):
+        """
+        Converts the CSV to the partitioned Parquet dataset, old caches of the same CSV are removed
+        :return: Path of the cache
+        """
+        path = self.path()
+        if os.path.isdir(path):
+            return path
+
+        with build_lock:
+            if os.path.isdir(path):
+                return path
+            name = os.path.splitext(os.path.basename(self.source_path))[0]
+            # Caches of this version of the CSV are named after the dataset cache (see FeatureCache)
+            current = os.path.basename(DatasetCache.path(self))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for entry in os.listdir(self.cache_dir):
+                if entry.startswith(name + '-') and '.tmp-' not in entry and entry != current and \
+                        not entry.startswith(current + '-'):
+                    shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+
+            # Writing in a temporary folder, a concurrent reader never sees a half written cache
+            table = pa.Table.from_pandas(self.load_source(), preserve_index=False)
+            temporary_path = '%s.tmp-%s' % (path, uuid.uuid4().hex)
+            pq.write_to_dataset(table, temporary_path, partition_cols=[self.partition_column],
+                                basename_template=BASE_TEMPLATE)
+            try:
+                os.rename(temporary_path, path)
+            except OSError:
+                # Another process created the cache first
+                shutil.rmtree(temporary_path, ignore_errors=True)
+        return path
+
+    def load_source(self):
+        """
+        :return: DataFrame written to the cache
+        """
+        return pd.read_csv(self.source_path)
+
+    def source_columns(self):
+        """
+        :return: Columns of the cache, in the order of the CSV
+        """
+        return pd.read_csv(self.source_path, nrows=0).columns
+
+    def append(self, data_frame):
+        """
+        Adds rows to the cache (building it when needed) as new Parquet files in the partitions, the CSV isn't changed.
+        The caches computed from the dataset cache (e.g. FeatureCache) are removed, the next read builds them again
+        :param data_frame: Rows with the same columns of the CSV
+        """
+        path = self.build()
+        for entry in os.listdir(self.cache_dir):
+            if entry.startswith(os.path.basename(path) + '-') and '.tmp-' not in entry:
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+        schema = ds.dataset(path, format='parquet', partitioning='hive').schema
+        schema = schema.remove(schema.get_field_index(self.partition_column))
+        name = APPEND_TEMPLATE % (time.time_ns(), os.getpid())
+        for value, group in data_frame.groupby(self.partition_column, sort=False):
+            partition_path = os.path.join(path, '%s=%s' % (self.partition_column, value))
+            os.makedirs(partition_path, exist_ok=True)
+            table = pa.Table.from_pandas(group[schema.names], schema=schema, preserve_index=False)
+            pq.write_table(table, os.path.join(partition_path, name))
+
+    def read(self, filters=None, date_range=None, columns=None, date_column='date'):
+        """
+        Reads the cache (building it when needed) with the filters pushed down to the Parquet files
+        :param filters: Dictionary {column: value}, the value can be a list
+        :param date_range: Tuple (start, end) inclusive, None for an open side
+        :param columns: Columns to be read. Default: all
+        :param date_column: Column of the date
+        :return: DataFrame
+        """
+        dataset = ds.dataset(self.build(), format='parquet', partitioning='hive',
+                             filesystem=fs.LocalFileSystem(use_mmap=True))
+
+        conditions = []
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple)):
+                conditions.append(pc.field(column).isin(value))
+            else:
+                conditions.append(pc.field(column) == value)
+        if date_range:
+            start, end = date_range
+            if start is not None:
+                conditions.append(pc.field(date_column) >= start)
+            if end is not None:
+                conditions.append(pc.field(date_column) <= end)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        table = dataset.to_table(columns=columns, filter=expression)
+        # The partition column comes back as a dictionary, it is decoded to keep the CSV types
+        if self.partition_column in table.column_names:
+            index = table.column_names.index(self.partition_column)
+            table = table.set_column(index, self.partition_column,
+                                     table.column(self.partition_column).cast(pa.string()))
+        data_frame = table.to_pandas()
+        # Each stock ordered by date, also the caches written before the file names sorted in the order of the appends
+        if self.partition_column in data_frame.columns and date_column in data_frame.columns:
+            data_frame = data_frame.sort_values([self.partition_column, date_column], kind='stable',
+                                                ignore_index=True)
+
+        # Same column order as asked or as the CSV (the partition column is read as the last one)
+        if columns is None:
+            columns = self.source_columns()
+        return data_frame[list(columns)]
@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import sys
+import warnings
+
+# Profile applied to this process by ExecutionProfile.apply
+active_profile = None
+
+
+def bfloat16_supported():
+    """
+    True when the CPU has native bfloat16 instructions (AVX512-BF16 or AMX-BF16). Without them TensorFlow emulates
+    bfloat16 and the mixed precision is slower than float32
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        with open('/proc/cpuinfo') as file:
+            for line in file:
+                if line.startswith('flags'):
+                    flags = line.split()
+                    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+    except OSError:
+        pass
+    return False
+
+
+class ExecutionProfile:
+    """
+    Thread pools, oneDNN and precision of the TensorFlow runtime of a process. The thread pools are process-wide and
+    can only be set before the first TensorFlow operation, so a profile is applied once, when the process starts
+    """
+
+    def __init__(self, name, intra_op_threads=None, inter_op_threads=None, onednn=True, mixed_precision=False,
+                 processes=1):
+        """
+        :param intra_op_threads: Threads of one operation. Default: the thread budget of the process
+        :param inter_op_threads: Operations run at the same time. Default: TensorFlow default
+        :param onednn: Enables the oneDNN optimizations (TF_ENABLE_ONEDNN_OPTS)
+        :param mixed_precision: Trains with bfloat16 computations and float32 weights, when the CPU supports it
+        :param processes: Processes training at the same time on the host, the CPUs are split between them
+        """
+        self.name = name
+        self.processes = max(1, processes)
+        self.thread_budget = max(1, (multiprocessing.cpu_count() or 1) // self.processes)
+        self.intra_op_threads = min(intra_op_threads or self.thread_budget, self.thread_budget)
+        self.inter_op_threads = None if inter_op_threads is None else min(inter_op_threads, self.thread_budget)
+        self.onednn = onednn
+        self.mixed_precision = mixed_precision
+
+    def precision(self):
+        """
+        :return: Keras dtype policy of the layers: 'mixed_bfloat16' or 'float32'
+        """
+        return 'mixed_bfloat16' if self.mixed_precision and bfloat16_supported() else 'float32'
+
+    def environment(self):
+        """
+        Variables read when TensorFlow is imported, they also configure the processes started after apply
+        """
+        environment = {'TF_ENABLE_ONEDNN_OPTS': '1' if self.onednn else '0',
+                       'OMP_NUM_THREADS': str(self.intra_op_threads),
+                       'TF_NUM_INTRAOP_THREADS': str(self.intra_op_threads)}
+        if self.inter_op_threads:
+            environment['TF_NUM_INTEROP_THREADS'] = str(self.inter_op_threads)
+        return environment
+
+    def apply(self):
+        """
+        Configures this process and the processes it starts
+        :return: self
+        """
+        global active_profile
+        environment = self.environment()
+        # The oneDNN option is read when TensorFlow is imported, it's enabled by default on Linux x86
+        if 'tensorflow' in sys.modules and os.environ.get('TF_ENABLE_ONEDNN_OPTS', '1') != environment['TF_ENABLE_ONEDNN_OPTS']:
+            warnings.warn('TensorFlow was already imported, the oneDNN option only applies to new processes')
+        os.environ.update(environment)
+
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+            if self.inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+        except RuntimeError:
+            warnings.warn('TensorFlow runtime already initialized, the thread pools of profile %s were not set'
+                          % self.name)
+        active_profile = self
+        return self
+
+    def to_dict(self):
+        return {"name": self.name, "processes": self.processes, "thread_budget": self.thread_budget,
+                "intra_op_threads": self.intra_op_threads, "inter_op_threads": self.inter_op_threads,
+                "onednn": self.onednn, "precision": self.precision()}
+
+
+def get_profile(name, processes=1):
+    """
+    Profiles:
+    - throughput: every CPU for one training, two operations at the same time, bfloat16 when supported
+    - latency: every CPU for one operation at a time, float32 (no casts for small batches)
+    - shared-host: the CPUs split between processes trainings at the same time, one operation at a time,
+      bfloat16 when supported
+    :param name: 'throughput', 'latency' or 'shared-host'
+    :param processes: Processes training at the same time on the host. throughput and latency use one
+    """
+    if name == 'throughput':
+        return ExecutionProfile(name, inter_op_threads=2, mixed_precision=True)
+    if name == 'latency':
+        return ExecutionProfile(name, inter_op_threads=1, mixed_precision=False)
+    if name == 'shared-host':
+        return ExecutionProfile(name, inter_op_threads=1, mixed_precision=True, processes=processes)
+    raise ValueError("Unknown profile '%s', use 'throughput', 'latency' or 'shared-host'" % name)
+
+
+def apply_profile(name, processes=1):
+    """
+    Applies the profile to this process, see get_profile
+    """
+    return get_profile(name, processes=processes).apply()
+
+
+def get_precision():
+    """
+    :return: Keras dtype policy of the active profile, 'float32' without profile
+    """
+    return 'float32' if active_profile is None else active_profile.precision()
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from DatasetCache import DatasetCache
+from Fundamentals import add_fundamentals, is_fundamental, source_key
+
+PRICE_COLUMN = 'close'
+VOLUME_COLUMN = 'volume'
+
+# Features computed from the prices, selected by name in the features list like the columns of the CSV:
+# return, log_return, macd, macd_signal, macd_hist and rolling_mean_<n>, rolling_std_<n>, rsi_<n>, volume_zscore_<n>.
+# The names fundamental_<column> and sector_<name> are joined from the fundamentals (see Fundamentals)
+FIXED_FEATURES = {'return': PRICE_COLUMN, 'log_return': PRICE_COLUMN, 'macd': PRICE_COLUMN,
+                  'macd_signal': PRICE_COLUMN, 'macd_hist': PRICE_COLUMN}
+WINDOW_FEATURES = {'rolling_mean': PRICE_COLUMN, 'rolling_std': PRICE_COLUMN, 'rsi': PRICE_COLUMN,
+                   'volume_zscore': VOLUME_COLUMN}
+WINDOW_FEATURE_PATTERN = re.compile(r'^(%s)_(\d+)$' % '|'.join(WINDOW_FEATURES))
+
+# Spans of the exponential moving averages of the MACD
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+
+
+def parse_feature(name):
+    """
+    :return: Tuple (kind, window) of an engineered feature, window is None for the fixed ones. None for the other names
+    """
+    if name in FIXED_FEATURES:
+        return name, None
+    match = WINDOW_FEATURE_PATTERN.match(name)
+    if match and int(match.group(2)) > 0:
+        return match.group(1), int(match.group(2))
+    return None
+
+
+def is_engineered(name):
+    return parse_feature(name) is not None or is_fundamental(name)
+
+
+def engineered_features(features):
+    """
+    :return: The names of features that are computed by add_features, in the same order
+    """
+    return [feature for feature in features or [] if is_engineered(feature)]
+
+
+def required_columns(features):
+    """
+    :return: Columns of the dataset needed to compute the engineered features of the list
+    """
+    columns = []
+    for feature in engineered_features(features):
+        if is_fundamental(feature):
+            columns.append('date')
+            continue
+        kind = parse_feature(feature)[0]
+        columns.append(FIXED_FEATURES.get(kind) or WINDOW_FEATURES[kind])
+    return list(dict.fromkeys(columns))
+
+
+def add_features(data_frame, features, group_column='stock_symbol', data_folder='data'):
+    """
+    Computes the engineered features for each stock with grouped operations, the rows of each stock must be in date
+    order. The first rows of each stock have NaN while the windows are not complete
+    :param data_frame: DataFrame with the columns of required_columns
+    :param features: List of features, the names that aren't engineered are ignored
+    :param group_column: Column of the stock. Without it the rows are one series
+    :param data_folder: Folder of fundamentals.csv and securities.csv, only for the fundamentals
+    :return: Copy of the DataFrame with a column for each engineered feature
+    """
+    fundamentals = [feature for feature in engineered_features(features) if is_fundamental(feature)]
+    features = [feature for feature in engineered_features(features) if not is_fundamental(feature)]
+    data_frame = data_frame.copy()
+    if fundamentals:
+        joined = add_fundamentals(data_frame, fundamentals, data_folder, group_column=group_column)
+        for feature in fundamentals:
+            data_frame[feature] = joined[feature]
+    if not features:
+        return data_frame
+
+    # Positional index, the results of the grouped rolling operations are aligned by it
+    work = data_frame[required_columns(features)].reset_index(drop=True)
+    if group_column in data_frame.columns:
+        keys = data_frame[group_column].reset_index(drop=True)
+    else:
+        keys = pd.Series(0, index=work.index)
+    grouped = work.groupby(keys, sort=False)
+
+    def rolling(column, window):
+        return grouped[column].rolling(window).agg(['mean', 'std']).droplevel(0).sort_index()
+
+    def ewm(series, **kwargs):
+        return series.groupby(keys, sort=False).ewm(adjust=False, **kwargs).mean().droplevel(0).sort_index()
+
+    price = work[PRICE_COLUMN] if PRICE_COLUMN in work.columns else None
+    computed = {}
+    macd = None
+    for feature in features:
+        kind, window = parse_feature(feature)
+        if kind == 'return':
+            computed[feature] = grouped[PRICE_COLUMN].pct_change()
+        elif kind == 'log_return':
+            computed[feature] = np.log(price).groupby(keys, sort=False).diff()
+        elif kind in ('rolling_mean', 'rolling_std'):
+            computed[feature] = rolling(PRICE_COLUMN, window)[kind.split('_')[1]]
+        elif kind == 'rsi':
+            # Wilder smoothing of the gains and losses, a stock without changes has RSI 50
+            change = grouped[PRICE_COLUMN].diff()
+            gain = ewm(change.clip(lower=0), alpha=1 / window, min_periods=window)
+            loss = ewm(-change.clip(upper=0), alpha=1 / window, min_periods=window)
+            total = gain + loss
+            computed[feature] = (100 * gain / total.where(total > 0)).mask(total == 0, 50.0)
+        elif kind == 'volume_zscore':
+            statistics = rolling(VOLUME_COLUMN, window)
+            z_score = (work[VOLUME_COLUMN] - statistics['mean']) / statistics['std'].where(statistics['std'] > 0)
+            computed[feature] = z_score.mask(statistics['std'] == 0, 0.0)
+        else:
+            if macd is None:
+                macd = ewm(price, span=MACD_FAST, min_periods=MACD_SLOW) - ewm(price, span=MACD_SLOW,
+                                                                              min_periods=MACD_SLOW)
+                signal = ewm(macd, span=MACD_SIGNAL, min_periods=MACD_SIGNAL)
+                macd = {'macd': macd, 'macd_signal': signal, 'macd_hist': macd - signal}
+            computed[feature] = macd[kind]
+
+    for feature, values in computed.items():
+        data_frame[feature] = values.to_numpy(dtype=float)
+    return data_frame
+
+
+class FeatureCache(DatasetCache):
+    """
+    DatasetCache with the engineered features computed on every row of the dataset cache (the CSV and the appended
+    rows), one cache by set of features beside the cache of the dataset. The rolling windows are computed with the
+    whole history, a date range only filters the rows read. With fundamentals, the key of the cache also has the
+    versions of the fundamentals files
+    """
+    features: list
+
+    def __init__(self, source_path, features, cache_dir=None, partition_column='stock_symbol'):
+        """
+        :param features: Engineered features of the cache, the other names are ignored
+        """
+        super().__init__(source_path, cache_dir=cache_dir, partition_column=partition_column)
+        self.features = sorted(set(engineered_features(features)))
+
+    def data_folder(self):
+        return os.path.dirname(self.source_path) or '.'
+
+    def path(self):
+        key = ','.join(self.features)
+        if any(is_fundamental(feature) for feature in self.features):
+            key += '|' + source_key(self.data_folder())
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return '%s-features-%s' % (super().path(), digest)
+
+    def load_source(self):
+        # From the dataset cache and not the CSV, the rows added by DatasetCache.append also get the features
+        dataset = DatasetCache(self.source_path, cache_dir=self.cache_dir, partition_column=self.partition_column)
+        return add_features(dataset.read(), self.features, group_column=self.partition_column,
+                            data_folder=self.data_folder())
+
+    def source_columns(self):
+        return list(super().source_columns()) + self.features
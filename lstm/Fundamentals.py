@@ -0,0 +1,102 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+FUNDAMENTALS_FILE = 'fundamentals.csv'
+SECURITIES_FILE = 'securities.csv'
+FUNDAMENTAL_PREFIX = 'fundamental_'
+SECTOR_PREFIX = 'sector_'
+# Days between the end of a fiscal period and the publication of its report, a row only sees the reports already
+# published on its date (the annual reports are filed up to 60 days after the period)
+FILING_DELAY_DAYS = 60
+
+
+def snake_case(name):
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+def is_fundamental(name):
+    return name.startswith(FUNDAMENTAL_PREFIX) or name.startswith(SECTOR_PREFIX)
+
+
+def source_key(folder):
+    """
+    :return: Modification time and size of the fundamentals and securities files, a changed file changes the key
+    """
+    stats = [os.stat(os.path.join(folder, name)) for name in (FUNDAMENTALS_FILE, SECURITIES_FILE)]
+    return '-'.join('%x-%x' % (stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+
+def read_fundamentals(folder, filing_delay_days=FILING_DELAY_DAYS):
+    """
+    Reads the annual reports of fundamentals.csv, each numeric column is the feature FUNDAMENTAL_PREFIX + snake case
+    name (e.g. 'Earnings Per Share' is fundamental_earnings_per_share)
+    :return: DataFrame with symbol, known_date (period ending + filing delay) and the features, ordered by known_date
+    """
+    data_frame = pd.read_csv(os.path.join(folder, FUNDAMENTALS_FILE), index_col=0)
+    symbols = data_frame.pop('Ticker Symbol').astype(str)
+    period_ending = pd.to_datetime(data_frame.pop('Period Ending'))
+    data_frame = data_frame.select_dtypes('number')
+    data_frame.columns = [FUNDAMENTAL_PREFIX + snake_case(column) for column in data_frame.columns]
+    data_frame.insert(0, 'symbol', symbols)
+    data_frame.insert(1, 'known_date', period_ending + pd.Timedelta(days=filing_delay_days))
+    return data_frame.sort_values('known_date', kind='stable').reset_index(drop=True)
+
+
+def read_sectors(folder):
+    """
+    Reads the GICS sector of each symbol in securities.csv as one-hot features SECTOR_PREFIX + snake case name
+    (e.g. sector_information_technology)
+    :return: DataFrame indexed by symbol
+    """
+    securities = pd.read_csv(os.path.join(folder, SECURITIES_FILE), usecols=['Ticker symbol', 'GICS Sector'])
+    securities = securities.drop_duplicates('Ticker symbol').set_index('Ticker symbol')
+    sectors = pd.get_dummies(securities['GICS Sector'], dtype=float)
+    sectors.columns = [SECTOR_PREFIX + snake_case(column) for column in sectors.columns]
+    sectors.index = sectors.index.astype(str)
+    return sectors
+
+
+def add_fundamentals(data_frame, features, folder, group_column='stock_symbol', date_column='date'):
+    """
+    Adds the latest fundamentals already published on the date of each row (as-of join by symbol with merge_asof) and
+    the sector of the stock. The rows before the first report of a stock, and the stocks without fundamentals or
+    sector, get NaN
+    :param data_frame: DataFrame with the group and date columns
+    :param features: Names with FUNDAMENTAL_PREFIX or SECTOR_PREFIX, the other names are ignored
+    :param folder: Folder of fundamentals.csv and securities.csv
+    :return: DataFrame with a column for each feature, in the order of the rows of data_frame
+    """
+    features = [feature for feature in features if is_fundamental(feature)]
+    result = pd.DataFrame(index=data_frame.index)
+    fundamentals = [feature for feature in features if feature.startswith(FUNDAMENTAL_PREFIX)]
+    sectors = [feature for feature in features if feature.startswith(SECTOR_PREFIX)]
+    symbols = data_frame[group_column].astype(str).to_numpy()
+
+    if fundamentals:
+        reports = read_fundamentals(folder)
+        unknown = sorted(set(fundamentals) - set(reports.columns))
+        if unknown:
+            raise ValueError('Unknown fundamentals %s, the columns of %s are %s' % (
+                unknown, FUNDAMENTALS_FILE, ', '.join(reports.columns[2:])))
+        # Both sides ordered by date, each row takes the last report of its symbol known on that date
+        rows = pd.DataFrame({'symbol': symbols, 'date': pd.to_datetime(data_frame[date_column]).to_numpy(),
+                             'position': np.arange(len(data_frame))}).sort_values('date', kind='stable')
+        joined = pd.merge_asof(rows, reports[['symbol', 'known_date'] + fundamentals], left_on='date',
+                               right_on='known_date', by='symbol', direction='backward')
+        joined = joined.sort_values('position')
+        for feature in fundamentals:
+            result[feature] = joined[feature].to_numpy(dtype=float)
+
+    if sectors:
+        table = read_sectors(folder)
+        unknown = sorted(set(sectors) - set(table.columns))
+        if unknown:
+            raise ValueError('Unknown sectors %s, the sectors of %s are %s' % (
+                unknown, SECURITIES_FILE, ', '.join(table.columns)))
+        values = table[sectors].reindex(symbols)
+        for feature in sectors:
+            result[feature] = values[feature].to_numpy(dtype=float)
+    return result
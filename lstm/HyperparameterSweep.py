@@ -0,0 +1,184 @@
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from numpy.lib.stride_tricks import sliding_window_view
+from tensorflow.keras.callbacks import Callback, EarlyStopping  # type: ignore
+from LstmWrapper import build_model
+
+
+class MedianStopping(Callback):
+    """
+    Stops a trial when its best validation loss is worse than the median of the other trials at the same epoch.
+    The losses of every trial are shared through a multiprocessing Manager
+    """
+
+    def __init__(self, trial_id, history, lock, min_trials=3, grace_epochs=1):
+        """
+        :param history: Manager dict {epoch: {trial_id: best val_loss}}
+        :param lock: Manager lock protecting history
+        :param min_trials: Number of other trials needed at the epoch before a trial can be stopped
+        :param grace_epochs: First epochs where no trial is stopped
+        """
+        super().__init__()
+        self.trial_id = trial_id
+        self.history = history
+        self.lock = lock
+        self.min_trials = min_trials
+        self.grace_epochs = grace_epochs
+        self.best = math.inf
+        self.pruned = False
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.best = min(self.best, (logs or {}).get('val_loss', math.inf))
+        with self.lock:
+            losses = dict(self.history.get(epoch, {}))
+            others = list(losses.values())
+            losses[self.trial_id] = self.best
+            self.history[epoch] = losses
+        if epoch >= self.grace_epochs and len(others) >= self.min_trials and self.best > float(np.median(others)):
+            self.pruned = True
+            self.model.stop_training = True
+
+
+def run_trial(trial_id, params, data_info, target_info, n_splits, epochs, batch_size, patience, threads, history, lock,
+              min_trials):
+    """
+    Trains one trial inside a worker process. The scaled rows and the target are read from shared memory and the
+    windows are built as views, no copy of the dataset is made by the worker
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    data_memory = shared_memory.SharedMemory(name=data_info['name'])
+    target_memory = shared_memory.SharedMemory(name=target_info['name'])
+    try:
+        data = np.ndarray(data_info['shape'], dtype=data_info['dtype'], buffer=data_memory.buf)
+        target = np.ndarray(target_info['shape'], dtype=target_info['dtype'], buffer=target_memory.buf)
+
+        # Windows like LstmWrapper.generate_sequences, the window can be one of the swept parameters
+        window = params.get('window', 1)
+        horizon = params.get('horizon', 1)
+        n_samples = len(data) - window - horizon + 2
+        X = sliding_window_view(data, window, axis=0).swapaxes(1, 2)[:n_samples]
+        y = sliding_window_view(target, horizon)[window - 1:window - 1 + n_samples]
+        if horizon == 1:
+            y = y[:, 0]
+        # Same cut as the last TimeSeriesSplit fold
+        cut = n_samples - n_samples // (n_splits + 1)
+
+        model_params = {key: params[key] for key in ('hidden_layers', 'units', 'dropout', 'activation', 'optimizer',
+                                                     'precision') if key in params}
+        model = build_model((window, data.shape[1]), units_output=horizon, **model_params)
+        median_stopping = MedianStopping(trial_id, history, lock, min_trials=min_trials)
+        callbacks = [EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True), median_stopping]
+
+        start = time.time()
+        fit_history = model.fit(X[:cut], y[:cut], validation_data=(X[cut:], y[cut:]),
+                                epochs=params.get('epochs', epochs), batch_size=params.get('batch_size', batch_size),
+                                callbacks=callbacks, verbose=0)
+        val_loss = min(fit_history.history['val_loss'])
+        return {'trial': trial_id, **params, 'val_mse': val_loss, 'val_rmse': math.sqrt(val_loss),
+                'train_mse': float(fit_history.history['loss'][-1]), 'epochs_run': len(fit_history.history['loss']),
+                'pruned': median_stopping.pruned, 'seconds': time.time() - start}
+    finally:
+        data_memory.close()
+        target_memory.close()
+
+
+class HyperparameterSweep:
+    """
+    Runs trials of a search space in a process pool. The data is loaded, scaled and put in shared memory once
+    (by LstmWrapper.create_setting_model), the trials stop early with Keras EarlyStopping and with the median
+    stopping rule, and the results are written to a leaderboard
+    """
+
+    def __init__(self, lstm_wrapper, search_space, n_trials=None, seed=0):
+        """
+        :param lstm_wrapper: LstmWrapper with the data already loaded and scaled
+        :param search_space: Dictionary {parameter: list of values}, e.g. {'units': [10, 50], 'dropout': [0.01, 0.1]}.
+                             Parameters: hidden_layers, units, dropout, activation, optimizer, precision, epochs,
+                             batch_size, window and horizon
+        :param n_trials: Number of random combinations. Default: every combination (grid)
+        :param seed: Seed of the random combinations
+        """
+        self.lstm_wrapper = lstm_wrapper
+        self.search_space = search_space
+        self.n_trials = n_trials
+        self.seed = seed
+        self.results = []
+
+    def trials(self):
+        names = list(self.search_space)
+        grid = [dict(zip(names, values)) for values in itertools.product(*(self.search_space[name] for name in names))]
+        if self.n_trials is None or self.n_trials >= len(grid):
+            return grid
+        return random.Random(self.seed).sample(grid, self.n_trials)
+
+    @staticmethod
+    def share(array):
+        """
+        Copies the array to a new shared memory block
+        :return: The SharedMemory and the information to attach it
+        """
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[:] = array
+        return memory, {'name': memory.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+    def run(self, n_splits=5, epochs=10, batch_size=32, patience=3, workers=None, threads_per_worker=1, min_trials=3):
+        """
+        Runs every trial
+        :param n_splits: The validation set is the last TimeSeriesSplit fold
+        :param epochs: Maximum number of epochs, when 'epochs' isn't in the search space
+        :param patience: Patience of EarlyStopping
+        :param workers: Number of processes. Default: CPU count / threads_per_worker
+        :param threads_per_worker: TensorFlow intra-op threads for each process
+        :param min_trials: Trials needed at an epoch before the median stopping rule is applied
+        :return: Leaderboard DataFrame ordered by the validation MSE
+        """
+        if workers is None:
+            workers = max(1, (multiprocessing.cpu_count() or 1) // threads_per_worker)
+        data = self.lstm_wrapper.data_frame_scaled.to_numpy(dtype=np.float32)
+        target = self.lstm_wrapper.target_data_frame.to_numpy(dtype=np.float32).ravel()
+
+        data_memory, data_info = self.share(data)
+        target_memory, target_info = self.share(target)
+        context = multiprocessing.get_context('spawn')
+        try:
+            with context.Manager() as manager:
+                history = manager.dict()
+                lock = manager.Lock()
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    futures = [executor.submit(run_trial, trial_id, params, data_info, target_info, n_splits, epochs,
+                                               batch_size, patience, threads_per_worker, history, lock, min_trials)
+                               for trial_id, params in enumerate(self.trials())]
+                    self.results = [future.result() for future in futures]
+        finally:
+            data_memory.close()
+            data_memory.unlink()
+            target_memory.close()
+            target_memory.unlink()
+        return self.leaderboard()
+
+    def leaderboard(self):
+        return pd.DataFrame(self.results).sort_values('val_mse').reset_index(drop=True)
+
+    def save_leaderboard(self, path):
+        """
+        Writes the leaderboard as CSV, or JSON when the file name ends with .json
+        """
+        leaderboard = self.leaderboard()
+        if path.endswith('.json'):
+            with open(path, 'w') as file:
+                json.dump(leaderboard.to_dict(orient='records'), file, indent=2)
+        else:
+            leaderboard.to_csv(path, index=False)
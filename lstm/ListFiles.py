@@ -1,4 +1,4 @@
-import os
+from ModelRegistry import ModelRegistry
 
 class ListFiles:
     path_choose = None
@@ -8,13 +8,12 @@ class ListFiles:
         pass
 
     def list_files(self, fold_path='./save'):
-        index = 0
+        # The models come from the registry index, the .h5 files saved after the last listing are added to it first
+        registry = ModelRegistry(fold_path)
+        registry.scan()
         self.path_list = {}
-        for dirname, _, filenames in os.walk(fold_path):
-            for filename in filenames:
-                if filename.endswith(".h5"):
-                    self.path_list[index] = (os.path.join(dirname, filename))
-                    index += 1
+        for index, entry in enumerate(registry.entries()):
+            self.path_list[index] = entry['path']
 
     def choose_file(self, index):
         return self.path_list[index]
@@ -22,4 +21,3 @@ class ListFiles:
     def show_files(self):
         for item in self.path_list.items():
             print(item[0], '-', item[1])
-
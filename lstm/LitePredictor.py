@@ -0,0 +1,201 @@
+import json
+
+import numpy as np
+
+from ModelBundle import BUNDLE_EXTENSION, ModelBundle
+from ModelExport import METADATA_EXTENSION
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def hard_sigmoid(x):
+    return np.clip(x / 6 + 0.5, 0, 1)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': sigmoid,
+    'hard_sigmoid': hard_sigmoid,
+}
+
+
+def activation_function(name):
+    if name not in ACTIVATIONS:
+        raise ValueError("Activation '%s' isn't supported by the NumPy LSTM" % name)
+    return ACTIVATIONS[name]
+
+
+def lstm_forward(inputs, kernel, recurrent_kernel, bias, activation='tanh', recurrent_activation='sigmoid',
+                 return_sequences=False):
+    """
+    Forward pass of a Keras LSTM layer for a batch of sequences. The input projection of every timestep is one matrix
+    multiplication, only the recurrent projection runs timestep by timestep
+    :param inputs: Array (samples, timesteps, features)
+    :param kernel: Array (features, 4 * units), gates in the Keras order: input, forget, cell and output
+    :param recurrent_kernel: Array (units, 4 * units)
+    :param bias: Array (4 * units)
+    :return: Array (samples, units) or (samples, timesteps, units) with return_sequences
+    """
+    activation = activation_function(activation)
+    recurrent_activation = activation_function(recurrent_activation)
+    samples, timesteps, _ = inputs.shape
+    units = recurrent_kernel.shape[0]
+
+    projected = inputs @ kernel + bias
+    h = np.zeros((samples, units), dtype=inputs.dtype)
+    c = np.zeros((samples, units), dtype=inputs.dtype)
+    sequences = np.empty((samples, timesteps, units), dtype=inputs.dtype) if return_sequences else None
+    for step in range(timesteps):
+        z = projected[:, step] + h @ recurrent_kernel
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        c = f * c + i * activation(z[:, 2 * units:3 * units])
+        h = recurrent_activation(z[:, 3 * units:]) * activation(c)
+        if return_sequences:
+            sequences[:, step] = h
+    return sequences if return_sequences else h
+
+
+class NumpyLstmModel:
+    """
+    Sequential model of build_model (LSTM, Dropout and Dense layers) computed with NumPy, from the JSON and the weights
+    of a bundle
+    """
+
+    def __init__(self, model_json, weights):
+        model_config = json.loads(model_json)
+        if model_config['class_name'] != 'Sequential':
+            raise ValueError('Only Sequential models are supported by the NumPy LSTM, got %s' % model_config['class_name'])
+
+        self.layers = []
+        weights = [np.asarray(weight, dtype=np.float32) for weight in weights]
+        for layer in model_config['config']['layers']:
+            name, config = layer['class_name'], layer['config']
+            if name == 'LSTM':
+                if config.get('go_backwards') or config.get('stateful'):
+                    raise ValueError('go_backwards and stateful LSTM layers are not supported')
+                count = 3 if config.get('use_bias', True) else 2
+                layer_weights, weights = weights[:count], weights[count:]
+                if count == 2:
+                    layer_weights.append(np.zeros(layer_weights[0].shape[1], dtype=np.float32))
+                self.layers.append((name, config, layer_weights))
+            elif name == 'Dense':
+                count = 2 if config.get('use_bias', True) else 1
+                layer_weights, weights = weights[:count], weights[count:]
+                if count == 1:
+                    layer_weights.append(np.zeros(layer_weights[0].shape[1], dtype=np.float32))
+                self.layers.append((name, config, layer_weights))
+            elif name not in ('InputLayer', 'Dropout'):
+                # Dropout does nothing when predicting
+                raise ValueError("Layer '%s' isn't supported by the NumPy LSTM" % name)
+
+    def __call__(self, x):
+        for name, config, weights in self.layers:
+            if name == 'LSTM':
+                x = lstm_forward(x, *weights, activation=config.get('activation', 'tanh'),
+                                 recurrent_activation=config.get('recurrent_activation', 'sigmoid'),
+                                 return_sequences=config.get('return_sequences', False))
+            else:
+                x = activation_function(config.get('activation', 'linear'))(x @ weights[0] + weights[1])
+        return x
+
+
+class LitePredictor:
+    """
+    Predicts with a model exported by LstmWrapper.export without importing Keras or TensorFlow: a NumPy LSTM for the
+    bundles (.lstm.npz), LiteRT for .tflite and ONNX Runtime for .onnx. The windows are scaled with the saved scaler
+    """
+
+    def __init__(self, metadata, scale_min, scale, run):
+        """
+        :param metadata: Settings of the model (features, window, horizon, ...)
+        :param scale_min: min_ of the fitted MinMaxScaler
+        :param scale: scale_ of the fitted MinMaxScaler
+        :param run: Function from the scaled windows (float32) to the predictions
+        """
+        self.metadata = metadata
+        self.scale_min = np.asarray(scale_min, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.run = run
+
+    @property
+    def features(self):
+        return self.metadata['features']
+
+    @property
+    def window(self):
+        return self.metadata['window']
+
+    @property
+    def horizon(self):
+        return self.metadata['horizon']
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a file written by LstmWrapper.export, the runtime is chosen by the extension
+        """
+        if path.endswith(BUNDLE_EXTENSION) or path.endswith('.npz'):
+            bundle = ModelBundle.load(path)
+            model = NumpyLstmModel(bundle.metadata['model_json'], bundle.weights)
+            return cls(bundle.metadata, bundle.scale_min, bundle.scale, model)
+
+        with open(path + METADATA_EXTENSION) as file:
+            metadata = json.load(file)
+        if path.endswith('.tflite'):
+            run = cls.tflite_runner(path)
+        elif path.endswith('.onnx'):
+            run = cls.onnx_runner(path)
+        else:
+            raise ValueError('Unknown model file %s, expected %s, .tflite or .onnx' % (path, BUNDLE_EXTENSION))
+        return cls(metadata, metadata['scaler']['min'], metadata['scaler']['scale'], run)
+
+    @staticmethod
+    def tflite_runner(path):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                raise ImportError('The tflite format needs LiteRT: pip install ai-edge-litert')
+        interpreter = Interpreter(model_path=path)
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        shape = [None]
+
+        def run(windows):
+            # The interpreter is allocated again only when the number of windows changes
+            if shape[0] != windows.shape:
+                interpreter.resize_tensor_input(input_index, windows.shape)
+                interpreter.allocate_tensors()
+                shape[0] = windows.shape
+            interpreter.set_tensor(input_index, windows)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index)
+        return run
+
+    @staticmethod
+    def onnx_runner(path):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError('The onnx format needs ONNX Runtime: pip install onnxruntime')
+        session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        return lambda windows: session.run(None, {input_name: windows})[0]
+
+    def predict(self, windows):
+        """
+        :param windows: Array (samples, window, features) with values not scaled
+        :return: Array (samples, horizon)
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim != 3 or windows.shape[1:] != (self.window, len(self.features)):
+            raise ValueError('Expected windows with shape (samples, %d, %d), got %s' % (
+                self.window, len(self.features), windows.shape))
+        return np.asarray(self.run(windows * self.scale + self.scale_min), dtype=np.float32)
@@ -1,12 +1,79 @@
+import copy
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
+import tensorflow as tf
 
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.preprocessing import MinMaxScaler
 from tensorflow.keras.models import Sequential  # type: ignore
 from tensorflow.keras.layers import Dense, LSTM, Dropout  # type: ignore
-from tensorflow.keras.models import load_model
+from tensorflow.keras.models import clone_model, load_model
 from pandas import DataFrame
+from DatasetCache import DatasetCache
+from FeatureEngineering import FeatureCache, add_features, engineered_features, required_columns
+from BatchPredictor import BatchPredictor
+from ModelBundle import ModelBundle, save_bundle
+from ModelExport import export_model
+from ExecutionProfile import get_precision
+
+# Column of the day of each row, update ignores the days already loaded
+DATE_COLUMN = 'date'
+
+
+def build_model(input_shape, hidden_layers=1, units=10, dropout=0.01, units_output=1, activation='relu', optimizer='adam',
+                loss='mean_squared_error', precision='float32'):
+    """
+    :param precision: Keras dtype policy of the LSTM layers, 'float32' or 'mixed_bfloat16' (see ExecutionProfile)
+    """
+    model = Sequential()
+    # Creating the first layer, only the last LSTM layer collapses the sequence
+    model.add(LSTM(units=units, return_sequences=hidden_layers > 0, activation=activation, input_shape=input_shape,
+                   dtype=precision))
+    # Creating neurons for the hidden layers
+    for size in range(hidden_layers):
+        # Adding hidden layers
+        model.add(LSTM(units=units, return_sequences=size < hidden_layers - 1, activation=activation, dtype=precision))
+        # Dropout
+        model.add(Dropout(dropout, dtype=precision))
+
+    # Adding output layer, kept in float32 so the loss isn't computed in bfloat16
+    model.add(Dense(units=units_output, dtype='float32'))
+
+    # Compiling RNN type LSTM
+    model.compile(optimizer=optimizer, loss=loss)
+    return model
+
+
+def copy_model(model):
+    """
+    Copy of the model with its own weights and optimizer, training it doesn't change a model shared with others (e.g.
+    the LRU cache of ModelRegistry)
+    """
+    copied = clone_model(model)
+    copied.set_weights(model.get_weights())
+    if model.optimizer is not None:
+        copied.compile(optimizer=model.optimizer.__class__.from_config(model.optimizer.get_config()), loss=model.loss)
+    return copied
+
+
+def train_fold(fold, model_params, X_train, y_train, X_test, y_test, epochs, batch_size, threads):
+    """
+    Trains and scores one walk-forward fold. Runs inside a worker process, so TensorFlow thread pools
+    are capped before any operation is created.
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    model = build_model((X_train.shape[1], X_train.shape[2]), **model_params)
+    model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, verbose=0)
+    mse = float(model.evaluate(X_test, y_test, verbose=0))
+    return {'fold': fold, 'train_size': len(X_train), 'test_size': len(X_test), 'mse': mse, 'rmse': math.sqrt(mse)}
 
 
 class LstmWrapper:
@@ -14,19 +81,65 @@ class LstmWrapper:
     data_frame_loaded = False
     data_frame_scaled: DataFrame
     target_data_frame: DataFrame
+    X, y = None, None
     X_train, y_train, X_test, y_test = None, None, None, None
+    train_dataset, test_dataset = None, None
+    scaler: MinMaxScaler = None
     features = None
+    dataset_path = None
+    n_splits = 20
+    y_value = None
+    filter_stocks = None
+    window = 1
+    horizon = 1
     model: Sequential
+    model_params = None
 
     def __init__(self):
         pass
 
-    def load_csv(self, path):
+    def load_csv(self, path, filters=None, date_range=None, columns=None, use_cache=True):
         """
-        Loads a CSV file to a Pandas DataFrame
+        Loads a CSV file to a Pandas DataFrame. With pyarrow installed the CSV is converted once to a Parquet cache
+        (see DatasetCache) and only the asked stocks, dates and columns are read from it.
+        The columns can be engineered features (see FeatureEngineering), computed for each stock and cached with the
+        dataset, the first rows of each stock are dropped while the windows of the features are not complete
         :param path: Path relative for a CSV file
+        :param filters: Dictionary {column: value}, the value can be a list
+        :param date_range: Tuple (start, end) with ISO dates, inclusive
+        :param columns: Columns to be loaded. Default: all
+        :param use_cache: False always parses the CSV
         """
-        self.data_frame = pd.read_csv(path)
+        self.dataset_path = path
+        engineered = engineered_features(columns)
+        if use_cache and DatasetCache.available():
+            cache = FeatureCache(path, engineered) if engineered else DatasetCache(path)
+            self.data_frame = cache.read(filters=filters, date_range=date_range, columns=columns)
+        else:
+            usecols = None
+            if columns is not None:
+                usecols = list(dict.fromkeys([column for column in columns if column not in engineered] +
+                                             list(filters or {}) + (['date'] if date_range else []) +
+                                             required_columns(engineered) + ['stock_symbol']))
+            data_frame = pd.read_csv(path, usecols=None if usecols is None else lambda column: column in usecols)
+            for column, value in (filters or {}).items():
+                if isinstance(value, (list, tuple)):
+                    data_frame = data_frame[data_frame[column].isin(value)]
+                else:
+                    data_frame = data_frame[data_frame[column] == value]
+            # Computed before the date range, the windows start in the previous rows as with the cache
+            data_frame = add_features(data_frame, engineered, data_folder=os.path.dirname(path) or '.')
+            if date_range:
+                start, end = date_range
+                if start is not None:
+                    data_frame = data_frame[data_frame['date'] >= start]
+                if end is not None:
+                    data_frame = data_frame[data_frame['date'] <= end]
+            self.data_frame = data_frame if columns is None else data_frame[list(columns)]
+        if engineered:
+            self.data_frame = self.data_frame.dropna(subset=engineered)
+            if not len(self.data_frame):
+                raise ValueError('No rows with every feature of %s (e.g. a stock without fundamentals)' % engineered)
         self.data_frame_loaded = True
 
     def filter_data_frame(self, field_name, filter_text):
@@ -46,65 +159,379 @@ class LstmWrapper:
 
     def generate_min_max_scaler(self, data_frame):
         # Scaling Min-Max
-        scaler = MinMaxScaler()
-        data_frame_scaled = scaler.fit_transform(data_frame[self.features])
+        self.scaler = MinMaxScaler()
+        data_frame_scaled = self.scaler.fit_transform(data_frame[self.features])
         self.data_frame_scaled = pd.DataFrame(columns=self.features, data=data_frame_scaled, index=data_frame.index)
 
     def generate_target_data_frame(self, data_frame, variable):
+        self.y_value = variable
         self.target_data_frame = pd.DataFrame(data_frame[variable])
 
+    def set_window(self, window=1, horizon=1):
+        """
+        Sets the lookback window and the forecast horizon used to build the LSTM sequences
+        :param window: Number of consecutive rows (timesteps) each sample looks back
+        :param horizon: Number of target values predicted for each sample, starting at the last row of the window
+        """
+        if window < 1 or horizon < 1:
+            raise ValueError('window and horizon must be greater than zero')
+        self.window = window
+        self.horizon = horizon
+
+    def generate_sequences(self, data, target):
+        """
+        Builds the LSTM samples as strided views over the scaled data, no window is copied
+        :param data: 2D array (rows, features)
+        :param target: 1D array (rows) with the value to be predicted
+        :return: X with shape (samples, window, features) and y with shape (samples,) or (samples, horizon)
+        """
+        n_samples = len(data) - self.window - self.horizon + 2
+        if n_samples < 1:
+            raise ValueError('Not enough rows (%d) for window=%d and horizon=%d' % (len(data), self.window, self.horizon))
+
+        # sliding_window_view returns (rows - window + 1, features, window), swapping the axes is still a view
+        X = sliding_window_view(data, self.window, axis=0).swapaxes(1, 2)[:n_samples]
+        # Targets start at the last row of each window
+        y = sliding_window_view(target, self.horizon)[self.window - 1:self.window - 1 + n_samples]
+        if self.horizon == 1:
+            y = y[:, 0]
+        return X, y
+
     def generate_train_test(self, target_data_frame=None, n_splits=20):
         # Set Target Variable
-        if not target_data_frame:
+        if target_data_frame is None:
             target_data_frame = self.target_data_frame
 
-        # Splitting to Training set and Test set
+        self.n_splits = n_splits
+        # Building the windows over the scaled values
+        self.X, self.y = self.generate_sequences(self.data_frame_scaled.to_numpy(), target_data_frame.to_numpy().ravel())
+
+        # Splitting to Training set and Test set, the last fold keeps the largest training set
         time_split = TimeSeriesSplit(n_splits=n_splits)
+        train_index, test_index = list(time_split.split(self.X))[-1]
+        train, test = slice(0, len(train_index)), slice(test_index[0], test_index[-1] + 1)
+        self.X_train, self.X_test = self.X[train], self.X[test]
+        self.y_train, self.y_test = self.y[train], self.y[test]
+
+    def create_model(self, hidden_layers=1, units=10, dropout=0.01, units_output=None, activation='relu', optimizer='adam',
+                     loss='mean_squared_error', precision=None):
+        """
+        :param precision: Keras dtype policy of the LSTM layers. Default: the one of the execution profile of the
+                          process (see ExecutionProfile.apply_profile), float32 without profile
+        """
+        # One output neuron for each step of the horizon
+        if units_output is None:
+            units_output = self.horizon
 
-        for train_index, test_index in time_split.split(self.data_frame_scaled):
-            self.X_train, self.X_test = self.data_frame_scaled[:len(train_index)], self.data_frame_scaled[
-                                                                                   len(train_index): (
-                                                                                               len(train_index) + len(
-                                                                                           test_index))]
-            self.y_train, self.y_test = target_data_frame[:len(train_index)].values.ravel(), target_data_frame[
-                                                                                             len(train_index): (
-                                                                                                         len(train_index) + len(
-                                                                                                     test_index))].values.ravel()
-
-        # Process the data for LSTM
-        train_X = np.array(self.X_train)
-        test_X = np.array(self.X_test)
-        self.X_train = train_X.reshape(self.X_train.shape[0], 1, self.X_train.shape[1])
-        self.X_test = test_X.reshape(self.X_test.shape[0], 1, self.X_test.shape[1])
-
-    def create_model(self, hidden_layers=1, units=10, dropout=0.01, units_output=1, activation='relu', optimizer='adam',
-                     loss='mean_squared_error'):
-        self.model = Sequential()
-        # Creating the first layer
-        self.model.add(LSTM(units=units, return_sequences=True, activation=activation,
-                            input_shape=(self.X_train.shape[1], self.X_train.shape[2])))
-        # Creating neurons for the hidden layers
-        for size in range(hidden_layers):
-            # Adding hidden layers
-            self.model.add(LSTM(units=units, return_sequences=True, activation=activation))
-            # Dropout
-            self.model.add(Dropout(dropout))
-
-        # Adding output layer with one neuron
-        self.model.add(Dense(units=units_output))
-
-        # Compiling RNN type LSTM
-        self.model.compile(optimizer=optimizer, loss=loss)
+        self.model_params = {'hidden_layers': hidden_layers, 'units': units, 'dropout': dropout,
+                             'units_output': units_output, 'activation': activation, 'optimizer': optimizer,
+                             'loss': loss, 'precision': precision or get_precision()}
+        self.model = build_model((self.window, len(self.features)), **self.model_params)
         return self.model
 
-    def fit(self, epochs=10, batch_size=32):
+    def prepare_dataset(self, dataset, batch_size=32, shuffle_buffer=0, cache=False):
+        """
+        Finishes a tf.data pipeline of (window, target) samples
+        :param dataset: Unbatched tf.data.Dataset
+        :param batch_size: Number of samples by batch
+        :param shuffle_buffer: 0 keeps the time order, otherwise shuffles the windows inside a buffer of this size
+        :param cache: False, True to cache in memory or a file name to cache on disk
+        :return: Batched and prefetched tf.data.Dataset
+        """
+        if cache:
+            dataset = dataset.cache('' if cache is True else cache)
+        if shuffle_buffer:
+            dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    def generate_dataset(self, start=0, stop=None, batch_size=32, shuffle_buffer=0, cache=False):
+        """
+        Streams the windows [start, stop) from the scaled DataFrame. Only the scaled rows are copied to TensorFlow,
+        each window is sliced when the batch is requested
+        :param start: Index of the first window
+        :param stop: Index after the last window. Default: all the windows
+        :return: Batched and prefetched tf.data.Dataset
+        """
+        if stop is None:
+            stop = len(self.X)
+        window = self.window
+        rows = tf.constant(self.data_frame_scaled.to_numpy()[start:stop + window - 1], dtype=tf.float32)
+        targets = tf.constant(self.y[start:stop], dtype=tf.float32)
+        dataset = tf.data.Dataset.range(stop - start).map(lambda i: (rows[i:i + window], targets[i]),
+                                                          num_parallel_calls=tf.data.AUTOTUNE)
+        return self.prepare_dataset(dataset, batch_size=batch_size, shuffle_buffer=shuffle_buffer, cache=cache)
+
+    def generate_csv_dataset(self, dataset_path: str, filter_stocks: dict, features: list, y_value: str, n_splits=5,
+                             chunksize=100000, batch_size=32, shuffle_buffer=0, cache=True):
+        """
+        Builds the train and test tf.data pipelines reading the CSV in chunks, so the dataset is never fully loaded.
+        A first pass fits the scaler, the second pass streams the windows (on each epoch, unless cached)
+        :param filter_stocks: Column name and value to be filtered, 'field_text' can be a list with many stocks
+        :param chunksize: Number of CSV rows read at once
+        """
+        if engineered_features(features):
+            raise ValueError('Engineered features (%s) need the whole history of each stock, use load_csv'
+                             % ', '.join(engineered_features(features)))
+        self.set_features(features)
+        field_name = filter_stocks['filed_name']
+        field_text = filter_stocks['field_text']
+        filter_texts = field_text if isinstance(field_text, list) else [field_text]
+        columns = list(dict.fromkeys([field_name] + features + [y_value]))
+
+        def read_chunks():
+            for chunk in pd.read_csv(dataset_path, usecols=columns, chunksize=chunksize):
+                chunk = chunk[chunk[field_name].isin(filter_texts)]
+                if len(chunk):
+                    yield chunk
+
+        # First pass: scaler bounds and rows of each stock
+        self.scaler = MinMaxScaler()
+        rows = {}
+        for chunk in read_chunks():
+            self.scaler.partial_fit(chunk[features])
+            for name, count in chunk[field_name].value_counts().items():
+                rows[name] = rows.get(name, 0) + count
+
+        # Same cut as the last TimeSeriesSplit fold, computed for each stock
+        split = {}
+        for name, count in rows.items():
+            n_samples = count - self.window - self.horizon + 2
+            split[name] = n_samples - n_samples // (n_splits + 1)
+
+        tail_size = self.window + self.horizon - 2
+
+        def windows(train):
+            # Rows of the previous chunk needed to complete the windows of each stock
+            tails = {}
+            produced = {}
+            for chunk in read_chunks():
+                for name, group in chunk.groupby(field_name, sort=False):
+                    data = self.scaler.transform(group[features]).astype(np.float32)
+                    target = group[y_value].to_numpy(dtype=np.float32)
+                    if name in tails:
+                        data = np.concatenate([tails[name][0], data])
+                        target = np.concatenate([tails[name][1], target])
+                    tails[name] = (data[len(data) - tail_size:], target[len(target) - tail_size:])
+                    if len(data) <= tail_size:
+                        continue
+
+                    X, y = self.generate_sequences(data, target)
+                    first = produced.get(name, 0)
+                    produced[name] = first + len(X)
+                    cut = min(max(split[name] - first, 0), len(X))
+                    X, y = (X[:cut], y[:cut]) if train else (X[cut:], y[cut:])
+                    if len(X):
+                        yield np.ascontiguousarray(X), np.ascontiguousarray(y)
+
+        signature = (tf.TensorSpec(shape=(None, self.window, len(features)), dtype=tf.float32),
+                     tf.TensorSpec(shape=(None,) if self.horizon == 1 else (None, self.horizon), dtype=tf.float32))
+        self.X_train, self.y_train, self.X_test, self.y_test = None, None, None, None
+        self.train_dataset = self.prepare_dataset(
+            tf.data.Dataset.from_generator(lambda: windows(True), output_signature=signature).unbatch(),
+            batch_size=batch_size, shuffle_buffer=shuffle_buffer, cache=cache)
+        self.test_dataset = self.prepare_dataset(
+            tf.data.Dataset.from_generator(lambda: windows(False), output_signature=signature).unbatch(),
+            batch_size=batch_size, cache=cache)
+
+    def fit(self, epochs=10, batch_size=32, use_dataset=False, shuffle_buffer=0, cache=False, callbacks=None, verbose='auto'):
+        """
+        Trains the model
+        :param use_dataset: Streams the windows with tf.data instead of passing the NumPy arrays to Keras
+        :param shuffle_buffer: Only for tf.data, 0 keeps the time order
+        :param cache: Only for tf.data, False, True (memory) or a file name
+        :param callbacks: List of Keras callbacks
+        :param verbose: Keras verbose mode
+        """
+        if self.X_train is not None and use_dataset:
+            self.train_dataset = self.generate_dataset(0, len(self.X_train), batch_size=batch_size,
+                                                       shuffle_buffer=shuffle_buffer, cache=cache)
+            self.test_dataset = self.generate_dataset(len(self.X_train), len(self.X_train) + len(self.X_test),
+                                                      batch_size=batch_size, cache=cache)
+
         # Predicting
-        self.model.fit(self.X_train, self.y_train, epochs=epochs, batch_size=batch_size)
+        if use_dataset or self.X_train is None:
+            self.model.fit(self.train_dataset, epochs=epochs, callbacks=callbacks, verbose=verbose)
+        else:
+            self.model.fit(self.X_train, self.y_train, epochs=epochs, batch_size=batch_size, callbacks=callbacks,
+                           verbose=verbose)
+
+    def train_size(self):
+        """
+        :return: Number of training samples, None when the training set is only a tf.data dataset
+        """
+        return None if self.X_train is None else len(self.X_train)
 
     def evaluate(self, verbose=0):
         # Evaluating the model
+        if self.X_train is None:
+            return {'train': self.model.evaluate(self.train_dataset, verbose=verbose),
+                    'test': self.model.evaluate(self.test_dataset, verbose=verbose)}
         return {'train': self.model.evaluate(self.X_train, self.y_train, verbose=verbose),
-                'test': self.model.evaluate(self.X_test, self.y_test, verbose)}
+                'test': self.model.evaluate(self.X_test, self.y_test, verbose=verbose)}
+
+    def existing_dates(self, new_rows, group_column):
+        """
+        :return: Set with the dates (str) of the stock already loaded or in the Parquet cache, in the range of new_rows
+        """
+        dates = set(self.data_frame[DATE_COLUMN].astype(str))
+        if len(new_rows) and self.dataset_path and DatasetCache.available() and self.filter_stocks:
+            new_dates = new_rows[DATE_COLUMN].astype(str)
+            cached = DatasetCache(self.dataset_path, partition_column=group_column).read(
+                filters={group_column: self.filter_stocks['field_text']}, date_range=(new_dates.min(), new_dates.max()),
+                columns=[DATE_COLUMN], date_column=DATE_COLUMN)
+            dates.update(cached[DATE_COLUMN].astype(str))
+        return dates
+
+    def update(self, new_rows, epochs=3, recent_rows=250, allow_rescale=False, batch_size=32, registry=None, name=None):
+        """
+        Warm-start retraining with new rows (e.g. a new trading day): the rows are appended to the dataset (and to its
+        Parquet cache), a copy of the model is fine-tuned only on the most recent windows and replaces the model. The
+        rows of days already loaded are ignored, and nothing is changed when the fine-tuning or the append fail
+        :param new_rows: DataFrame with the columns of the dataset, rows of other stocks are ignored
+        :param epochs: Number of epochs of the fine-tuning
+        :param recent_rows: Number of last rows used by the fine-tuning, the new rows are always included
+        :param allow_rescale: When the new rows are out of the scaler bounds, True widens the bounds and scales every row
+                              again, False keeps the scaler (the new values are scaled out of [0, 1])
+        :param batch_size: Batch size of the fine-tuning
+        :param registry: ModelRegistry where the updated model is saved as a new version of name
+        :param name: Base name of the versions
+        :return: Dictionary with the rows added, the rescale flags, the loss of the fine-tuning and the version saved
+        """
+        group_column = (self.filter_stocks or {}).get('filed_name', 'stock_symbol')
+        if self.filter_stocks and group_column in new_rows.columns:
+            new_rows = new_rows[new_rows[group_column] == self.filter_stocks['field_text']]
+
+        # Everything is checked before the data, the model or the cache are changed
+        engineered = engineered_features(self.features)
+        missing = [column for column in self.data_frame.columns if column not in new_rows.columns and column not in engineered]
+        # The Parquet cache keeps every column of the CSV, also the ones not loaded
+        append = bool(self.dataset_path and DatasetCache.available() and self.filter_stocks)
+        if append:
+            cache_columns = DatasetCache(self.dataset_path, partition_column=group_column).source_columns()
+            missing += [column for column in cache_columns if column not in new_rows.columns and column not in missing]
+        if missing:
+            raise ValueError('The new rows have no %s' % missing)
+        # The days already loaded or cached are ignored, e.g. update called twice with the same day
+        if DATE_COLUMN in self.data_frame.columns:
+            keys = [column for column in (group_column, DATE_COLUMN) if column in new_rows.columns]
+            new_rows = new_rows.drop_duplicates(keys, keep='last')
+            new_rows = new_rows[~new_rows[DATE_COLUMN].astype(str).isin(self.existing_dates(new_rows, group_column))]
+        result = {'rows_added': len(new_rows), 'rescale_needed': False, 'rescaled': False, 'loss': None,
+                  'version': None}
+        if not len(new_rows):
+            return result
+
+        # The engineered features of the new rows are computed with the loaded rows, their windows start there
+        if engineered:
+            base_columns = list(dict.fromkeys([group_column] + required_columns(engineered)))
+            missing = [column for column in base_columns if column not in self.data_frame.columns]
+            if missing:
+                raise ValueError('The loaded rows have no %s to compute the features of the new rows' % missing)
+            rows = add_features(pd.concat([self.data_frame[base_columns], new_rows[base_columns]], ignore_index=True),
+                                engineered, group_column=group_column,
+                                data_folder=os.path.dirname(self.dataset_path or '') or '.')
+            new_rows = new_rows.copy()
+            for feature in engineered:
+                new_rows[feature] = rows[feature].to_numpy()[len(self.data_frame):]
+
+        # Restored when a step fails, the new rows are kept only with a fine-tuned model and in the cache
+        previous = {name: getattr(self, name, None) for name in ('data_frame', 'data_frame_scaled', 'target_data_frame',
+                                                                 'model', 'X', 'y', 'X_train', 'y_train', 'X_test',
+                                                                 'y_test')}
+        previous['scaler'] = copy.deepcopy(self.scaler)
+        try:
+            # The scaler only changes when the new values are out of its bounds, and only if allowed
+            values = new_rows[self.features].to_numpy(dtype=float)
+            result['rescale_needed'] = bool((values.min(axis=0) < self.scaler.data_min_).any() or
+                                            (values.max(axis=0) > self.scaler.data_max_).any())
+            self.data_frame = pd.concat([self.data_frame, new_rows[self.data_frame.columns]], ignore_index=True)
+            self.generate_target_data_frame(self.data_frame, self.y_value)
+            if result['rescale_needed'] and allow_rescale:
+                self.scaler.partial_fit(new_rows[self.features])
+                self.data_frame_scaled = pd.DataFrame(columns=self.features, index=self.data_frame.index,
+                                                      data=self.scaler.transform(self.data_frame[self.features]))
+                result['rescaled'] = True
+            else:
+                new_scaled = pd.DataFrame(columns=self.features, data=self.scaler.transform(new_rows[self.features]))
+                self.data_frame_scaled = pd.concat([self.data_frame_scaled, new_scaled], ignore_index=True)
+                self.data_frame_scaled.index = self.data_frame.index
+
+            # Fine-tuning on the recent windows only
+            tail = min(len(self.data_frame), max(recent_rows, len(new_rows)) + self.window + self.horizon - 2)
+            X, y = self.generate_sequences(self.data_frame_scaled.iloc[-tail:].to_numpy(),
+                                           self.target_data_frame.iloc[-tail:].to_numpy().ravel())
+            # The model can be shared (e.g. loaded from the registry cache), its copy is fine-tuned
+            model = copy_model(self.model)
+            history = model.fit(X, y, epochs=epochs, batch_size=batch_size, verbose=0)
+            result['loss'] = float(history.history['loss'][-1])
+            self.model = model
+
+            # Windows and split with the whole history, for evaluate
+            self.generate_train_test(n_splits=self.n_splits)
+
+            # Keeping the new rows with the cached dataset, the next loads already have them. Last step, it can't be
+            # undone
+            if append:
+                DatasetCache(self.dataset_path, partition_column=group_column).append(new_rows)
+        except Exception:
+            for name, value in previous.items():
+                setattr(self, name, value)
+            raise
+
+        if registry is not None and name:
+            result['version'] = registry.register_version(self, name, metrics={'fine_tune_loss': result['loss']})['name']
+        return result
+
+    def release_data(self):
+        """
+        Releases the loaded rows, the windows and the datasets. The model, the scaler and the settings are kept, enough
+        to predict, save and register the model
+        """
+        for name in ('data_frame', 'data_frame_scaled', 'target_data_frame'):
+            self.__dict__.pop(name, None)
+        self.data_frame_loaded = False
+        self.X, self.y = None, None
+        self.X_train, self.y_train, self.X_test, self.y_test = None, None, None, None
+        self.train_dataset, self.test_dataset = None, None
+
+    def create_predictor(self, max_batch_size=256, max_delay=0.002):
+        """
+        Creates a BatchPredictor with the trained model and the fitted scaler, the windows given to it are not scaled
+        :param max_batch_size: Maximum number of windows in one call of the model
+        :param max_delay: Maximum time (seconds) a request waits to be grouped with others
+        """
+        return BatchPredictor(self.model, self.scaler.min_, self.scaler.scale_, self.window, len(self.features),
+                              max_batch_size=max_batch_size, max_delay=max_delay)
+
+    def cross_validate(self, n_splits=5, workers=None, epochs=10, batch_size=32, threads_per_worker=1):
+        """
+        Walk-forward cross validation, each TimeSeriesSplit fold is trained in its own process
+        :param n_splits: Number of folds
+        :param workers: Number of processes. Default: one per fold, limited by the CPU count
+        :param epochs: Number of epochs for each fold
+        :param batch_size: Batch size for each fold
+        :param threads_per_worker: TensorFlow intra-op threads for each process
+        :return: Dictionary with the score of each fold and the mean MSE/RMSE
+        """
+        if self.model_params is None:
+            raise ValueError("Model wasn't created")
+        if workers is None:
+            workers = max(1, min(n_splits, (multiprocessing.cpu_count() or 1) // threads_per_worker))
+
+        time_split = TimeSeriesSplit(n_splits=n_splits)
+        # spawn gives each worker a fresh TensorFlow runtime
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = []
+            for fold, (train_index, test_index) in enumerate(time_split.split(self.X)):
+                train, test = slice(0, len(train_index)), slice(test_index[0], test_index[-1] + 1)
+                futures.append(executor.submit(train_fold, fold, self.model_params, self.X[train], self.y[train],
+                                               self.X[test], self.y[test], epochs, batch_size, threads_per_worker))
+            folds = [future.result() for future in futures]
+
+        mse = [fold['mse'] for fold in folds]
+        rmse = [fold['rmse'] for fold in folds]
+        return {'folds': folds, 'mse': float(np.mean(mse)), 'mse_std': float(np.std(mse)),
+                'rmse': float(np.mean(rmse)), 'rmse_std': float(np.std(rmse))}
 
     def save_model(self, path_with_name='lstm_stock.h5'):
         # Save the trained model
@@ -114,14 +541,74 @@ class LstmWrapper:
         # Load de trained model
         self.model = load_model(path_with_name)
 
-    def create_setting_model(self, dataset_path : str, filter_stocks: dict, features: list, y_value : str, n_splits=5, hidden_layers=1, units=10):
-        # Opening the dataset
-        self.load_csv(dataset_path)
+    def save_bundle(self, path_with_name='lstm_stock.lstm.npz', metrics=None):
+        """
+        Saves the model with the scaler, the features, the y value and the window settings in one file (see ModelBundle)
+        :param path_with_name: File name
+        :param metrics: Dictionary with the scores of the model
+        """
+        save_bundle(self, path_with_name, metrics=metrics)
+
+    def export(self, path_with_name='lstm_stock.lstm.npz', format='numpy', metrics=None):
+        """
+        Exports the model and the scaler for LitePredictor, which predicts without importing Keras (see ModelExport)
+        :param path_with_name: File name
+        :param format: 'numpy' (bundle predicted by a NumPy LSTM), 'tflite' or 'onnx'
+        :param metrics: Dictionary with the scores of the model
+        :return: Paths of the written files
+        """
+        return export_model(self, path_with_name, format=format, metrics=metrics)
+
+    def load_bundle(self, path_with_name='lstm_stock.lstm.npz'):
+        """
+        Loads a file saved by save_bundle, the wrapper is ready to predict without loading the dataset
+        """
+        bundle = ModelBundle.load(path_with_name)
+        self.model = bundle.build_model()
+        self.set_features(bundle.features)
+        self.set_window(window=bundle.window, horizon=bundle.horizon)
+        self.y_value = bundle.metadata.get('y_value')
+        self.filter_stocks = bundle.metadata.get('filter_stocks')
+        self.model_params = bundle.metadata.get('model_params')
+        # Fitting on the two bounds gives the same min_ and scale_ of the original scaler
+        self.scaler = MinMaxScaler().fit(np.array([bundle.data_min, bundle.data_max]))
+        return bundle
+
+    def load_data(self, dataset_path, filter_stocks=None, n_splits=5, date_range=None):
+        """
+        Loads the rows of a restored model (see load_bundle and ModelRegistry.load_wrapper) and builds the windows with
+        its own features, window and scaler, e.g. to evaluate it. The scaler is only fitted when none was saved
+        :param dataset_path: Path of the CSV file
+        :param filter_stocks: Stock of the rows. Default: the stock of the model
+        :param n_splits: Number of splits of TimeSeriesSplit, the last one is the train and test sets
+        :param date_range: Tuple (start, end) with ISO dates, inclusive
+        """
+        filter_stocks = filter_stocks or self.filter_stocks
+        self.load_csv(dataset_path, filters={filter_stocks['filed_name']: filter_stocks['field_text']}, date_range=date_range,
+                      columns=list(dict.fromkeys([filter_stocks['filed_name'], DATE_COLUMN] + self.features + [self.y_value] + required_columns(self.features))))
+        self.filter_stocks = filter_stocks
+        filtered_data_frame = self.filter_data_frame(filter_stocks['filed_name'], filter_stocks['field_text'])
+        self.generate_target_data_frame(filtered_data_frame, self.y_value)
+        if self.scaler is None:
+            self.generate_min_max_scaler(filtered_data_frame)
+        else:
+            self.data_frame_scaled = pd.DataFrame(columns=self.features, index=filtered_data_frame.index,
+                                                  data=self.scaler.transform(filtered_data_frame[self.features].to_numpy(dtype=float)))
+        self.generate_train_test(n_splits=n_splits)
+
+    def create_setting_model(self, dataset_path : str, filter_stocks: dict, features: list, y_value : str, n_splits=5, hidden_layers=1, units=10, window=1, horizon=1, date_range=None):
+        # Opening the dataset, only the filtered stock, dates and used columns are read
+        # The columns of the engineered features and the date are kept, so update can compute the features of new rows
+        # and ignore the days already loaded
+        self.load_csv(dataset_path, filters={filter_stocks['filed_name']: filter_stocks['field_text']}, date_range=date_range,
+                      columns=list(dict.fromkeys([filter_stocks['filed_name'], DATE_COLUMN] + features + [y_value] + required_columns(features))))
 
         # Filtering the Dataset to use one of fourteen
+        self.filter_stocks = filter_stocks
         filtered_data_frame = self.filter_data_frame(filter_stocks['filed_name'], filter_stocks['field_text'])
 
         self.set_features(features)
+        self.set_window(window=window, horizon=horizon)
 
         # Generating the target
         self.generate_target_data_frame(filtered_data_frame, y_value)
@@ -133,4 +620,4 @@ class LstmWrapper:
         self.generate_train_test(n_splits=n_splits)
 
         # Creating the model
-        self.create_model(hidden_layers=hidden_layers, units=units)
\ No newline at end of file
+        self.create_model(hidden_layers=hidden_layers, units=units)
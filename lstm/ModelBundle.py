@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+
+BUNDLE_EXTENSION = '.lstm.npz'
+
+
+def bundle_metadata(lstm_wrapper, metrics=None):
+    """
+    Settings of the model needed to use it again, without the weights and the scaler
+    """
+    return {
+        "model_json": lstm_wrapper.model.to_json(),
+        "model_params": lstm_wrapper.model_params,
+        "features": lstm_wrapper.features,
+        "y_value": lstm_wrapper.y_value,
+        "filter_stocks": lstm_wrapper.filter_stocks,
+        "window": lstm_wrapper.window,
+        "horizon": lstm_wrapper.horizon,
+        "metrics": metrics
+    }
+
+
+def save_bundle(lstm_wrapper, path, metrics=None):
+    """
+    Saves everything needed to predict with the model in a single NumPy .npz file: architecture, weights,
+    MinMaxScaler bounds, features, y value and window settings
+    :param lstm_wrapper: LstmWrapper with a trained model and a fitted scaler
+    :param path: File name, BUNDLE_EXTENSION is recommended
+    :param metrics: Dictionary with the scores of the model
+    """
+    scaler = lstm_wrapper.scaler
+    metadata = bundle_metadata(lstm_wrapper, metrics=metrics)
+    weights = {'weight_%d' % index: weight for index, weight in enumerate(lstm_wrapper.model.get_weights())}
+    # Saved without pickle, the bundle can be loaded with allow_pickle=False
+    with open(path, 'wb') as file:
+        np.savez(file, metadata=np.array(json.dumps(metadata)), scaler_min=scaler.min_, scaler_scale=scaler.scale_,
+                 scaler_data_min=scaler.data_min_, scaler_data_max=scaler.data_max_, **weights)
+
+
+class ModelBundle:
+    """
+    Model saved by save_bundle. Loading reads only NumPy arrays: no CSV, no Pandas and no scaler to be fitted
+    """
+    metadata: dict
+    weights: list
+    scale_min: np.ndarray
+    scale: np.ndarray
+    data_min: np.ndarray
+    data_max: np.ndarray
+
+    def __init__(self, metadata, weights, scale_min, scale, data_min, data_max):
+        self.metadata = metadata
+        self.weights = weights
+        self.scale_min = scale_min
+        self.scale = scale
+        self.data_min = data_min
+        self.data_max = data_max
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as file:
+            n_weights = sum(1 for name in file.files if name.startswith('weight_'))
+            return cls(metadata=json.loads(str(file['metadata'])),
+                       weights=[file['weight_%d' % index] for index in range(n_weights)],
+                       scale_min=file['scaler_min'], scale=file['scaler_scale'],
+                       data_min=file['scaler_data_min'], data_max=file['scaler_data_max'])
+
+    @property
+    def features(self):
+        return self.metadata['features']
+
+    @property
+    def window(self):
+        return self.metadata['window']
+
+    @property
+    def horizon(self):
+        return self.metadata['horizon']
+
+    def transform(self, values):
+        """
+        Scales the values like MinMaxScaler.transform
+        """
+        return np.asarray(values, dtype=np.float32) * self.scale + self.scale_min
+
+    def build_model(self):
+        """
+        Rebuilds the Keras model with the saved weights, compiled with the saved optimizer and loss
+        """
+        # Imported here, the metadata and the scaler can be used without loading TensorFlow
+        from tensorflow.keras.models import model_from_json
+
+        model = model_from_json(self.metadata['model_json'])
+        model.set_weights(self.weights)
+        model_params = self.metadata.get('model_params')
+        if model_params:
+            model.compile(optimizer=model_params['optimizer'], loss=model_params['loss'])
+        return model
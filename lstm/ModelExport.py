@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+
+from ModelBundle import bundle_metadata, save_bundle
+
+EXPORT_FORMATS = ('numpy', 'tflite', 'onnx')
+METADATA_EXTENSION = '.json'
+
+
+def inference_model(model):
+    """
+    Copy of the model for the export: float32 layers (also for a mixed_bfloat16 model) and LSTM layers unrolled over
+    the window, so the graph has only builtin operations (TFLite without the Flex delegate)
+    """
+    from tensorflow.keras.layers import LSTM  # type: ignore
+    from tensorflow.keras.models import clone_model  # type: ignore
+
+    def clone_layer(layer):
+        config = layer.get_config()
+        config['dtype'] = 'float32'
+        if isinstance(layer, LSTM):
+            config['unroll'] = True
+        return layer.__class__.from_config(config)
+
+    clone = clone_model(model, clone_function=clone_layer)
+    clone.set_weights(model.get_weights())
+    # The ONNX export needs a model that was already called
+    inputs = [np.zeros((1,) + tuple(tensor.shape[1:]), dtype=tensor.dtype) for tensor in clone.inputs]
+    clone(inputs[0] if len(inputs) == 1 else inputs)
+    return clone
+
+
+def export_model(lstm_wrapper, path, format='numpy', metrics=None):
+    """
+    Exports the model for LitePredictor, which doesn't import Keras
+    - numpy: the bundle of ModelBundle (weights and scaler in one .npz file), predicted by a NumPy LSTM
+    - tflite: TFLite flat buffer, predicted with LiteRT (pip install ai-edge-litert)
+    - onnx: ONNX graph, predicted with ONNX Runtime (pip install tf2onnx to export, onnxruntime to predict)
+    The tflite and onnx files get the scaler and the settings of the model in path + METADATA_EXTENSION
+    :param lstm_wrapper: LstmWrapper with a trained model and a fitted scaler
+    :param path: File name, e.g. 'lstm_stock.lstm.npz', 'lstm_stock.tflite' or 'lstm_stock.onnx'
+    :param format: 'numpy', 'tflite' or 'onnx'
+    :param metrics: Dictionary with the scores of the model
+    :return: Paths of the written files
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError("Unknown format '%s', use %s" % (format, ', '.join(EXPORT_FORMATS)))
+    if format == 'numpy':
+        save_bundle(lstm_wrapper, path, metrics=metrics)
+        return [path]
+
+    if format == 'onnx':
+        try:
+            import tf2onnx  # noqa: F401
+        except ImportError:
+            raise ImportError('The onnx format needs tf2onnx: pip install tf2onnx')
+    inference_model(lstm_wrapper.model).export(path, format='litert' if format == 'tflite' else 'onnx', verbose=False)
+
+    scaler = lstm_wrapper.scaler
+    metadata = bundle_metadata(lstm_wrapper, metrics=metrics)
+    metadata.update({"format": format, "scaler": {"min": scaler.min_.tolist(), "scale": scaler.scale_.tolist(),
+                                                  "data_min": scaler.data_min_.tolist(),
+                                                  "data_max": scaler.data_max_.tolist()}})
+    with open(path + METADATA_EXTENSION, 'w') as file:
+        json.dump(metadata, file, indent=2)
+    return [path, path + METADATA_EXTENSION]
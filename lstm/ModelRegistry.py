@@ -0,0 +1,221 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ModelBundle import BUNDLE_EXTENSION, ModelBundle, save_bundle
+
+# Names of the models are file names inside the save folder, never a path
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def valid_name(name):
+    """
+    :return: False when the name has characters other than letters, digits, '_', '.' and '-', or has '..'
+    """
+    return isinstance(name, str) and bool(NAME_PATTERN.match(name)) and '..' not in name
+
+
+def check_name(name):
+    """
+    :raise ValueError: The name isn't valid (see valid_name)
+    """
+    if not valid_name(name):
+        raise ValueError("Invalid model name %r, use only letters, digits, '_', '.' and '-'" % (name,))
+    return name
+
+
+class ModelRegistry:
+    """
+    Index of the saved models (registry.json inside the save folder) with the metadata needed to use them again:
+    stock, features, window, scaler and metrics. The models are saved as bundles (see ModelBundle), .h5 files saved
+    before are still indexed by scan. The loaded Keras models are kept in a LRU cache limited by the size of their
+    weights, so switching between models doesn't read the file again.
+    """
+    index_name = 'registry.json'
+
+    def __init__(self, fold_path='./save', max_cache_bytes=256 * 1024 * 1024):
+        """
+        :param fold_path: Folder of the saved models
+        :param max_cache_bytes: Maximum size of the weights of the models kept in memory
+        """
+        self.fold_path = fold_path
+        self.index_path = os.path.join(fold_path, self.index_name)
+        self.max_cache_bytes = max_cache_bytes
+        self.index = {}
+        self.index_mtime = None
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.lock = threading.RLock()
+
+    def load_index(self):
+        """
+        Reads registry.json only when it was changed since the last read
+        :return: Dictionary {name: metadata}
+        """
+        with self.lock:
+            try:
+                mtime = os.stat(self.index_path).st_mtime_ns
+            except FileNotFoundError:
+                self.index, self.index_mtime = {}, None
+                return self.index
+            if mtime != self.index_mtime:
+                with open(self.index_path) as file:
+                    self.index = json.load(file)
+                self.index_mtime = mtime
+            return self.index
+
+    def write_index(self, index):
+        # Written in a temporary file and renamed, a reader never sees a half written index
+        os.makedirs(self.fold_path, exist_ok=True)
+        temporary_path = '%s.tmp-%d' % (self.index_path, os.getpid())
+        with open(temporary_path, 'w') as file:
+            json.dump(index, file, indent=2)
+        os.replace(temporary_path, self.index_path)
+        self.index = index
+        self.index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def entries(self):
+        return list(self.load_index().values())
+
+    def get_entry(self, name):
+        entry = self.load_index().get(name)
+        if entry is None:
+            raise KeyError("Model '%s' isn't registered" % name)
+        return entry
+
+    def register(self, lstm_wrapper, name, metrics=None, extra=None):
+        """
+        Saves the model of the wrapper as a bundle and adds its metadata to the index
+        :param lstm_wrapper: LstmWrapper with a trained model
+        :param name: Name of the model
+        :param metrics: Dictionary with the scores of the model
+        :param extra: Dictionary with more metadata
+        :return: Metadata of the model
+        :raise ValueError: Invalid name (see check_name)
+        """
+        check_name(name)
+        with self.lock:
+            path = os.path.join(self.fold_path, name + BUNDLE_EXTENSION)
+            os.makedirs(self.fold_path, exist_ok=True)
+            save_bundle(lstm_wrapper, path, metrics=metrics)
+            scaler = lstm_wrapper.scaler
+            entry = {
+                "name": name,
+                "path": path,
+                "symbol": (lstm_wrapper.filter_stocks or {}).get('field_text'),
+                "filter_stocks": lstm_wrapper.filter_stocks,
+                "features": lstm_wrapper.features,
+                "y_value": lstm_wrapper.y_value,
+                "window": lstm_wrapper.window,
+                "horizon": lstm_wrapper.horizon,
+                "model_params": lstm_wrapper.model_params,
+                "scaler": None if scaler is None else {"data_min": scaler.data_min_.tolist(),
+                                                       "data_max": scaler.data_max_.tolist()},
+                "metrics": metrics,
+                "saved_at": time.time()
+            }
+            entry.update(extra or {})
+            index = dict(self.load_index())
+            index[name] = entry
+            self.write_index(index)
+            # A model saved again with the same name can't be served from the cache
+            self.evict(name)
+            return entry
+
+    def register_version(self, lstm_wrapper, name, metrics=None):
+        """
+        Registers the model as the next version of name: name-v1, name-v2, ...
+        :return: Metadata of the model
+        """
+        with self.lock:
+            versions = [entry.get('version', 0) for entry in self.load_index().values() if entry.get('base_name') == name]
+            version = max(versions, default=0) + 1
+            return self.register(lstm_wrapper, '%s-v%d' % (name, version), metrics=metrics,
+                                 extra={"base_name": name, "version": version})
+
+    def latest_version(self, name):
+        """
+        :return: Metadata of the last version of name or None
+        """
+        versions = [entry for entry in self.load_index().values() if entry.get('base_name') == name]
+        return max(versions, key=lambda entry: entry['version'], default=None)
+
+    def scan(self):
+        """
+        Adds to the index the .h5 files of the save folder that aren't registered, without metadata. The name of a file
+        in a subfolder joins the folders with '-' (sub/model.h5 is sub-model), files whose name isn't valid (see
+        valid_name) are skipped
+        :return: Names of the added models
+        """
+        with self.lock:
+            index = dict(self.load_index())
+            added = []
+            for dirname, _, filenames in os.walk(self.fold_path):
+                for filename in filenames:
+                    path = os.path.join(dirname, filename)
+                    name = os.path.splitext(os.path.relpath(path, self.fold_path))[0].replace(os.sep, '-')
+                    if filename.endswith('.h5') and name not in index and valid_name(name):
+                        index[name] = {"name": name, "path": path, "saved_at": os.stat(path).st_mtime}
+                        added.append(name)
+            if added:
+                self.write_index(index)
+            return added
+
+    def evict(self, name):
+        with self.lock:
+            if name in self.cache:
+                _, size = self.cache.pop(name)
+                self.cache_bytes -= size
+
+    def load_model(self, name):
+        """
+        Returns the Keras model, from the cache or reading the file
+        """
+        with self.lock:
+            if name in self.cache:
+                self.cache.move_to_end(name)
+                return self.cache[name][0]
+
+            path = self.get_entry(name)['path']
+            if path.endswith(BUNDLE_EXTENSION):
+                model = ModelBundle.load(path).build_model()
+            else:
+                # Imported here, the index can be used without loading TensorFlow
+                from tensorflow.keras.models import load_model
+                model = load_model(path)
+            size = sum(weight.nbytes for weight in model.get_weights())
+            self.cache[name] = (model, size)
+            self.cache_bytes += size
+            # Removing the least recently used models, the last one is always kept
+            while self.cache_bytes > self.max_cache_bytes and len(self.cache) > 1:
+                _, (_, evicted_size) = self.cache.popitem(last=False)
+                self.cache_bytes -= evicted_size
+            return model
+
+    def load_wrapper(self, name):
+        """
+        Creates a LstmWrapper with the model and the settings saved in the index (without data)
+        :raise ValueError: Invalid name (see check_name)
+        :raise KeyError: The model isn't registered
+        """
+        check_name(name)
+        from sklearn.preprocessing import MinMaxScaler
+        from LstmWrapper import LstmWrapper
+
+        entry = self.get_entry(name)
+        lstm_wrapper = LstmWrapper()
+        lstm_wrapper.model = self.load_model(name)
+        lstm_wrapper.set_features(entry.get('features'))
+        lstm_wrapper.set_window(window=entry.get('window', 1), horizon=entry.get('horizon', 1))
+        lstm_wrapper.y_value = entry.get('y_value')
+        lstm_wrapper.model_params = entry.get('model_params')
+        lstm_wrapper.filter_stocks = entry.get('filter_stocks')
+        if entry.get('scaler'):
+            # Fitting on the two bounds gives the same min_ and scale_ of the original scaler
+            lstm_wrapper.scaler = MinMaxScaler().fit(np.array([entry['scaler']['data_min'], entry['scaler']['data_max']]))
+        return lstm_wrapper
@@ -0,0 +1,97 @@
+import math
+
+from LstmWrapper import LstmWrapper
+from ModelRegistry import ModelRegistry
+from ExecutionProfile import apply_profile
+from TrainingTelemetry import TrainingTelemetry
+
+# Functions run in the model process of lstm-service-asgi.py. The model of the service lives only in this process:
+# loading the CSV, training and evaluating don't hold the GIL of the process serving the requests
+lstm_wrapper = None
+telemetry = None
+
+
+class QueueTelemetry(TrainingTelemetry):
+    """
+    Telemetry of the model process: every change is also put in a multiprocessing queue, replayed by forward_events
+    on the TrainingTelemetry of the server
+    """
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def start(self):
+        super().start()
+        self.events.put(('start',))
+
+    def add(self, record):
+        super().add(record)
+        self.events.put(('add', record))
+
+    def finish(self, status, error=None):
+        super().finish(status, error)
+        self.events.put(('finish', status, error))
+
+
+def forward_events(events, server_telemetry):
+    """
+    Replays the events of QueueTelemetry until a None is received, run by a thread of the server
+    """
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        getattr(server_telemetry, event[0])(*event[1:])
+
+
+def init_worker(events, profile_name=None, profile_processes=1):
+    global telemetry
+    if profile_name:
+        apply_profile(profile_name, processes=profile_processes)
+    telemetry = QueueTelemetry(events)
+
+
+def create_model(settings):
+    """
+    Replaces the model by a new one created with LstmWrapper.create_setting_model
+    """
+    global lstm_wrapper
+    # The data of the previous model is released before loading the new one
+    lstm_wrapper = None
+    new_wrapper = LstmWrapper()
+    new_wrapper.create_setting_model(**settings)
+    lstm_wrapper = new_wrapper
+
+
+def fit_model(epochs, bundle_path):
+    """
+    Trains the model and saves it as a bundle, loaded by the server to predict
+    :return: bundle_path
+    """
+    try:
+        telemetry.samples_per_epoch = lstm_wrapper.train_size()
+        lstm_wrapper.fit(epochs=epochs, callbacks=[telemetry], verbose=0)
+        lstm_wrapper.save_bundle(bundle_path)
+    except Exception as e:
+        telemetry.finish('failed', str(e))
+        raise
+    return bundle_path
+
+
+def evaluate_model(verbose=0):
+    score = lstm_wrapper.evaluate(verbose=verbose)
+    return {
+        "train_score": {"mse": score['train'], "rmse": math.sqrt(score['train'])},
+        "test_score": {"mse": score['test'], "rmse": math.sqrt(score['test'])}
+    }
+
+
+def register_model(name, fold_path):
+    """
+    Registers the model in the ModelRegistry of fold_path
+    :return: Metadata of the model
+    """
+    score = lstm_wrapper.evaluate()
+    metrics = {"train_mse": score['train'], "test_mse": score['test']}
+    return ModelRegistry(fold_path).register(lstm_wrapper, name, metrics=metrics)
@@ -0,0 +1,182 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.preprocessing import MinMaxScaler
+from tensorflow.keras.models import Model  # type: ignore
+from tensorflow.keras.layers import Dense, LSTM, Dropout, Input, Embedding, RepeatVector, Concatenate  # type: ignore
+from LstmWrapper import LstmWrapper, build_model
+from ExecutionProfile import get_precision
+
+
+def build_shared_model(input_shape, n_symbols, embedding_dim=4, hidden_layers=1, units=10, dropout=0.01,
+                       units_output=1, activation='relu', optimizer='adam', loss='mean_squared_error', precision='float32'):
+    # Two inputs: the window of features and the index of the stock
+    series = Input(shape=input_shape)
+    symbol = Input(shape=(), dtype='int32')
+    # The embedding of the stock is repeated for each timestep of the window
+    embedding = RepeatVector(input_shape[0], dtype=precision)(Embedding(n_symbols, embedding_dim, dtype=precision)(symbol))
+    x = Concatenate(dtype=precision)([series, embedding])
+
+    # Same stack of layers as build_model
+    x = LSTM(units=units, return_sequences=hidden_layers > 0, activation=activation, dtype=precision)(x)
+    for size in range(hidden_layers):
+        x = LSTM(units=units, return_sequences=size < hidden_layers - 1, activation=activation, dtype=precision)(x)
+        x = Dropout(dropout, dtype=precision)(x)
+    output = Dense(units=units_output, dtype='float32')(x)
+
+    model = Model(inputs=[series, symbol], outputs=output)
+    model.compile(optimizer=optimizer, loss=loss)
+    return model
+
+
+def train_symbol(symbol, model_params, X_train, y_train, X_test, y_test, epochs, batch_size, threads):
+    """
+    Trains the model of one stock inside a worker process and returns its weights and scores
+    """
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    model = build_model((X_train.shape[1], X_train.shape[2]), **model_params)
+    model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, verbose=0)
+    return {'symbol': symbol, 'weights': model.get_weights(),
+            'train': float(model.evaluate(X_train, y_train, verbose=0)),
+            'test': float(model.evaluate(X_test, y_test, verbose=0))}
+
+
+class MultiSeriesLstmWrapper(LstmWrapper):
+    """
+    Trains all the stocks of the dataset in one run: the DataFrame is grouped once by stock and each group is scaled
+    on its own. mode='shared' trains one model with a stock embedding, mode='per_symbol' trains one model by stock
+    in a process pool.
+    """
+    mode = 'shared'
+    symbols: list = None
+    scalers: dict = None
+    series: dict = None
+    models: dict = None
+    scores: dict = None
+
+    def __init__(self, mode='shared'):
+        super().__init__()
+        if mode not in ('shared', 'per_symbol'):
+            raise ValueError("mode must be 'shared' or 'per_symbol'")
+        self.mode = mode
+
+    def generate_series(self, data_frame, field_name, y_value, n_splits=5):
+        """
+        Groups the DataFrame once by stock, scales each group and splits its windows like generate_train_test
+        :param data_frame: DataFrame with all the stocks
+        :param field_name: Column with the stock name
+        :param y_value: Column to be predicted
+        """
+        self.scalers = {}
+        self.series = {}
+        time_split = TimeSeriesSplit(n_splits=n_splits)
+        for symbol, group in data_frame.groupby(field_name, sort=True):
+            scaler = MinMaxScaler()
+            X, y = self.generate_sequences(scaler.fit_transform(group[self.features]), group[y_value].to_numpy())
+            train_index, test_index = list(time_split.split(X))[-1]
+            train, test = slice(0, len(train_index)), slice(test_index[0], test_index[-1] + 1)
+            self.scalers[symbol] = scaler
+            self.series[symbol] = {'X_train': X[train], 'y_train': y[train], 'X_test': X[test], 'y_test': y[test]}
+        self.symbols = list(self.series)
+
+    def stack_series(self, subset):
+        """
+        Concatenates the windows of every stock, returning the inputs of the shared model and the target
+        :param subset: 'train' or 'test'
+        """
+        X = np.concatenate([self.series[symbol]['X_' + subset] for symbol in self.symbols])
+        y = np.concatenate([self.series[symbol]['y_' + subset] for symbol in self.symbols])
+        ids = np.concatenate([np.full(len(self.series[symbol]['X_' + subset]), index, dtype=np.int32)
+                              for index, symbol in enumerate(self.symbols)])
+        return [X, ids], y
+
+    def create_model(self, hidden_layers=1, units=10, dropout=0.01, units_output=None, activation='relu', optimizer='adam',
+                     loss='mean_squared_error', embedding_dim=4, precision=None):
+        if units_output is None:
+            units_output = self.horizon
+
+        self.model_params = {'hidden_layers': hidden_layers, 'units': units, 'dropout': dropout,
+                             'units_output': units_output, 'activation': activation, 'optimizer': optimizer,
+                             'loss': loss, 'precision': precision or get_precision()}
+        if self.mode == 'shared':
+            self.model = build_shared_model((self.window, len(self.features)), len(self.symbols),
+                                            embedding_dim=embedding_dim, **self.model_params)
+            return self.model
+        # The per stock models are created by the workers in fit
+        self.models = {}
+        return None
+
+    def fit(self, epochs=10, batch_size=32, workers=None, threads_per_worker=1):
+        """
+        Trains the shared model or, in 'per_symbol' mode, one model by stock in a process pool
+        :param workers: Only 'per_symbol', number of processes. Default: one per stock, limited by the CPU count
+        :param threads_per_worker: Only 'per_symbol', TensorFlow intra-op threads for each process
+        """
+        if self.mode == 'shared':
+            X_train, y_train = self.stack_series('train')
+            self.model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size)
+            return
+
+        if workers is None:
+            workers = max(1, min(len(self.symbols), (multiprocessing.cpu_count() or 1) // threads_per_worker))
+        input_shape = (self.window, len(self.features))
+        self.scores = {}
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(train_symbol, symbol, self.model_params, series['X_train'], series['y_train'],
+                                       series['X_test'], series['y_test'], epochs, batch_size, threads_per_worker)
+                       for symbol, series in self.series.items()]
+            for future in futures:
+                result = future.result()
+                model = build_model(input_shape, **self.model_params)
+                model.set_weights(result['weights'])
+                self.models[result['symbol']] = model
+                self.scores[result['symbol']] = {'train': result['train'], 'test': result['test']}
+
+    def evaluate(self, verbose=0):
+        """
+        Evaluates the model(s) for each stock
+        :return: Dictionary {symbol: {'train': mse, 'test': mse}} with the key 'all' for the mean of the stocks
+        """
+        scores = {}
+        for index, symbol in enumerate(self.symbols):
+            series = self.series[symbol]
+            if self.mode == 'shared':
+                ids_train = np.full(len(series['X_train']), index, dtype=np.int32)
+                ids_test = np.full(len(series['X_test']), index, dtype=np.int32)
+                scores[symbol] = {
+                    'train': self.model.evaluate([series['X_train'], ids_train], series['y_train'], verbose=verbose),
+                    'test': self.model.evaluate([series['X_test'], ids_test], series['y_test'], verbose=verbose)}
+            else:
+                model = self.models[symbol]
+                scores[symbol] = {'train': model.evaluate(series['X_train'], series['y_train'], verbose=verbose),
+                                  'test': model.evaluate(series['X_test'], series['y_test'], verbose=verbose)}
+        scores['all'] = {'train': float(np.mean([score['train'] for score in scores.values()])),
+                         'test': float(np.mean([score['test'] for score in scores.values()]))}
+        return scores
+
+    def create_setting_model(self, dataset_path : str, filter_stocks: dict, features: list, y_value : str, n_splits=5, hidden_layers=1, units=10, window=1, horizon=1, date_range=None):
+        # field_text can restrict the stocks with a list, otherwise every stock is used
+        field_name = filter_stocks['filed_name']
+        field_text = filter_stocks.get('field_text')
+        filters = {field_name: field_text} if isinstance(field_text, list) else None
+
+        # Opening the dataset only once for all the stocks
+        self.load_csv(dataset_path, filters=filters, date_range=date_range,
+                      columns=list(dict.fromkeys([field_name] + features + [y_value])))
+
+        self.filter_stocks = filter_stocks
+        self.y_value = y_value
+        self.set_features(features)
+        self.set_window(window=window, horizon=horizon)
+
+        # Grouping, scaling and splitting each stock
+        self.generate_series(self.data_frame, field_name, y_value, n_splits=n_splits)
+
+        # Creating the model
+        self.create_model(hidden_layers=hidden_layers, units=units)
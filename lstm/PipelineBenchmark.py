@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import shutil
+import statistics
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the memory is reported as None
+    resource = None
+
+# Stages of LstmWrapper.create_setting_model + fit + evaluate, in the order they run
+STAGES = ['build_cache', 'load_csv', 'filter_data_frame', 'generate_min_max_scaler', 'generate_train_test',
+          'create_model', 'fit', 'evaluate']
+
+
+def generate_prices(rows, symbols=None, rows_per_symbol=2500, seed=0):
+    """
+    Synthetic daily prices with the columns of big_tech_stock_prices.csv: a geometric random walk for each symbol
+    :param rows: Total number of rows
+    :param symbols: Number of symbols. Default: rows / rows_per_symbol (about 10 years of business days each)
+    :return: DataFrame ordered by symbol and date
+    """
+    if symbols is None:
+        symbols = max(1, math.ceil(rows / rows_per_symbol))
+    days = math.ceil(rows / symbols)
+    rng = np.random.default_rng(seed)
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, size=(symbols, days)), axis=1))
+    open_ = close * np.exp(rng.normal(0, 0.005, size=close.shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, size=close.shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, size=close.shape)))
+    volume = rng.lognormal(16, 0.5, size=close.shape).astype(np.int64)
+
+    data_frame = pd.DataFrame({
+        'stock_symbol': np.repeat(['S%05d' % symbol for symbol in range(symbols)], days),
+        'date': np.tile(pd.bdate_range('1990-01-01', periods=days).strftime('%Y-%m-%d'), symbols),
+        'open': open_.ravel(), 'high': high.ravel(), 'low': low.ravel(), 'close': close.ravel(),
+        'adj_close': close.ravel() * 0.98, 'volume': volume.ravel()})
+    return data_frame.iloc[:rows]
+
+
+def synthetic_dataset(folder, rows, symbols=None, seed=0):
+    """
+    Writes the synthetic prices to a CSV file once, the next benchmarks read the same file
+    :return: Path of the CSV file
+    """
+    path = os.path.join(folder, 'prices-%d-%s-%d.csv' % (rows, symbols or 'auto', seed))
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        temporary_path = '%s.tmp-%d' % (path, os.getpid())
+        generate_prices(rows, symbols=symbols, seed=seed).to_csv(temporary_path, index=False, float_format='%.4f')
+        os.replace(temporary_path, path)
+    return path
+
+
+def current_rss():
+    """
+    :return: Resident memory of the process in bytes, None when /proc isn't available
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class MemorySampler:
+    """
+    Context manager sampling the resident memory in a thread: peak_mb is the largest increase over the memory at the
+    start. Without /proc the increase of the peak RSS of the process (ru_maxrss) is used
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss = None
+        self.peak_rss = None
+        self.peak_mb = None
+        self.running = False
+        self.thread = None
+
+    def sample(self):
+        while self.running:
+            self.peak_rss = max(self.peak_rss, current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start_rss = current_rss()
+        if self.start_rss is None:
+            self.start_rss = None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        else:
+            self.peak_rss = self.start_rss
+            self.running = True
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.running:
+            self.running = False
+            self.thread.join()
+            self.peak_rss = max(self.peak_rss, current_rss())
+        elif self.start_rss is not None:
+            self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        if self.start_rss is not None:
+            self.peak_mb = (self.peak_rss - self.start_rss) / 1024 / 1024
+        return False
+
+
+def run_pipeline(config):
+    """
+    Runs the stages of the pipeline on a synthetic dataset. Meant to run in a new process, so the memory of a
+    configuration doesn't change the next one
+    :param config: Dictionary with dataset_path, symbol, features, y_value, window, units, hidden_layers, epochs,
+                   batch_size, n_splits, use_cache and repeats
+    :return: List of dictionaries {stage, seconds, peak_memory_mb}, seconds is the median of the repeats
+    """
+    from LstmWrapper import LstmWrapper
+    from DatasetCache import DatasetCache
+
+    timings = {stage: [] for stage in STAGES}
+    memory = {stage: [] for stage in STAGES}
+
+    def measure(stage, function, *args, **kwargs):
+        with MemorySampler() as sampler:
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            timings[stage].append(time.perf_counter() - start)
+        memory[stage].append(sampler.peak_mb)
+        return result
+
+    use_cache = config['use_cache'] and DatasetCache.available()
+    if use_cache:
+        # Converting the CSV is done once by dataset, measured apart from the reads. The cache of the synthetic
+        # dataset is built again, so every run measures it
+        cache = DatasetCache(config['dataset_path'])
+        shutil.rmtree(cache.path(), ignore_errors=True)
+        measure('build_cache', cache.build)
+
+    field_name = 'stock_symbol'
+    columns = [field_name] + config['features'] + [config['y_value']]
+    for _ in range(config['repeats']):
+        lstm_wrapper = LstmWrapper()
+        measure('load_csv', lstm_wrapper.load_csv, config['dataset_path'], filters={field_name: config['symbol']},
+                columns=columns, use_cache=use_cache)
+        filtered_data_frame = measure('filter_data_frame', lstm_wrapper.filter_data_frame, field_name,
+                                      config['symbol'])
+        lstm_wrapper.set_features(config['features'])
+        lstm_wrapper.set_window(window=config['window'])
+        lstm_wrapper.generate_target_data_frame(filtered_data_frame, config['y_value'])
+        measure('generate_min_max_scaler', lstm_wrapper.generate_min_max_scaler, filtered_data_frame)
+        measure('generate_train_test', lstm_wrapper.generate_train_test, n_splits=config['n_splits'])
+        measure('create_model', lstm_wrapper.create_model, hidden_layers=config['hidden_layers'],
+                units=config['units'])
+        measure('fit', lstm_wrapper.fit, epochs=config['epochs'], batch_size=config['batch_size'], verbose=0)
+        measure('evaluate', lstm_wrapper.evaluate)
+
+    return [{"stage": stage, "seconds": statistics.median(timings[stage]),
+             "peak_memory_mb": None if None in memory[stage] else max(memory[stage])}
+            for stage in STAGES if timings[stage]]
+
+
+def result_key(result):
+    return '%s|rows=%d|symbols=%s|units=%d|hidden_layers=%d' % (
+        result['stage'], result['rows'], result['symbols'], result['units'], result['hidden_layers'])
+
+
+def save_baseline(results, path):
+    """
+    Saves the results as the baseline of the next runs
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({"saved_at": time.time(), "results": {result_key(result): result for result in results}}, file,
+                  indent=2)
+
+
+def compare(results, baseline_path, tolerance=1.25, min_seconds=0.05):
+    """
+    Compares the results with a baseline saved by save_baseline
+    :param tolerance: A stage slower than tolerance times its baseline is a regression
+    :param min_seconds: Stages faster than this in both runs are never regressions (timer noise)
+    :return: DataFrame with the results, the baseline seconds, the ratio and the regression flag
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+    rows = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        row = dict(result, baseline_seconds=None, ratio=None, regression=False)
+        if previous is not None:
+            row['baseline_seconds'] = previous['seconds']
+            row['ratio'] = result['seconds'] / previous['seconds'] if previous['seconds'] > 0 else None
+            row['regression'] = bool(max(result['seconds'], previous['seconds']) >= min_seconds
+                                     and row['ratio'] is not None and row['ratio'] > tolerance)
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,421 @@
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import tensorflow as tf
+
+from LstmWrapper import LstmWrapper
+from TrainingTelemetry import TrainingTelemetry
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def model_settings(data):
+    """
+    Reads the settings of LstmWrapper.create_setting_model from the request JSON
+    """
+    #  Setting the variables
+    # Dataset
+    dataset_path = 'data/big_tech_stock_prices.csv'
+    # Filtering the dataset with multiple companies stocks
+    filter_stocks = data["filter_stocks"]
+    # Number os splits to generate the train and test use by TimeSeriesSplit
+    n_splits = data["n_splits"]
+    # Number of hidden layers
+    hidden_layers = data["hidden_layers"]
+    # Number of neurons for each layer
+    units = data["units"]
+    # Selecting the Features (x)
+    features = data["features"]
+    # Select predict values (y)
+    y_value = data["y_value"]
+    # Number of timesteps in each sample (lookback window)
+    window = data.get("window", 1)
+    # Number of values predicted for each sample
+    horizon = data.get("horizon", 1)
+    # First and last dates to be loaded, e.g. ["2015-01-01", null]
+    date_range = data.get("date_range")
+    return dict(dataset_path=dataset_path, filter_stocks=filter_stocks, features=features, y_value=y_value, n_splits=n_splits, hidden_layers=hidden_layers, units=units, window=window, horizon=horizon, date_range=date_range)
+
+
+class TrainingProgress(TrainingTelemetry):
+    """
+    Keras callback that updates the epoch of a job, records its telemetry and stops the training when the job is
+    cancelled
+    """
+
+    def __init__(self, job, samples_per_epoch=None):
+        super().__init__(samples_per_epoch=samples_per_epoch)
+        self.job = job
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.job.cancel_event.is_set():
+            self.model.stop_training = True
+
+    def on_epoch_end(self, epoch, logs=None):
+        super().on_epoch_end(epoch, logs)
+        self.job.epoch = epoch + 1
+        self.job.loss = (logs or {}).get('loss')
+        if self.job.cancel_event.is_set():
+            self.model.stop_training = True
+
+
+class BaseTrainingJob:
+    """
+    State of one training session kept by a JobQueue, trained by the subclass or by the queue
+    Status: queued -> running -> trained | cancelled | failed
+    """
+
+    def __init__(self, settings, epochs, cancel_event):
+        """
+        :param settings: Arguments of LstmWrapper.create_setting_model
+        :param epochs: Number of epochs
+        :param cancel_event: Event set to cancel the job
+        """
+        self.id = uuid.uuid4().hex
+        self.settings = settings
+        self.epochs = epochs
+        self.status = 'queued'
+        self.epoch = 0
+        self.loss = None
+        self.score = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = cancel_event
+        # The trained model, None until the job is trained
+        self.lstm_wrapper = None
+        self.progress = None
+        self.future = None
+
+    def to_dict(self):
+        return {"job_id": self.id, "status": self.status, "epoch": self.epoch, "epochs": self.epochs,
+                "loss": self.loss, "score": self.score, "error": self.error, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+
+
+class TrainingJob(BaseTrainingJob):
+    """
+    Job trained by a thread of the server: creates its own LstmWrapper, trains and evaluates it
+    """
+
+    def __init__(self, settings, epochs):
+        super().__init__(settings, epochs, threading.Event())
+        self.lstm_wrapper = LstmWrapper()
+        self.progress = TrainingProgress(self)
+
+    def run(self):
+        if self.cancel_event.is_set():
+            self.status = 'cancelled'
+            self.progress.finish('cancelled')
+            return
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            self.lstm_wrapper.create_setting_model(**self.settings)
+            self.progress.samples_per_epoch = self.lstm_wrapper.train_size()
+            self.lstm_wrapper.fit(epochs=self.epochs, callbacks=[self.progress], verbose=0)
+            if self.cancel_event.is_set():
+                self.status = 'cancelled'
+                self.progress.finish('cancelled')
+            else:
+                score = self.lstm_wrapper.evaluate()
+                self.score = {
+                    "train_score": {"mse": score['train'], "rmse": math.sqrt(score['train'])},
+                    "test_score": {"mse": score['test'], "rmse": math.sqrt(score['test'])}
+                }
+                self.status = 'trained'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            self.progress.finish('failed', self.error)
+            traceback.print_exc()
+        finally:
+            # Only the model, the scaler and the settings are needed to predict and register, the rows and the
+            # windows are released. A job not trained keeps nothing
+            if self.status == 'trained':
+                self.lstm_wrapper.release_data()
+            else:
+                self.lstm_wrapper = None
+            self.finished_at = time.time()
+
+
+class JobQueue:
+    """
+    Bounded pool of training jobs: at most max_workers trainings run at the same time and at most max_pending jobs
+    wait for a worker. The finished jobs are kept for finished_ttl seconds, and only the last max_finished of them
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, max_finished=32, finished_ttl=3600, on_discard=None):
+        """
+        :param max_finished: Number of finished jobs kept, the oldest ones are discarded first
+        :param finished_ttl: Seconds a finished job is kept
+        :param on_discard: Function called with each discarded job (e.g. to close its predictor)
+        """
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self.on_discard = on_discard
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training-job')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def prune(self):
+        """
+        Discards the finished jobs older than finished_ttl and the oldest ones above max_finished
+        :return: Discarded jobs
+        """
+        now = time.time()
+        with self.lock:
+            finished = sorted((job for job in self.jobs.values() if job.finished_at is not None),
+                              key=lambda job: job.finished_at)
+            excess = len(finished) - self.max_finished
+            discarded = [job for index, job in enumerate(finished)
+                         if index < excess or now - job.finished_at > self.finished_ttl]
+            for job in discarded:
+                del self.jobs[job.id]
+        if self.on_discard is not None:
+            for job in discarded:
+                self.on_discard(job)
+        return discarded
+
+    def submit(self, settings, epochs):
+        self.prune()
+        with self.lock:
+            pending = sum(1 for job in self.jobs.values() if job.status == 'queued')
+            if pending >= self.max_pending:
+                raise JobQueueFull('There are already %d jobs waiting' % pending)
+            job = self.create_job(settings, epochs)
+            self.jobs[job.id] = job
+            job.future = self.start_job(job)
+        return job
+
+    def create_job(self, settings, epochs):
+        return TrainingJob(settings, epochs)
+
+    def start_job(self, job):
+        """
+        :return: Future of the training
+        """
+        return self.executor.submit(job.run)
+
+    def get(self, job_id):
+        self.prune()
+        return self.jobs.get(job_id)
+
+    def list(self):
+        self.prune()
+        return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or running job
+        :return: The job or None if it doesn't exist
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        # A queued job never starts
+        if job.future.cancel():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            job.progress.finish('cancelled')
+        return job
+
+
+class ProcessProgress(TrainingTelemetry):
+    """
+    Keras callback of a job trained by ProcessJobQueue: every change of the telemetry is also put in the events queue
+    with the id of the job, and the training stops when the cancel event of the job is set
+    """
+
+    def __init__(self, job_id, events, cancel_event):
+        super().__init__()
+        self.job_id = job_id
+        self.events = events
+        self.cancel_event = cancel_event
+
+    def start(self):
+        super().start()
+        self.events.put((self.job_id, 'start'))
+
+    def add(self, record):
+        super().add(record)
+        self.events.put((self.job_id, 'add', record))
+
+    def finish(self, status, error=None):
+        super().finish(status, error)
+        self.events.put((self.job_id, 'finish', status, error))
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.cancel_event.is_set():
+            self.model.stop_training = True
+
+    def on_epoch_end(self, epoch, logs=None):
+        super().on_epoch_end(epoch, logs)
+        if self.cancel_event.is_set():
+            self.model.stop_training = True
+
+
+def train_job(job_id, settings, epochs, bundle_path, events, cancel_event):
+    """
+    Trains a job in a worker process of ProcessJobQueue, the model goes back to the server as a bundle
+    :return: Score of the job, None when it was cancelled
+    """
+    if cancel_event.is_set():
+        return None
+    events.put((job_id, 'running', time.time()))
+    progress = ProcessProgress(job_id, events, cancel_event)
+    lstm_wrapper = LstmWrapper()
+    try:
+        lstm_wrapper.create_setting_model(**settings)
+        progress.samples_per_epoch = lstm_wrapper.train_size()
+        lstm_wrapper.fit(epochs=epochs, callbacks=[progress], verbose=0)
+        if cancel_event.is_set():
+            return None
+        score = lstm_wrapper.evaluate()
+        lstm_wrapper.save_bundle(bundle_path)
+        return {
+            "train_score": {"mse": score['train'], "rmse": math.sqrt(score['train'])},
+            "test_score": {"mse": score['test'], "rmse": math.sqrt(score['test'])}
+        }
+    finally:
+        # The worker process trains the next jobs, the graph and the data of this one are released
+        del lstm_wrapper
+        tf.keras.backend.clear_session()
+
+
+class ProcessTrainingJob(BaseTrainingJob):
+    """
+    Job trained in a worker process by train_job (see ProcessJobQueue): the server only keeps its status, its telemetry
+    and, once trained, the model loaded from the bundle
+    """
+
+    def __init__(self, settings, epochs, cancel_event, bundle_folder):
+        """
+        :param cancel_event: Event shared with the worker process
+        :param bundle_folder: Folder where the worker process saves the trained model
+        """
+        super().__init__(settings, epochs, cancel_event)
+        self.bundle_path = os.path.join(bundle_folder, self.id + '.lstm.npz')
+        self.progress = TrainingTelemetry()
+        # Pool of the worker process, see ProcessJobQueue.finish_job
+        self.executor = None
+
+
+class ProcessJobQueue(JobQueue):
+    """
+    JobQueue whose trainings run in worker processes (spawn): loading the data, training and evaluating don't hold the
+    GIL of the server. The telemetry of the workers comes back in a queue, replayed on the jobs by one thread of the
+    server in the order it was sent. Created after the start of the server (e.g. in the lifespan of an ASGI app), the
+    spawned workers import the main module again
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, max_finished=32, finished_ttl=3600, on_discard=None,
+                 initializer=None, initargs=()):
+        """
+        :param initializer: Function run by each worker process before its first job (e.g. apply_profile)
+        :param initargs: Arguments of initializer
+        """
+        super().__init__(max_workers=max_workers, max_pending=max_pending, max_finished=max_finished,
+                         finished_ttl=finished_ttl, on_discard=on_discard)
+        # The thread pool of JobQueue isn't used
+        self.executor.shutdown(wait=False)
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.context = multiprocessing.get_context('spawn')
+        # Queue and cancel events shared with the workers
+        self.manager = self.context.Manager()
+        self.events = self.manager.Queue()
+        self.bundle_folder = tempfile.mkdtemp(prefix='lstm-jobs-')
+        self.executor = self.create_executor()
+        self.forwarder = threading.Thread(target=self.forward_events, name='training-job-events', daemon=True)
+        self.forwarder.start()
+
+    def create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.context,
+                                   initializer=self.initializer, initargs=self.initargs)
+
+    def create_job(self, settings, epochs):
+        return ProcessTrainingJob(settings, epochs, self.manager.Event(), self.bundle_folder)
+
+    def start_job(self, job):
+        job.executor = self.executor
+        future = self.executor.submit(train_job, job.id, job.settings, job.epochs, job.bundle_path, self.events,
+                                      job.cancel_event)
+        # After the events of the training in the queue, the result is read in order
+        future.add_done_callback(lambda done, job_id=job.id: self.events.put((job_id, 'done')))
+        return future
+
+    def forward_events(self):
+        """
+        Replays the events of the workers on the jobs until a None is received
+        """
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            job = self.jobs.get(event[0])
+            if job is None:
+                continue
+            name = event[1]
+            if name == 'running':
+                job.status = 'running'
+                job.started_at = event[2]
+            elif name == 'done':
+                self.finish_job(job)
+            else:
+                getattr(job.progress, name)(*event[2:])
+                if name == 'add':
+                    job.epoch = event[2]['epoch']
+                    job.loss = event[2]['loss']
+
+    def finish_job(self, job):
+        try:
+            score = job.future.result()
+            if score is None:
+                job.status = 'cancelled'
+                job.progress.finish('cancelled')
+            else:
+                lstm_wrapper = LstmWrapper()
+                lstm_wrapper.load_bundle(job.bundle_path)
+                job.lstm_wrapper = lstm_wrapper
+                job.score = score
+                job.status = 'trained'
+        except CancelledError:
+            # Cancelled while queued, see cancel
+            return
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e) or type(e).__name__
+            job.progress.finish('failed', job.error)
+            traceback.print_exception(e)
+            # Every job of a broken pool fails (e.g. a worker killed out of memory), only the first one starts a new
+            # pool
+            with self.lock:
+                if isinstance(e, BrokenProcessPool) and job.executor is self.executor:
+                    self.executor = self.create_executor()
+        finally:
+            if os.path.exists(job.bundle_path):
+                os.remove(job.bundle_path)
+        job.finished_at = time.time()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.events.put(None)
+        self.forwarder.join()
+        self.manager.shutdown()
+        shutil.rmtree(self.bundle_folder, ignore_errors=True)
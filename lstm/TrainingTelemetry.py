@@ -0,0 +1,159 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from tensorflow.keras.callbacks import Callback  # type: ignore
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the peak RSS is reported as None
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class TrainingTelemetry(Callback):
+    """
+    Keras callback that records loss, wall time, samples/sec and peak RSS of each epoch in a ring buffer.
+    The records can be read as a snapshot or followed as a stream of events (Server-Sent Events)
+    """
+
+    def __init__(self, samples_per_epoch=None, batch_size=32, max_records=1000):
+        """
+        :param samples_per_epoch: Number of training samples. Default: steps of the epoch * batch_size
+        :param batch_size: Used when samples_per_epoch is unknown
+        :param max_records: Size of the ring buffer
+        """
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.batch_size = batch_size
+        self.records = deque(maxlen=max_records)
+        self.sequence = 0
+        self.status = 'idle'
+        self.error = None
+        self.started_at = None
+        self.last_update = None
+        self.epoch_started_at = None
+        self.condition = threading.Condition()
+
+    def on_train_begin(self, logs=None):
+        self.start()
+
+    def start(self):
+        """
+        Clears the records and marks the training as started, can be called before fit so a stream opened before the
+        first epoch waits for it
+        """
+        with self.condition:
+            self.records.clear()
+            self.status = 'training'
+            self.error = None
+            self.started_at = self.last_update = time.time()
+            self.condition.notify_all()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_started_at = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        seconds = time.perf_counter() - self.epoch_started_at
+        samples = self.samples_per_epoch
+        if samples is None and self.params.get('steps'):
+            samples = self.params['steps'] * self.batch_size
+        record = {
+            "epoch": epoch + 1,
+            "epochs": self.params.get('epochs'),
+            "loss": None if logs.get('loss') is None else float(logs['loss']),
+            "val_loss": None if logs.get('val_loss') is None else float(logs['val_loss']),
+            "seconds": seconds,
+            "samples_per_second": samples / seconds if samples and seconds > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "time": time.time()
+        }
+        self.add(record)
+
+    def add(self, record):
+        with self.condition:
+            self.sequence += 1
+            record["sequence"] = self.sequence
+            self.records.append(record)
+            self.last_update = record["time"]
+            self.condition.notify_all()
+
+    def on_train_end(self, logs=None):
+        self.finish('trained')
+
+    def finish(self, status, error=None):
+        """
+        Marks the end of the training, e.g. finish('failed', str(exception))
+        """
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.last_update = time.time()
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {"status": self.status, "error": self.error, "started_at": self.started_at,
+                    "last_update": self.last_update,
+                    "seconds_since_last_update": None if self.last_update is None else time.time() - self.last_update,
+                    "epochs": list(self.records)}
+
+    def stream(self, heartbeat=15, wait_start=False):
+        """
+        Generator of Server-Sent Events: one 'epoch' event by record and an 'end' event when the training finishes.
+        A comment is sent every heartbeat seconds without records, so proxies keep the connection
+        :param wait_start: When the training wasn't started yet, waits for it instead of ending the stream
+        """
+        sequence = 0
+        while True:
+            with self.condition:
+                running = self.status == 'training' or (wait_start and self.status == 'idle')
+                records = [record for record in self.records if record["sequence"] > sequence]
+                if not records and running:
+                    self.condition.wait(timeout=heartbeat)
+                    records = [record for record in self.records if record["sequence"] > sequence]
+                status, error = self.status, self.error
+                running = status == 'training' or (wait_start and status == 'idle')
+            for record in records:
+                sequence = record["sequence"]
+                yield 'event: epoch\ndata: %s\n\n' % json.dumps(record)
+            if not running:
+                yield 'event: end\ndata: %s\n\n' % json.dumps({"status": status, "error": error})
+                return
+            if not records:
+                yield ': heartbeat\n\n'
+
+    async def async_stream(self, heartbeat=15, wait_start=False, interval=0.5):
+        """
+        Same events of stream for an asyncio server: the records are polled every interval seconds with asyncio.sleep,
+        no thread is held while the client is connected
+        """
+        sequence = 0
+        idle = 0
+        while True:
+            with self.condition:
+                records = [record for record in self.records if record["sequence"] > sequence]
+                status, error = self.status, self.error
+            running = status == 'training' or (wait_start and status == 'idle')
+            for record in records:
+                sequence = record["sequence"]
+                yield 'event: epoch\ndata: %s\n\n' % json.dumps(record)
+            if not running:
+                yield 'event: end\ndata: %s\n\n' % json.dumps({"status": status, "error": error})
+                return
+            if records:
+                idle = 0
+            elif idle >= heartbeat:
+                yield ': heartbeat\n\n'
+                idle = 0
+            await asyncio.sleep(interval)
+            idle += interval
@@ -0,0 +1,52 @@
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from PipelineBenchmark import compare, run_pipeline, save_baseline, synthetic_dataset
+from CommandLine import benchmark_command_line_args
+
+if __name__ == '__main__':
+    # Get command line arguments or default values if not arguments
+    args = benchmark_command_line_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for rows, symbols, units, hidden_layers in itertools.product(args.rows, args.symbols, args.units,
+                                                                 args.hidden_layers):
+        dataset_path = synthetic_dataset(args.data_folder, rows, symbols=symbols)
+        config = {"dataset_path": dataset_path, "symbol": 'S00000', "features": ['open', 'high', 'low', 'volume'],
+                  "y_value": 'adj_close', "window": args.window, "units": units, "hidden_layers": hidden_layers,
+                  "epochs": args.epochs, "batch_size": args.batch_size, "n_splits": 4, "use_cache": args.use_cache,
+                  "repeats": args.repeats}
+        # Each configuration in a new process: the memory of one doesn't change the next
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            stages = executor.submit(run_pipeline, config).result()
+        for stage in stages:
+            results.append({"rows": rows, "symbols": symbols or 'auto', "units": units, "hidden_layers": hidden_layers,
+                            **stage})
+        print(pd.DataFrame(results[-len(stages):]).to_string(index=False))
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        table = compare(results, args.baseline, tolerance=args.tolerance)
+    else:
+        table = pd.DataFrame(results)
+    print(table.to_string(index=False))
+
+    if args.output.endswith('.json'):
+        with open(args.output, 'w') as file:
+            json.dump(table.to_dict(orient='records'), file, indent=2)
+    elif args.output:
+        table.to_csv(args.output, index=False)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print('Baseline saved in', args.baseline)
+    elif 'regression' in table and table['regression'].any():
+        print('Regressions over %.2fx the baseline:' % args.tolerance)
+        print(table[table['regression']].to_string(index=False))
+        sys.exit(1)
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from CommandLine import load_test_command_line_args
+
+
+def call(url, method='POST', body=None, timeout=120):
+    """
+    :return: HTTP status code and the JSON of the response
+    """
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or 'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, TimeoutError, ConnectionError):
+        # Refused or timed out, counted as status 0
+        return 0, None
+
+
+def setup(args):
+    """
+    Creates and trains the model of the service, waiting for the training to finish
+    """
+    settings = {"filter_stocks": args.filter_stocks, "n_splits": 4, "hidden_layers": 1, "units": 10,
+                "features": args.features, "y_value": args.y_value, "window": args.window}
+    code, _ = call(args.url + '/model', body=settings)
+    if code != 201:
+        raise RuntimeError('POST /model returned %d' % code)
+    code, _ = call(args.url + '/model/fit', body={"epochs": args.epochs})
+    if code != 201:
+        raise RuntimeError('POST /model/fit returned %d' % code)
+    while True:
+        _, metrics = call(args.url + '/model/metrics', method='GET')
+        if metrics and metrics['model_status'] == 'model_trained':
+            return
+        if metrics and metrics['model_status'] == 'model_training_failed':
+            raise RuntimeError('Training failed: %s' % metrics['error'])
+        time.sleep(0.5)
+
+
+def client(url, body, deadline, results):
+    # Calls the endpoint until the deadline, keeping the latency and the status code of each request
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        code, _ = call(url, body=body)
+        results.append((code, time.perf_counter() - start))
+
+
+def report(results, duration):
+    rows = []
+    for endpoint, calls in results.items():
+        latencies = np.array([latency for _, latency in calls]) * 1000
+        codes = defaultdict(int)
+        for code, _ in calls:
+            codes[code] += 1
+        rows.append({"endpoint": endpoint, "requests": len(calls), "requests_per_second": len(calls) / duration,
+                     "p50_ms": np.percentile(latencies, 50) if len(calls) else None,
+                     "p95_ms": np.percentile(latencies, 95) if len(calls) else None,
+                     "p99_ms": np.percentile(latencies, 99) if len(calls) else None,
+                     "max_ms": latencies.max() if len(calls) else None,
+                     "status_codes": dict(sorted(codes.items()))})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    # Get command line arguments or default values if not arguments
+    args = load_test_command_line_args()
+    if args.setup:
+        setup(args)
+
+    # Random windows: the test measures the service, not the quality of the predictions
+    windows = np.random.default_rng(0).uniform(1, 100, size=(1, args.window, len(args.features))).tolist()
+    results = {'/model/predict': [], '/model/evaluate': []}
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=client, args=(args.url + '/model/predict', {"windows": windows}, deadline,
+                                                     results['/model/predict']))
+               for _ in range(args.clients)]
+    # The CPU-heavy requests compete with the predictions
+    threads += [threading.Thread(target=client, args=(args.url + '/model/evaluate', {"verbose": 0}, deadline,
+                                                      results['/model/evaluate']))
+                for _ in range(args.heavy_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    table = report(results, args.duration)
+    print(args.url)
+    print(table.to_string(index=False))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"url": args.url, "clients": args.clients, "heavy_clients": args.heavy_clients,
+                       "duration": args.duration, "results": table.to_dict(orient='records')}, file, indent=2,
+                      default=float)
@@ -0,0 +1,64 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from CommandLine import profile_benchmark_command_line_args
+
+
+def run_profile(profile_name, processes, settings, epochs, batch_size):
+    """
+    Trains the model inside a new process with the profile applied before the first TensorFlow operation
+    :return: Median samples/sec of the epochs after the first one and peak RSS of the process
+    """
+    from ExecutionProfile import apply_profile, get_precision
+    from LstmWrapper import LstmWrapper
+    from TrainingTelemetry import TrainingTelemetry
+
+    profile = None if profile_name == 'default' else apply_profile(profile_name, processes=processes)
+    lstm_wrapper = LstmWrapper()
+    lstm_wrapper.create_setting_model(**settings)
+    telemetry = TrainingTelemetry(samples_per_epoch=lstm_wrapper.train_size())
+    lstm_wrapper.fit(epochs=epochs, batch_size=batch_size, callbacks=[telemetry], verbose=0)
+    # The first epoch traces the graph
+    rates = [record['samples_per_second'] for record in telemetry.records][1:] or \
+        [record['samples_per_second'] for record in telemetry.records]
+    return {"precision": get_precision(),
+            "intra_op_threads": None if profile is None else profile.intra_op_threads,
+            "inter_op_threads": None if profile is None else profile.inter_op_threads,
+            "samples_per_second": float(np.median(rates)),
+            "peak_rss_mb": telemetry.records[-1]['peak_rss_mb']}
+
+
+if __name__ == '__main__':
+    # Get command line arguments or default values if not arguments
+    args = profile_benchmark_command_line_args()
+    settings = dict(dataset_path=args.dataset_path, filter_stocks=args.filter_stocks, features=args.features,
+                    y_value=args.y_value, n_splits=4, hidden_layers=args.hidden_layers, units=args.units,
+                    window=args.window)
+
+    rows = []
+    context = multiprocessing.get_context('spawn')
+    for profile_name in args.profiles:
+        # A new pool for each profile: the thread pools of TensorFlow are set once by process
+        with ProcessPoolExecutor(max_workers=args.processes, mp_context=context) as executor:
+            futures = [executor.submit(run_profile, profile_name, args.processes, settings, args.epochs,
+                                       args.batch_size) for _ in range(args.processes)]
+            results = [future.result() for future in futures]
+        rows.append({"profile": profile_name, "processes": args.processes, "precision": results[0]['precision'],
+                     "intra_op_threads": results[0]['intra_op_threads'],
+                     "inter_op_threads": results[0]['inter_op_threads'],
+                     "samples_per_second": float(np.mean([result['samples_per_second'] for result in results])),
+                     "total_samples_per_second": float(np.sum([result['samples_per_second'] for result in results])),
+                     "peak_rss_mb": float(np.max([result['peak_rss_mb'] or 0 for result in results]))})
+        print(rows[-1])
+
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False))
+    if args.output.endswith('.json'):
+        with open(args.output, 'w') as file:
+            json.dump(rows, file, indent=2)
+    elif args.output:
+        table.to_csv(args.output, index=False)
@@ -0,0 +1,426 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import ModelWorker
+from BatchPredictor import BatchPredictor
+from ExecutionProfile import apply_profile
+from ModelRegistry import ModelRegistry, check_name
+from TrainingJobs import JobQueueFull, ProcessJobQueue, model_settings
+from TrainingTelemetry import TrainingTelemetry
+
+# Same endpoints of lstm-service.py served by an ASGI server. The model lives in a worker process (see ModelWorker):
+# creating, training and evaluating it don't block the requests served by this process. The jobs are trained in worker
+# processes too (see ProcessJobQueue)
+logger = logging.getLogger('lstm-service-asgi')
+
+# Seconds a request waits for its result before the 504 response, the work isn't cancelled
+request_timeout = float(os.environ.get('LSTM_REQUEST_TIMEOUT', 60))
+# Tasks (create, fit, evaluate, register) accepted for the model process before the 429 responses
+max_pending_tasks = int(os.environ.get('LSTM_MAX_PENDING_TASKS', 4))
+# Predictions waiting for a batch before the 429 responses
+max_pending_predictions = int(os.environ.get('LSTM_MAX_PENDING_PREDICTIONS', 1024))
+
+# Execution profile of TensorFlow (throughput, latency or shared-host) of this process and of the model process
+profile_name = os.environ.get('LSTM_PROFILE')
+profile_processes = int(os.environ.get('LSTM_PROFILE_PROCESSES', 2))
+
+status = ''
+pending_tasks = 0
+pending_predictions = 0
+# Created by lifespan
+worker = None
+events = None
+job_queue = None
+bundle_path = None
+telemetry = TrainingTelemetry()
+predictor = None
+job_predictors = {}
+# job_predictors is changed by the event loop (post_predict) and by the threads that prune the job queue
+predictors_lock = threading.Lock()
+background_tasks = set()
+
+def close_job_predictor(job):
+    # Called by the job queue when a finished job is discarded, closed by a thread to not block the event loop
+    with predictors_lock:
+        job_predictor = job_predictors.pop(job.id, None)
+    if job_predictor is not None:
+        threading.Thread(target=job_predictor.close, daemon=True).start()
+
+
+registry = ModelRegistry()
+
+
+class WorkerBusy(Exception):
+    pass
+
+
+def start_worker():
+    global worker
+    # One process: the model is a single object and its tasks run in the order they were accepted
+    context = multiprocessing.get_context('spawn')
+    worker = ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=ModelWorker.init_worker,
+                                 initargs=(events, profile_name, profile_processes))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global events, bundle_path, job_queue
+    if profile_name:
+        apply_profile(profile_name, processes=profile_processes)
+    # The trained model goes from the model process to this one as a bundle
+    bundle_path = os.path.join(tempfile.mkdtemp(prefix='lstm-service-'), 'model.lstm.npz')
+    events = multiprocessing.get_context('spawn').Queue()
+    forwarder = threading.Thread(target=ModelWorker.forward_events, args=(events, telemetry), daemon=True)
+    forwarder.start()
+    start_worker()
+    job_queue = ProcessJobQueue(max_workers=int(os.environ.get('LSTM_MAX_TRAININGS', 2)),
+                                max_pending=int(os.environ.get('LSTM_MAX_PENDING_JOBS', 16)),
+                                max_finished=int(os.environ.get('LSTM_MAX_FINISHED_JOBS', 32)),
+                                finished_ttl=float(os.environ.get('LSTM_FINISHED_JOBS_TTL', 3600)),
+                                on_discard=close_job_predictor,
+                                initializer=apply_profile if profile_name else None,
+                                initargs=(profile_name, profile_processes) if profile_name else ())
+    yield
+    job_queue.shutdown()
+    worker.shutdown(wait=False, cancel_futures=True)
+    events.put(None)
+    if predictor is not None:
+        predictor.close()
+    with predictors_lock:
+        closing = list(job_predictors.values())
+        job_predictors.clear()
+    for job_predictor in closing:
+        job_predictor.close()
+
+
+def task_done(future, executor):
+    global pending_tasks, status
+    pending_tasks -= 1
+    # Every task of a broken pool fails, only the first one starts a new process
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool) and executor is worker:
+        # The model process died (e.g. out of memory): a new one is started without model
+        logger.error('Model process stopped, starting a new one')
+        status = ''
+        telemetry.finish('failed', 'Model process stopped')
+        start_worker()
+
+
+def run_in_worker(function, *args):
+    """
+    Submits the function to the model process
+    :return: asyncio future
+    :raise WorkerBusy: When max_pending_tasks tasks are already waiting
+    """
+    global pending_tasks
+    if pending_tasks >= max_pending_tasks:
+        raise WorkerBusy('There are already %d tasks waiting for the model' % pending_tasks)
+    pending_tasks += 1
+    future = asyncio.get_running_loop().run_in_executor(worker, function, *args)
+    future.add_done_callback(lambda done, executor=worker: task_done(done, executor))
+    return future
+
+
+async def wait(future):
+    # Shielded: a request that times out doesn't cancel the work, the state of the model stays consistent
+    return await asyncio.wait_for(asyncio.shield(future), timeout=request_timeout)
+
+
+def busy_response(e):
+    return JSONResponse({"message": str(e)}, status_code=429, headers={"Retry-After": "1"})
+
+
+def timeout_response():
+    return JSONResponse({"message": "Request timeout, the task is still running"}, status_code=504)
+
+
+async def create_model(request):
+    global status
+    data = await request.json()
+    if status in ('model_creating', 'model_training_in_progress'):
+        return JSONResponse({"message": "Model still being created or trained"}, status_code=422)
+    try:
+        settings = model_settings(data)
+        future = run_in_worker(ModelWorker.create_model, settings)
+    except KeyError as e:
+        return JSONResponse({"message": "Missing field %s" % e}, status_code=422)
+    except WorkerBusy as e:
+        return busy_response(e)
+    previous_status = status
+    status = 'model_creating'
+
+    def created(future):
+        global status
+        if future.cancelled() or future.exception() is not None:
+            status = '' if isinstance(future.exception(), BrokenProcessPool) else previous_status
+        else:
+            status = 'model_created'
+    future.add_done_callback(created)
+
+    try:
+        await wait(future)
+    except asyncio.TimeoutError:
+        return timeout_response()
+    except Exception as e:
+        logger.exception('Creation of the model failed')
+        return JSONResponse({"message": "Model wasn't created: %s" % e}, status_code=500)
+    return JSONResponse({"message": "Model LSTM created with success"}, status_code=201)
+
+
+async def train(future):
+    global status, predictor
+    try:
+        path = await future
+        # Tracing the prediction graph before the first request
+        new_predictor = await run_in_threadpool(BatchPredictor.from_bundle, path)
+        previous_predictor, predictor = predictor, new_predictor
+        if previous_predictor is not None:
+            await run_in_threadpool(previous_predictor.close)
+        status = 'model_trained'
+    except Exception as e:
+        # The model can be trained again, the error is shown by GET /model/metrics. A new model process has no model
+        status = '' if isinstance(e, BrokenProcessPool) else 'model_training_failed'
+        telemetry.finish('failed', str(e))
+        logger.exception('Training of the model failed')
+
+
+async def post_fit_model(request):
+    global status
+    if status in ('model_created', 'model_trained', 'model_training_failed'):
+        data = await request.json()
+        try:
+            future = run_in_worker(ModelWorker.fit_model, data["epochs"], bundle_path)
+        except KeyError as e:
+            return JSONResponse({"message": "Missing field %s" % e}, status_code=422)
+        except WorkerBusy as e:
+            return busy_response(e)
+        status = 'model_training_in_progress'
+        # The stream opened after this request waits for the first epoch
+        telemetry.start()
+        task = asyncio.create_task(train(future))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        return JSONResponse({"message": 'Model LSTM training in progress'}, status_code=201)
+    if status == 'model_training_in_progress':
+        return JSONResponse({"message": "Model still training in progress"}, status_code=422)
+    return JSONResponse({"message": "Model wasn't created"}, status_code=422)
+
+
+def get_model_metrics(request):
+    return JSONResponse({"model_status": status, **telemetry.snapshot()})
+
+
+def get_model_metrics_stream(request):
+    # Server-Sent Events: one event for each epoch, until the training finishes
+    return StreamingResponse(telemetry.async_stream(), media_type='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+
+async def post_evaluate_model(request):
+    if status != 'model_trained':
+        return JSONResponse({"message": "Model wasn't trained"}, status_code=422)
+    data = await request.json()
+    try:
+        # Verbose 0 = none, 1 more detail, 2 a lot of details and go on til 4
+        score = await wait(run_in_worker(ModelWorker.evaluate_model, data.get("verbose", 0)))
+    except WorkerBusy as e:
+        return busy_response(e)
+    except asyncio.TimeoutError:
+        return timeout_response()
+    return JSONResponse(score, status_code=201)
+
+
+async def post_predict(request):
+    global pending_predictions
+    data = await request.json()
+    job_id = data.get("job_id")
+    if job_id is None:
+        selected = predictor
+        if status not in ('model_trained', 'model_loaded') or selected is None:
+            return JSONResponse({"message": "Model wasn't trained"}, status_code=422)
+    else:
+        job = job_queue.get(job_id)
+        if job is None:
+            return JSONResponse({"message": "Job not found"}, status_code=404)
+        if job.status != 'trained':
+            return JSONResponse({"message": "Job wasn't trained"}, status_code=422)
+        with predictors_lock:
+            selected = job_predictors.get(job_id)
+        if selected is None:
+            # Created without the lock, the predictor of a concurrent request or of a job discarded meanwhile is closed
+            new_predictor = await run_in_threadpool(job.lstm_wrapper.create_predictor)
+            with predictors_lock:
+                # A discarded job left job_queue.jobs before close_job_predictor was called
+                if job_id in job_queue.jobs:
+                    selected = job_predictors.setdefault(job_id, new_predictor)
+            if selected is not new_predictor:
+                threading.Thread(target=new_predictor.close, daemon=True).start()
+            if selected is None:
+                return JSONResponse({"message": "Job not found"}, status_code=404)
+
+    if pending_predictions >= max_pending_predictions:
+        return busy_response('There are already %d predictions waiting' % pending_predictions)
+    # Windows (samples, window, features) with the values not scaled, in the order of the features of the model
+    try:
+        future = selected.submit(data["windows"])
+    except (KeyError, ValueError) as e:
+        return JSONResponse({"message": "Invalid windows: %s" % e}, status_code=422)
+    pending_predictions += 1
+    try:
+        predictions = await wait(asyncio.wrap_future(future))
+    except asyncio.TimeoutError:
+        return timeout_response()
+    finally:
+        pending_predictions -= 1
+    return JSONResponse({"predictions": predictions.tolist()})
+
+
+def get_predict_stats(request):
+    if predictor is None:
+        return JSONResponse({"message": "Model wasn't trained"}, status_code=422)
+    return JSONResponse({**predictor.stats(), "pending_predictions": pending_predictions,
+                         "pending_tasks": pending_tasks})
+
+
+def get_models(request):
+    return JSONResponse(registry.entries())
+
+
+async def post_register_model(request):
+    # Registers the trained model, or the model of a trained job, with a name
+    data = await request.json()
+    name = data.get("name")
+    if not name:
+        return JSONResponse({"message": "Missing field name"}, status_code=422)
+    try:
+        check_name(name)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=422)
+    job_id = data.get("job_id")
+    try:
+        if job_id is None:
+            if status != 'model_trained':
+                return JSONResponse({"message": "Model wasn't trained"}, status_code=422)
+            entry = await wait(run_in_worker(ModelWorker.register_model, name, registry.fold_path))
+        else:
+            job = job_queue.get(job_id)
+            if job is None:
+                return JSONResponse({"message": "Job not found"}, status_code=404)
+            if job.status != 'trained':
+                return JSONResponse({"message": "Job wasn't trained"}, status_code=422)
+            metrics = {"train_mse": job.score['train_score']['mse'], "test_mse": job.score['test_score']['mse']}
+            entry = await run_in_threadpool(registry.register, job.lstm_wrapper, name, metrics=metrics)
+    except WorkerBusy as e:
+        return busy_response(e)
+    except asyncio.TimeoutError:
+        return timeout_response()
+    return JSONResponse(entry, status_code=201)
+
+
+async def post_load_model(request):
+    # Replaces the model of the service by a registered one, ready for /model/predict
+    global predictor, status
+    name = request.path_params['name']
+    if status in ('model_creating', 'model_training_in_progress'):
+        return JSONResponse({"message": "Model still being created or trained"}, status_code=422)
+    try:
+        loaded_wrapper = await run_in_threadpool(registry.load_wrapper, name)
+    except ValueError as e:
+        return JSONResponse({"message": str(e)}, status_code=422)
+    except KeyError as e:
+        return JSONResponse({"message": str(e)}, status_code=404)
+    if loaded_wrapper.scaler is None:
+        return JSONResponse({"message": "Model '%s' has no scaler saved" % name}, status_code=422)
+    new_predictor = await run_in_threadpool(loaded_wrapper.create_predictor)
+    previous_predictor, predictor = predictor, new_predictor
+    if previous_predictor is not None:
+        await run_in_threadpool(previous_predictor.close)
+    status = 'model_loaded'
+    return JSONResponse({"message": "Model %s loaded" % name}, status_code=201)
+
+
+async def post_job(request):
+    # The same body of POST /model plus the epochs
+    data = await request.json()
+    try:
+        settings = model_settings(data)
+        epochs = data["epochs"]
+    except KeyError as e:
+        return JSONResponse({"message": "Missing field %s" % e}, status_code=422)
+    try:
+        # Starting the worker processes and creating the cancel event of the job don't block the event loop
+        job = await run_in_threadpool(job_queue.submit, settings, epochs)
+    except JobQueueFull as e:
+        return busy_response(e)
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+def get_jobs(request):
+    return JSONResponse([job.to_dict() for job in job_queue.list()])
+
+
+def get_job(request):
+    job = job_queue.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+def get_job_metrics(request):
+    job = job_queue.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    return JSONResponse({"job_status": job.status, **job.progress.snapshot()})
+
+
+def get_job_metrics_stream(request):
+    job = job_queue.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    return StreamingResponse(job.progress.async_stream(wait_start=True), media_type='text/event-stream',
+                             headers={"Cache-Control": "no-cache"})
+
+
+async def delete_job(request):
+    job_id = request.path_params['job_id']
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse({"message": "Job not found"}, status_code=404)
+    if job.status in ('trained', 'failed', 'cancelled'):
+        return JSONResponse({"message": "Job already finished", "status": job.status}, status_code=409)
+    await run_in_threadpool(job_queue.cancel, job_id)
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/model', create_model, methods=['POST']),
+    Route('/model/fit', post_fit_model, methods=['POST']),
+    Route('/model/metrics', get_model_metrics, methods=['GET']),
+    Route('/model/metrics/stream', get_model_metrics_stream, methods=['GET']),
+    Route('/model/evaluate', post_evaluate_model, methods=['POST']),
+    Route('/model/predict', post_predict, methods=['POST']),
+    Route('/model/predict/stats', get_predict_stats, methods=['GET']),
+    Route('/models', get_models, methods=['GET']),
+    Route('/models', post_register_model, methods=['POST']),
+    Route('/models/{name}/load', post_load_model, methods=['POST']),
+    Route('/jobs', post_job, methods=['POST']),
+    Route('/jobs', get_jobs, methods=['GET']),
+    Route('/jobs/{job_id}', get_job, methods=['GET']),
+    Route('/jobs/{job_id}', delete_job, methods=['DELETE']),
+    Route('/jobs/{job_id}/metrics', get_job_metrics, methods=['GET']),
+    Route('/jobs/{job_id}/metrics/stream', get_job_metrics_stream, methods=['GET']),
+])
+
+if __name__ == '__main__':
+    uvicorn.run(app, host=os.environ.get('LSTM_HOST', '127.0.0.1'), port=int(os.environ.get('LSTM_PORT', 8000)))
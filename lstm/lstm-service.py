@@ -1,45 +1,69 @@
 import math
+import os
 import threading
-from flask import Flask, jsonify, request
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import Flask, Response, jsonify, request
 from LstmWrapper import LstmWrapper
+from TrainingJobs import JobQueue, JobQueueFull, model_settings
+from TrainingTelemetry import TrainingTelemetry
+from ModelRegistry import ModelRegistry, check_name
+from ExecutionProfile import apply_profile
 
 status = ''
 
+# Execution profile of TensorFlow (throughput, latency or shared-host), set before the first operation
+if os.environ.get('LSTM_PROFILE'):
+    apply_profile(os.environ['LSTM_PROFILE'], processes=int(os.environ.get('LSTM_PROFILE_PROCESSES', 1)))
+
 # Creating the wrapper
 lstm_wrapper = LstmWrapper()
+# Loss, time, samples/sec and memory of each epoch of the training
+telemetry = TrainingTelemetry()
+# Predictor of the trained model, created when the training finishes
+predictor = None
+# Predictors of the trained jobs
+job_predictors = {}
+predictors_lock = threading.Lock()
+
+
+def close_job_predictor(job):
+    # Called by the job queue when a finished job is discarded
+    with predictors_lock:
+        job_predictor = job_predictors.pop(job.id, None)
+    if job_predictor is not None:
+        job_predictor.close()
+
+# Training jobs, each one with its own wrapper. LSTM_MAX_TRAININGS limits the trainings running at the same time
+job_queue = JobQueue(max_workers=int(os.environ.get('LSTM_MAX_TRAININGS', 2)),
+                     max_pending=int(os.environ.get('LSTM_MAX_PENDING_JOBS', 16)),
+                     max_finished=int(os.environ.get('LSTM_MAX_FINISHED_JOBS', 32)),
+                     finished_ttl=float(os.environ.get('LSTM_FINISHED_JOBS_TTL', 3600)),
+                     on_discard=close_job_predictor)
+
+# Saved models, the loaded ones stay in memory
+registry = ModelRegistry()
 
 app = Flask(__name__)
 
 @app.post('/model')
 def create_model():
-    global status
+    global status, predictor
     # Obtém os dados JSON da requisição
     data = request.get_json()
     # Processa os dados (exemplo: imprime na tela)
     print(data)
 
-    #  Setting the variables
-    # Dataset
-    dataset_path = 'data/big_tech_stock_prices.csv'
-    # Filtering the dataset with multiple companies stocks
-    filter_stocks = data["filter_stocks"]
-    # Number os splits to generate the train and test use by TimeSeriesSplit
-    n_splits = data["n_splits"]
-    # Number of hidden layers
-    hidden_layers = data["hidden_layers"]
-    # Number of neurons for each layer
-    units = data["units"]
-    # Selecting the Features (x)
-    features = data["features"]
-    # Select predict values (y)
-    y_value = data["y_value"]
-
     '''
     Starting code
     '''
 
+    # The predictor of the previous model is discarded
+    if predictor is not None:
+        predictor.close()
+        predictor = None
+
     # Creating and setting the LSTM model
-    lstm_wrapper.create_setting_model(dataset_path=dataset_path, filter_stocks=filter_stocks, features=features, y_value=y_value, n_splits=n_splits, hidden_layers=hidden_layers, units=units)
+    lstm_wrapper.create_setting_model(**model_settings(data))
     status = 'model_created'
     # Retorna uma resposta JSON confirmando o recebimento
     return jsonify({"message": "Model LSTM created with success"}), 201
@@ -48,8 +72,10 @@ def create_model():
 def post_fit_model():
     global status
     code = 201
-    if status == 'model_created' or status == 'model_trained':
+    if status in ('model_created', 'model_trained', 'model_training_failed'):
         status = 'model_training_in_progress'
+        # The stream opened after this request waits for the first epoch
+        telemetry.start()
         # Obtém os dados JSON da requisição
         data = request.get_json()
 
@@ -67,21 +93,33 @@ def post_fit_model():
     return jsonify({"message": message}), code
 
 def fit_model(data):
-    global status
+    global status, predictor
     # Number of epochs
     epochs = data["epochs"]
     # Training the model
     try:
-        lstm_wrapper.fit(epochs=epochs)
+        telemetry.samples_per_epoch = lstm_wrapper.train_size()
+        lstm_wrapper.fit(epochs=epochs, callbacks=[telemetry])
+        # Tracing the prediction graph before the first request, the predictor of the previous training is closed
+        new_predictor = lstm_wrapper.create_predictor()
+        previous_predictor, predictor = predictor, new_predictor
+        if previous_predictor is not None:
+            previous_predictor.close()
         status = 'model_trained'
     except Exception as e:
-        status = 'None'
-        print(e)
-
-
-
+        # The model can be trained again, the error is shown by GET /model/metrics
+        status = 'model_training_failed'
+        telemetry.finish('failed', str(e))
+        app.logger.exception('Training of the model failed')
 
+@app.get('/model/metrics')
+def get_model_metrics():
+    return jsonify({"model_status": status, **telemetry.snapshot()}), 200
 
+@app.get('/model/metrics/stream')
+def get_model_metrics_stream():
+    # Server-Sent Events: one event for each epoch, until the training finishes
+    return Response(telemetry.stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
 @app.post('/model/evaluate')
 def post_evaluate_model():
     global status
@@ -108,6 +146,143 @@ def post_evaluate_model():
     # Retorna uma resposta JSON confirmando o recebimento
     return jsonify(message), code
 
+@app.post('/model/predict')
+def post_predict():
+    # Obtém os dados JSON da requisição
+    data = request.get_json()
+    job_id = data.get("job_id")
+    if job_id is None:
+        selected = predictor
+        if status not in ('model_trained', 'model_loaded') or selected is None:
+            return jsonify({"message": "Model wasn't trained"}), 422
+    else:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"message": "Job not found"}), 404
+        if job.status != 'trained':
+            return jsonify({"message": "Job wasn't trained"}), 422
+        with predictors_lock:
+            if job_id not in job_predictors:
+                job_predictors[job_id] = job.lstm_wrapper.create_predictor()
+            selected = job_predictors[job_id]
+
+    # Windows (samples, window, features) with the values not scaled, in the order of the features of the model
+    try:
+        predictions = selected.predict(data["windows"], timeout=30)
+    except (KeyError, ValueError) as e:
+        return jsonify({"message": "Invalid windows: %s" % e}), 422
+    except FutureTimeoutError:
+        return jsonify({"message": "Request timeout, the prediction is still queued"}), 504
+    return jsonify({"predictions": predictions.tolist()}), 200
+
+@app.get('/model/predict/stats')
+def get_predict_stats():
+    if predictor is None:
+        return jsonify({"message": "Model wasn't trained"}), 422
+    return jsonify(predictor.stats()), 200
+
+@app.get('/models')
+def get_models():
+    return jsonify(registry.entries()), 200
+
+@app.post('/models')
+def post_register_model():
+    # Registers the trained model, or the model of a trained job, with a name
+    data = request.get_json()
+    name = data.get("name")
+    if not name:
+        return jsonify({"message": "Missing field name"}), 422
+    try:
+        check_name(name)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 422
+    job_id = data.get("job_id")
+    if job_id is None:
+        if status != 'model_trained':
+            return jsonify({"message": "Model wasn't trained"}), 422
+        score = lstm_wrapper.evaluate()
+        metrics = {"train_mse": score['train'], "test_mse": score['test']}
+        entry = registry.register(lstm_wrapper, name, metrics=metrics)
+    else:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"message": "Job not found"}), 404
+        if job.status != 'trained':
+            return jsonify({"message": "Job wasn't trained"}), 422
+        metrics = {"train_mse": job.score['train_score']['mse'], "test_mse": job.score['test_score']['mse']}
+        entry = registry.register(job.lstm_wrapper, name, metrics=metrics)
+    return jsonify(entry), 201
+
+@app.post('/models/<name>/load')
+def post_load_model(name):
+    # Replaces the model of the service by a registered one, ready for /model/predict
+    global lstm_wrapper, predictor, status
+    try:
+        loaded_wrapper = registry.load_wrapper(name)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 422
+    except KeyError as e:
+        return jsonify({"message": str(e)}), 404
+    if loaded_wrapper.scaler is None:
+        return jsonify({"message": "Model '%s' has no scaler saved" % name}), 422
+    if predictor is not None:
+        predictor.close()
+    lstm_wrapper = loaded_wrapper
+    predictor = lstm_wrapper.create_predictor()
+    status = 'model_loaded'
+    return jsonify({"message": "Model %s loaded" % name}), 201
+
+@app.post('/jobs')
+def post_job():
+    # Obtém os dados JSON da requisição: the same body of POST /model plus the epochs
+    data = request.get_json()
+    try:
+        settings = model_settings(data)
+        epochs = data["epochs"]
+    except KeyError as e:
+        return jsonify({"message": "Missing field %s" % e}), 422
+
+    try:
+        job = job_queue.submit(settings, epochs)
+    except JobQueueFull as e:
+        return jsonify({"message": str(e)}), 429
+    return jsonify(job.to_dict()), 202
+
+@app.get('/jobs')
+def get_jobs():
+    return jsonify([job.to_dict() for job in job_queue.list()]), 200
+
+@app.get('/jobs/<job_id>')
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.get('/jobs/<job_id>/metrics')
+def get_job_metrics(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify({"job_status": job.status, **job.progress.snapshot()}), 200
+
+@app.get('/jobs/<job_id>/metrics/stream')
+def get_job_metrics_stream(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return Response(job.progress.stream(wait_start=True), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+@app.delete('/jobs/<job_id>')
+def delete_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    if job.status in ('trained', 'failed', 'cancelled'):
+        return jsonify({"message": "Job already finished", "status": job.status}), 409
+    job_queue.cancel(job_id)
+    return jsonify(job.to_dict()), 202
+
 if __name__ == '__main__':
     app.run(debug=True)
 
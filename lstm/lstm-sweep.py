@@ -0,0 +1,23 @@
+from LstmWrapper import LstmWrapper
+from HyperparameterSweep import HyperparameterSweep
+from CommandLine import sweep_command_line_args
+
+if __name__ == '__main__':
+    # Get command line arguments or default values if not arguments
+    args = sweep_command_line_args()
+
+    # Loading and scaling the dataset only once for every trial
+    lstm_wrapper = LstmWrapper()
+    lstm_wrapper.load_csv(args.dataset_path, filters={args.filter_stocks['filed_name']: args.filter_stocks['field_text']},
+                          date_range=args.date_range,
+                          columns=list(dict.fromkeys([args.filter_stocks['filed_name']] + args.features + [args.y_value])))
+    lstm_wrapper.set_features(args.features)
+    lstm_wrapper.generate_target_data_frame(lstm_wrapper.data_frame, args.y_value)
+    lstm_wrapper.generate_min_max_scaler(lstm_wrapper.data_frame)
+
+    # Running the trials in parallel
+    sweep = HyperparameterSweep(lstm_wrapper, args.space, n_trials=args.trials)
+    leaderboard = sweep.run(n_splits=args.n_splits, epochs=args.epochs, patience=args.patience, workers=args.workers,
+                            threads_per_worker=args.threads)
+    sweep.save_leaderboard(args.leaderboard)
+    print(leaderboard.to_string())
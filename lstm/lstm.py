@@ -1,23 +1,55 @@
 import math
 
 from LstmWrapper import LstmWrapper
+from MultiSeriesLstmWrapper import MultiSeriesLstmWrapper
+from ModelRegistry import ModelRegistry
+from ExecutionProfile import apply_profile
 from CommandLine import lstm_command_line_args
 
-# Get command line arguments or default values if not arguments
-args = lstm_command_line_args()
+if __name__ == '__main__':
+    # Get command line arguments or default values if not arguments
+    args = lstm_command_line_args()
+    # Thread pools and precision, set before the first TensorFlow operation
+    if args.profile:
+        apply_profile(args.profile, processes=args.profile_processes)
+    registry = ModelRegistry()
 
-# Creating the wrapper
-lstm_wrapper = LstmWrapper()
+    if args.load_name:
+        # A registered model is evaluated with its own settings and scaler, only the data is loaded and windowed
+        # (the models indexed by scan have no settings, the command line ones are used)
+        lstm_wrapper = registry.load_wrapper(args.load_name)
+        lstm_wrapper.set_features(lstm_wrapper.features or args.features)
+        lstm_wrapper.y_value = lstm_wrapper.y_value or args.y_value
+        lstm_wrapper.load_data(args.dataset_path, filter_stocks=lstm_wrapper.filter_stocks or args.filter_stocks,
+                               n_splits=args.n_splits, date_range=args.date_range)
+    else:
+        # Creating the wrapper, the multi-series one trains every stock in one run
+        lstm_wrapper = MultiSeriesLstmWrapper(mode=args.multi_series) if args.multi_series else LstmWrapper()
+        # Creating and setting the LSTM model
+        lstm_wrapper.create_setting_model(dataset_path=args.dataset_path, filter_stocks=args.filter_stocks, features=args.features, y_value=args.y_value, n_splits=args.n_splits, hidden_layers=args.hidden_layers, units=args.units, window=args.window, horizon=args.horizon, date_range=args.date_range)
 
-# Creating and setting the LSTM model
-lstm_wrapper.create_setting_model(dataset_path=args.dataset_path, filter_stocks=args.filter_stocks, features=args.features, y_value=args.y_value, n_splits=args.n_splits, hidden_layers=args.hidden_layers, units=args.units)
+    # Training the model, a registered model is only evaluated
+    multi_series = args.multi_series and not args.load_name
+    if multi_series:
+        lstm_wrapper.fit(epochs=args.epochs)
+    elif not args.load_name:
+        lstm_wrapper.fit(epochs=args.epochs, use_dataset=args.use_dataset, shuffle_buffer=args.shuffle_buffer)
 
-# Training the model
-lstm_wrapper.fit(epochs=args.epochs)
+    # Evaluating the model
+    score = lstm_wrapper.evaluate(verbose=args.verbose)
+    if multi_series:
+        # One score for each stock
+        for symbol, symbol_score in score.items():
+            print('%-6s Train Score: %.2f MSE (%.2f RMSE) Test Score: %.2f MSE (%.2f RMSE)' % (
+                symbol, symbol_score['train'], math.sqrt(symbol_score['train']), symbol_score['test'],
+                math.sqrt(symbol_score['test'])))
+    else:
+        trainScore = score['train']
+        testScore = score['test']
+        print('Train Score: %.2f MSE (%.2f RMSE)' % (trainScore, math.sqrt(trainScore)))
+        print('Test Score: %.2f MSE (%.2f RMSE)' % (testScore, math.sqrt(testScore)))
 
-# Evaluating the model
-score = lstm_wrapper.evaluate(verbose=args.verbose)
-trainScore = score['train']
-testScore = score['test']
-print('Train Score: %.2f MSE (%.2f RMSE)' % (trainScore, math.sqrt(trainScore)))
-print('Test Score: %.2f MSE (%.2f RMSE)' % (testScore, math.sqrt(testScore)))
\ No newline at end of file
+        # Saving the model with its settings and scores
+        if args.save_name:
+            registry.register(lstm_wrapper, args.save_name, metrics={'train_mse': trainScore, 'test_mse': testScore})
+            print('Model registered as', args.save_name)
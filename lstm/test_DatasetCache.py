@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from DatasetCache import DatasetCache
+
+pytestmark = pytest.mark.skipif(not DatasetCache.available(), reason='pyarrow is not installed')
+
+
+def write_csv(folder, days=30):
+    dates = pd.date_range('2020-01-01', periods=days).strftime('%Y-%m-%d')
+    data_frame = pd.concat([pd.DataFrame({'stock_symbol': symbol, 'date': dates, 'close': range(days)})
+                            for symbol in ('AAPL', 'MSFT')], ignore_index=True)
+    path = folder / 'prices.csv'
+    data_frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_append_keeps_dates_increasing(tmp_path):
+    cache = DatasetCache(write_csv(tmp_path))
+    for day in ('2020-01-31', '2020-02-01'):
+        cache.append(pd.DataFrame({'stock_symbol': ['AAPL', 'MSFT'], 'date': [day, day], 'close': [100, 200]}))
+
+    data_frame = cache.read()
+    assert len(data_frame) == 64
+    for _, group in data_frame.groupby('stock_symbol'):
+        dates = pd.to_datetime(group['date'])
+        assert dates.is_monotonic_increasing and dates.is_unique
+        assert group['date'].iloc[-1] == '2020-02-01'
+
+
+def test_read_filters_after_append(tmp_path):
+    cache = DatasetCache(write_csv(tmp_path))
+    cache.append(pd.DataFrame({'stock_symbol': ['AAPL'], 'date': ['2020-01-31'], 'close': [100]}))
+
+    data_frame = cache.read(filters={'stock_symbol': 'AAPL'}, date_range=('2020-01-29', None))
+    assert list(data_frame['date']) == ['2020-01-29', '2020-01-30', '2020-01-31']
+    assert list(data_frame.columns) == ['stock_symbol', 'date', 'close']